@@ -0,0 +1,109 @@
+"""
+Benchmarks comparing the serialization backends on all bundled schemas. The
+classes follow the conventions of asv (airspeed velocity), the module can also
+be run on its own:
+
+    python -m benchmarks.bench_backends [number of payments]
+"""
+import copy
+import datetime
+import sys
+import timeit
+
+from sepaxml import SepaDD, SepaTransfer
+
+SCHEMAS = [
+    "pain.008.001.02",
+    "pain.008.002.02",
+    "pain.008.003.02",
+    "pain.001.001.03",
+    "CBIPaymentRequest.00.04.00",
+]
+
+BACKENDS = ["etree", "lxml"]
+
+
+def build(schema, backend, count):
+    """
+    Create a batch document with count payments on two batches.
+    """
+    today = datetime.date.today()
+    if schema.startswith("pain.008"):
+        sepa = SepaDD({
+            "name": "TestCreditor",
+            "IBAN": "NL50BANK1234567890",
+            "BIC": "BANKNL2A",
+            "batch": True,
+            "creditor_id": "DE26ZZZ00000000000",
+            "currency": "EUR"
+        }, schema=schema, backend=backend)
+        for i in range(count):
+            sepa.add_payment({
+                "name": "Test von Testenstein",
+                "IBAN": "NL50BANK1234567890",
+                "BIC": "BANKNL2A",
+                "amount": 1000 + i,
+                "type": "FRST" if i % 2 else "RCUR",
+                "collection_date": today,
+                "mandate_id": "1234",
+                "mandate_date": today,
+                "description": "Test transaction"
+            })
+    else:
+        sepa = SepaTransfer({
+            "name": "TestCreditor",
+            "IBAN": "NL50BANK1234567890",
+            "BIC": "BANKNL2A",
+            "batch": True,
+            "currency": "EUR",
+            "execution_date": today,
+            "bank_code": "12345",
+            "issuer_id": "ABC1234"
+        }, schema=schema, backend=backend)
+        for i in range(count):
+            sepa.add_payment({
+                "name": "Test du Test",
+                "IBAN": "NL50BANK1234567890",
+                "BIC": "BANKNL2A",
+                "amount": 1000 + i,
+                "execution_date": today + datetime.timedelta(days=i % 2),
+                "description": "Test transaction"
+            })
+    return sepa
+
+
+class TimeBackends:
+    params = (SCHEMAS, BACKENDS)
+    param_names = ["schema", "backend"]
+    count = 1000
+
+    def setup(self, schema, backend):
+        self.sepa = build(schema, backend, self.count)
+
+    def time_build(self, schema, backend):
+        build(schema, backend, self.count)
+
+    def time_export(self, schema, backend):
+        copy.deepcopy(self.sepa).export(validate=False)
+
+    def time_export_validate(self, schema, backend):
+        # CBI only allows a single PmtInf block, the batches can not be validated.
+        copy.deepcopy(self.sepa).export(validate=not schema.startswith("CBI"))
+
+
+def main(count):
+    print("%-28s %-6s %10s %10s %10s" % ("schema", "backend", "build", "export", "validate"))
+    for schema in SCHEMAS:
+        for backend in BACKENDS:
+            sepa = build(schema, backend, count)
+            validate = not schema.startswith("CBI")
+            print("%-28s %-6s %9.3fs %9.3fs %9.3fs" % (
+                schema, backend,
+                timeit.timeit(lambda: build(schema, backend, count), number=1),
+                timeit.timeit(lambda: copy.deepcopy(sepa).export(validate=False), number=1),
+                timeit.timeit(lambda: copy.deepcopy(sepa).export(validate=validate), number=1),
+            ))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,185 @@
+"""
+Benchmarks for adding, finalizing, exporting and validating documents of all
+bundled schemas at 1k, 100k and 1M payments, in batch and in non batch mode.
+The classes follow the conventions of asv (airspeed velocity), which stores
+the results in benchmarks/results (see asv.conf.json), so e.g.
+
+    asv continuous master HEAD
+
+shows regressions against the last release. The module can also be run on
+its own for a single size:
+
+    python -m benchmarks.bench_payments [number of payments]
+"""
+import datetime
+import sys
+import timeit
+import tracemalloc
+
+from sepaxml import SepaDD, SepaTransfer
+from sepaxml.validation import schema_cache, try_valid_xml
+
+from .bench_backends import SCHEMAS
+
+BATCH = [True, False]
+
+COUNTS = [1000, 100000, 1000000]
+
+
+def new_document(schema, batch):
+    if schema.startswith("pain.008"):
+        return SepaDD({
+            "name": "TestCreditor",
+            "IBAN": "NL50BANK1234567890",
+            "BIC": "BANKNL2A",
+            "batch": batch,
+            "creditor_id": "DE26ZZZ00000000000",
+            "currency": "EUR"
+        }, schema=schema)
+    return SepaTransfer({
+        "name": "TestCreditor",
+        "IBAN": "NL50BANK1234567890",
+        "BIC": "BANKNL2A",
+        "batch": batch,
+        "currency": "EUR",
+        "execution_date": datetime.date.today(),
+        "bank_code": "12345",
+        "issuer_id": "ABC1234"
+    }, schema=schema)
+
+
+def payments(schema, count):
+    """
+    Create count payment dicts on two batches. CBI only allows a single PmtInf
+    block, so all CBI transfers are executed on the same day.
+    """
+    today = datetime.date.today()
+    if schema.startswith("pain.008"):
+        return [{
+            "name": "Test von Testenstein",
+            "IBAN": "NL50BANK1234567890",
+            "BIC": "BANKNL2A",
+            "amount": 1000 + i,
+            "type": "FRST" if i % 2 else "RCUR",
+            "collection_date": today,
+            "mandate_id": "1234",
+            "mandate_date": today,
+            "description": "Test transaction"
+        } for i in range(count)]
+    days = 1 if schema.startswith("pain") else 0
+    return [{
+        "name": "Test du Test",
+        "IBAN": "NL50BANK1234567890",
+        "BIC": "BANKNL2A",
+        "amount": 1000 + i,
+        "execution_date": today + datetime.timedelta(days=days * (i % 2)),
+        "description": "Test transaction"
+    } for i in range(count)]
+
+
+def validates(schema, batch):
+    """
+    CBI non batch documents repeat the PmtInf fields for every transaction
+    inside the single PmtInf block, so they are only valid with one payment.
+    """
+    return batch or not schema.startswith("CBI")
+
+
+def build(schema, batch, count):
+    sepa = new_document(schema, batch)
+    for payment in payments(schema, count):
+        sepa.add_payment(payment)
+    return sepa
+
+
+class Suite:
+    """
+    Common parameters. Every timing consumes the document or the payments
+    that setup prepared for it, so every sample is a single call.
+    """
+    params = (SCHEMAS, BATCH, COUNTS)
+    param_names = ["schema", "batch", "count"]
+    number = 1
+    repeat = (1, 5, 60.0)
+    rounds = 1
+    timeout = 3600
+
+
+class TimeAddPayment(Suite):
+
+    def setup(self, schema, batch, count):
+        self.sepa = new_document(schema, batch)
+        self.payments = payments(schema, count)
+
+    def time_add_payment(self, schema, batch, count):
+        for payment in self.payments:
+            self.sepa.add_payment(payment)
+
+
+class TimeFinalizeBatch(Suite):
+
+    def setup(self, schema, batch, count):
+        if not batch:
+            # Non batch payments are complete when they are added.
+            raise NotImplementedError()
+        self.sepa = build(schema, batch, count)
+
+    def time_finalize_batch(self, schema, batch, count):
+        self.sepa._finalize_batch()
+
+
+class TimeExport(Suite):
+
+    def setup(self, schema, batch, count):
+        self.sepa = build(schema, batch, count)
+
+    def time_export(self, schema, batch, count):
+        self.sepa.export(validate=False)
+
+
+class TimeValidate(Suite):
+
+    def setup(self, schema, batch, count):
+        if not validates(schema, batch):
+            raise NotImplementedError()
+        self.xmlout = build(schema, batch, count).export(validate=False)
+        schema_cache.get(schema)
+
+    def time_validate(self, schema, batch, count):
+        try_valid_xml(self.xmlout, schema)
+
+
+class PeakMemory(Suite):
+
+    def peakmem_build_export(self, schema, batch, count):
+        build(schema, batch, count).export(validate=False)
+
+
+def main(count):
+    print("%-28s %-5s %10s %10s %10s %10s %10s" % (
+        "schema", "batch", "add", "finalize", "export", "validate", "peak"))
+    for schema in SCHEMAS:
+        schema_cache.get(schema)
+        for batch in BATCH:
+            sepa = new_document(schema, batch)
+            data = payments(schema, count)
+            add = timeit.timeit(lambda: [sepa.add_payment(payment) for payment in data], number=1)
+            finalize = timeit.timeit(sepa._finalize_batch, number=1) if batch else 0.0
+            sepa = build(schema, batch, count)
+            xmlout = []
+            export = timeit.timeit(lambda: xmlout.append(sepa.export(validate=False)), number=1)
+            validate = "-"
+            if validates(schema, batch):
+                validate = "%.3fs" % timeit.timeit(lambda: try_valid_xml(xmlout[0], schema), number=1)
+            sepa = xmlout = None
+
+            tracemalloc.start()
+            build(schema, batch, count).export(validate=False)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print("%-28s %-5s %9.3fs %9.3fs %9.3fs %10s %8.1fMB" % (
+                schema, batch, add, finalize, export, validate, peak / 1e6))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -1,4 +1,8 @@
+from .cleaning import TextCleaner  # noqa
 from .debit import SepaDD  # noqa
+from .duplicates import DuplicateIndex  # noqa
+from .payments import CreditTransferPayment, DirectDebitPayment  # noqa
+from .rollover import RolloverWriter  # noqa
 from .transfer import SepaTransfer  # noqa
 
 version = '2.4.1'
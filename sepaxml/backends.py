@@ -0,0 +1,173 @@
+import re
+import xml.etree.ElementTree as ET
+
+from .validation import try_valid_tree, try_valid_xml
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+
+# Namespace declarations that lxml repeats on every serialized fragment.
+_NS_DECLARATION = re.compile(rb' xmlns(?::\w+)?="[^"]*"')
+
+
+class ElementTreeBackend:
+    """
+    Serialization backend based on xml.etree.ElementTree from the standard
+    library. The tags are kept unqualified and the namespaces are only
+    declared as attributes of the root node.
+    """
+    name = "etree"
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def Element(self, tag, attrib={}):
+        return ET.Element(tag, attrib)
+
+    def document(self, tag, schema_location=None):
+        """
+        Create the root node of the document with the namespace declarations.
+        """
+        root = ET.Element(tag)
+        if schema_location:
+            root.set("xsi:schemaLocation", schema_location)
+        root.set("xmlns", self.namespace)
+        root.set("xmlns:xsi", XSI_NAMESPACE)
+        ET.register_namespace("", self.namespace)
+        ET.register_namespace("xsi", XSI_NAMESPACE)
+        return root
+
+    def tag(self, tag):
+        """
+        @return: The tag as it is stored in the nodes
+        """
+        return tag
+
+    def find(self, node, path):
+        return node.find(path)
+
+    def tostring(self, node):
+        return ET.tostring(node, "utf-8")
+
+    def split_tags(self, node):
+        """
+        Render the opening and the closing tag of a node without its
+        children.
+        @return: tuple of the opening and the closing tag as bytes
+        """
+        shell = ET.Element(node.tag, node.attrib)
+        rendered = ET.tostring(shell, "utf-8", short_empty_elements=False)
+        closing = b"</" + node.tag.encode("utf-8") + b">"
+        return rendered[:-len(closing)], closing
+
+    def validate(self, root, xmlout, schema):
+        """
+        Validate the exported document.
+        @param root: The root node of the document, None if the nodes have
+        been released while the document was exported
+        @param xmlout: The serialized document
+        @raise ValidationError: when the document is invalid
+        """
+        try_valid_xml(xmlout, schema)
+
+
+class LxmlBackend:
+    """
+    Serialization backend based on lxml, which builds and serializes the
+    nodes in C. All tags are qualified with the document namespace, so the
+    tree can be validated as it is, without parsing the output again.
+    Fragments are serialized without the namespace declarations and prefixes
+    that lxml would add to them, so they can be joined like ElementTree
+    fragments.
+    """
+    name = "lxml"
+
+    def __init__(self, namespace):
+        if lxml_etree is None:
+            raise Exception("The lxml backend requires lxml to be installed.")
+        self.namespace = namespace
+        self._prefix = "{" + namespace + "}"
+        self._nsmap = {None: namespace}
+        self._document_tag = None
+
+    def Element(self, tag, attrib={}):
+        return lxml_etree.Element(self._prefix + tag, attrib, nsmap=self._nsmap)
+
+    def document(self, tag, schema_location=None):
+        """
+        Create the root node of the document with the namespace declarations.
+        """
+        self._document_tag = self._prefix + tag
+        root = lxml_etree.Element(self._document_tag, nsmap={None: self.namespace, "xsi": XSI_NAMESPACE})
+        if schema_location:
+            root.set("{" + XSI_NAMESPACE + "}schemaLocation", schema_location)
+        return root
+
+    def tag(self, tag):
+        """
+        @return: The tag as it is stored in the nodes
+        """
+        return self._prefix + tag
+
+    def find(self, node, path):
+        return node.find(path, namespaces=self._nsmap)
+
+    def tostring(self, node):
+        rendered = lxml_etree.tostring(node, encoding="utf-8")
+        if node.tag == self._document_tag:
+            return rendered
+        if node.prefix:
+            # Nodes that have been removed from the document get a generated
+            # prefix for the namespace. "<" is always escaped in text and
+            # attribute values, so the prefix can only occur in tags.
+            prefix = node.prefix.encode("utf-8")
+            rendered = rendered.replace(b"</" + prefix + b":", b"</").replace(b"<" + prefix + b":", b"<")
+        head_end = rendered.index(b">")
+        return _NS_DECLARATION.sub(b"", rendered[:head_end]) + rendered[head_end:]
+
+    def split_tags(self, node):
+        """
+        Render the opening and the closing tag of a node without its
+        children.
+        @return: tuple of the opening and the closing tag as bytes
+        """
+        nsmap = node.nsmap if node.tag == self._document_tag else self._nsmap
+        shell = lxml_etree.Element(node.tag, node.attrib, nsmap=nsmap)
+        shell.text = ""
+        rendered = self.tostring(shell)
+        closing = b"</" + lxml_etree.QName(node).localname.encode("utf-8") + b">"
+        return rendered[:-len(closing)], closing
+
+    def validate(self, root, xmlout, schema):
+        """
+        Validate the document tree directly, the serialized output is only
+        parsed if the tree is not available anymore.
+        @param root: The root node of the document, None if the nodes have
+        been released while the document was exported
+        @param xmlout: The serialized document
+        @raise ValidationError: when the document is invalid
+        """
+        if root is None:
+            root = lxml_etree.fromstring(xmlout)
+        try_valid_tree(root, schema)
+
+
+BACKENDS = {
+    "etree": ElementTreeBackend,
+    "lxml": LxmlBackend,
+}
+
+
+def get_backend(name, namespace):
+    """
+    Create the serialization backend with the given name.
+    @param namespace: The namespace of the document
+    @raise exception: when the backend is unknown
+    """
+    if name not in BACKENDS:
+        raise Exception("Unknown backend: " + name)
+    return BACKENDS[name](namespace)
@@ -0,0 +1,167 @@
+"""
+Local bank directory to derive the BIC of a payment from the national bank
+code in its IBAN. A directory file, e.g. the Bankleitzahlendatei of the
+Deutsche Bundesbank, is compiled once into a compact index of sorted fixed
+size records. The index is memory-mapped when it is opened, so opening it
+reads nothing and every lookup is a binary search over the mapped records.
+"""
+import csv
+import mmap
+import re
+import struct
+
+from .iban import normalize_iban
+
+MAGIC = b"SEPABIX1"
+
+# Magic, country of the bank codes, length of the bank codes and number of
+# records.
+_HEADER = struct.Struct("<8s2sBxI")
+
+BIC_LENGTH = 11
+
+# The position of the national bank code in the IBANs of a country.
+BANK_CODE_POSITIONS = {
+    "AT": (4, 9),
+    "BE": (4, 7),
+    "CH": (4, 9),
+    "DE": (4, 12),
+    "ES": (4, 8),
+    "FR": (4, 9),
+    "GB": (4, 14),
+    "IE": (4, 14),
+    "IT": (5, 10),
+    "LI": (4, 9),
+    "LU": (4, 7),
+    "NL": (4, 8),
+    "PT": (4, 8),
+}
+
+_BIC_FORMAT = re.compile(r"[A-Z]{6}[A-Z0-9]{2}(?:[A-Z0-9]{3})?")
+
+
+def read_blz(path):
+    """
+    Read the bank codes and BICs from a Bankleitzahlendatei of the Deutsche
+    Bundesbank in the fixed width text format. Only some of the entries of a
+    bank code carry its BIC.
+    @return: Generator of tuples of bank code and BIC
+    """
+    with open(path, encoding="latin-1") as f:
+        for line in f:
+            yield line[0:8], line[139:150].strip()
+
+
+def read_csv(path):
+    """
+    Read the bank codes and BICs from a CSV file with the bank code in the
+    first and the BIC in the second column. A header row is skipped as its
+    BIC is invalid.
+    @return: Generator of tuples of bank code and BIC
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if len(row) >= 2:
+                yield row[0].strip(), row[1].strip()
+
+
+FORMATS = {
+    "blz": read_blz,
+    "csv": read_csv,
+}
+
+
+def compile_directory(source, index, country="DE", format="blz"):
+    """
+    Compile a bank directory file into an index for BankDirectory.
+    @param source: The path of the directory file
+    @param index: The path of the index file to write
+    @param country: The country of the bank codes
+    @param format: "blz" for the Bankleitzahlendatei of the Deutsche
+    Bundesbank, "csv" for a CSV file of bank codes and BICs
+    @return: The number of bank codes in the index
+    @raise exception: when the format or country is unknown or a bank code
+    has the wrong length
+    """
+    if format not in FORMATS:
+        raise Exception("Unknown bank directory format: " + format)
+    if country not in BANK_CODE_POSITIONS:
+        raise Exception("Bank codes are not supported for country: " + country)
+    start, end = BANK_CODE_POSITIONS[country]
+    key_length = end - start
+
+    bics = {}
+    for bank_code, bic in FORMATS[format](source):
+        if not _BIC_FORMAT.fullmatch(bic) or bank_code in bics:
+            continue
+        if len(bank_code) != key_length:
+            raise Exception("Invalid bank code for %s: %s" % (country, bank_code))
+        bics[bank_code] = bic
+
+    with open(index, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, country.encode("ascii"), key_length, len(bics)))
+        for bank_code in sorted(bics):
+            f.write(bank_code.encode("ascii") + bics[bank_code].encode("ascii").ljust(BIC_LENGTH))
+    return len(bics)
+
+
+class BankDirectory:
+    """
+    Lookup of BICs by national bank code in a compiled index, see
+    compile_directory.
+    """
+
+    def __init__(self, path):
+        """
+        Constructor. Maps the index into memory.
+        @param path: The path of the index file
+        @raise exception: when the file is not a bank directory index
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, country, self.key_length, self.count = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise Exception("Not a bank directory index: " + path)
+        self.country = country.decode("ascii")
+        self._record_length = self.key_length + BIC_LENGTH
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, bank_code):
+        """
+        Find the BIC of a national bank code.
+        @return: The BIC, None if the bank code is unknown
+        """
+        key = bank_code.encode("ascii")
+        if len(key) != self.key_length:
+            return None
+        data = self._map
+        size = self._record_length
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            offset = _HEADER.size + middle * size
+            current = data[offset:offset + self.key_length]
+            if current < key:
+                low = middle + 1
+            elif current > key:
+                high = middle
+            else:
+                return data[offset + self.key_length:offset + size].decode("ascii").rstrip()
+        return None
+
+    def bic(self, iban):
+        """
+        Find the BIC of the bank of an IBAN.
+        @return: The BIC, None if the IBAN is of another country or its bank
+        code is unknown
+        """
+        iban = normalize_iban(iban)
+        if iban[:2] != self.country:
+            return None
+        start, end = BANK_CODE_POSITIONS[self.country]
+        return self.lookup(iban[start:end])
+
+    def close(self):
+        self._map.close()
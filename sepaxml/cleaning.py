@@ -0,0 +1,135 @@
+import re
+from functools import lru_cache
+
+DEFAULT_CACHE_SIZE = 16384
+
+# The basic Latin character set of the EPC implementation guidelines, which
+# every bank in the SEPA scheme has to accept.
+EPC_CHARACTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/-?:().,'+ "
+
+# Replacements for the ASCII characters outside of the EPC character set,
+# all others become a space.
+EPC_SUBSTITUTES = {
+    "&": "+", '"': "'", "`": "'", ";": ",", "_": "-", "!": ".", "\\": "/", "|": "/",
+    "[": "(", "]": ")", "{": "(", "}": ")", "<": "(", ">": ")",
+}
+
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+_EPC_VALID = re.compile("[" + re.escape(EPC_CHARACTERS) + "]*")
+_EPC_INVALID = re.compile("[^" + re.escape(EPC_CHARACTERS) + "]+")
+
+
+@lru_cache(maxsize=None)
+def _epc_table():
+    """
+    Build the translation table for str.translate from ASCII, the Latin
+    supplements and extensions and the general punctuation to the EPC
+    character set. The valid characters map to themselves, a lookup that
+    misses the table is a lot slower than a hit. The table is built on first
+    use, so that importing sepaxml does not require text-unidecode.
+    """
+    from text_unidecode import unidecode
+    ascii_table = {}
+    for code in range(128):
+        char = chr(code)
+        if char in EPC_CHARACTERS:
+            ascii_table[code] = char
+        else:
+            ascii_table[code] = EPC_SUBSTITUTES.get(char, " ")
+    table = dict(ascii_table)
+    for code in list(range(0x80, 0x250)) + list(range(0x2000, 0x20c0)):
+        table[code] = unidecode(chr(code)).translate(ascii_table)
+    return table
+
+
+def to_ascii(text):
+    """
+    Transliterate a text to ASCII, texts that are ASCII already are returned
+    as they are.
+    """
+    if _NON_ASCII.search(text) is None:
+        return text
+    # Imported here, setup.py imports sepaxml before text-unidecode is installed.
+    from text_unidecode import unidecode
+    return unidecode(text)
+
+
+def to_epc(text):
+    """
+    Convert a text to the EPC character set in a single translation pass.
+    Texts that are valid already are returned as they are, characters that
+    are not covered by the translation table are transliterated with
+    unidecode.
+    """
+    if _EPC_VALID.fullmatch(text):
+        return text
+    table = _epc_table()
+    text = text.translate(table)
+    if _EPC_INVALID.search(text) is None:
+        return text
+    from text_unidecode import unidecode
+    return _EPC_INVALID.sub(lambda match: unidecode(match.group(0)).translate(table), text)
+
+
+CHARSETS = {
+    "ascii": to_ascii,
+    "epc": to_epc,
+}
+
+
+class TextCleaner:
+    """
+    Transliterates texts and truncates them, as the clean option of the
+    builders does, with a bounded LRU cache in front. Recurring names and
+    descriptions, e.g. of monthly collections, are only converted once as
+    long as they stay in the cache.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, charset="ascii"):
+        """
+        Constructor.
+        @param maxsize: The maximum number of cached texts, 0 disables the
+        cache.
+        @param charset: "ascii" to transliterate to ASCII or "epc" to convert
+        to the basic Latin character set of the EPC guidelines, which e.g.
+        replaces & with +.
+        @raise exception: when the charset is unknown
+        """
+        if charset not in CHARSETS:
+            raise Exception("Unknown charset: " + charset)
+        self.maxsize = maxsize
+        self.charset = charset
+        convert = CHARSETS[charset]
+
+        def clean(text, max_length):
+            return convert(text)[:max_length]
+        self._clean = lru_cache(maxsize)(clean)
+
+    def clean(self, text, max_length):
+        """
+        @return: The transliterated text, truncated to max_length characters
+        """
+        return self._clean(text, max_length)
+
+    def stats(self):
+        """
+        @return: dict with the number of cache hits and misses, the maximum
+        and the current number of cached texts
+        """
+        info = self._clean.cache_info()
+        return {
+            'hits': info.hits,
+            'misses': info.misses,
+            'maxsize': info.maxsize,
+            'currsize': info.currsize,
+        }
+
+    def clear(self):
+        """
+        Empty the cache and reset the statistics.
+        """
+        self._clean.cache_clear()
+
+
+# Process-wide cleaner that is used by all builders without their own.
+text_cleaner = TextCleaner()
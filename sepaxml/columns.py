@@ -0,0 +1,166 @@
+"""
+Helpers to check and convert whole columns of payment data at once, e.g. the
+columns of a pandas DataFrame. NumPy is used if it is installed, otherwise the
+columns are processed as plain Python sequences.
+"""
+import datetime
+from collections import OrderedDict
+
+from .utils import int_to_decimal_str
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def to_list(column):
+    """
+    Helper to turn a column (list, NumPy array or pandas Series) into a list
+    of Python objects.
+    """
+    if hasattr(column, 'tolist'):
+        return column.tolist()
+    return list(column)
+
+
+def is_missing(value):
+    """
+    Helper to detect empty cells, i.e. None or NaN as used by pandas.
+    """
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def column_length(columns, required):
+    """
+    Check that all required columns exist and all columns have the same
+    length.
+    @param columns: Mapping of payment field names to columns
+    @param required: The names of the required columns
+    @return: The number of rows
+    @raise exception: when a column is missing or the lengths differ
+    """
+    validation = ""
+    for name in required:
+        if name not in columns:
+            validation += name.upper() + "_MISSING "
+    if validation:
+        raise Exception('Payment did not validate: ' + validation)
+
+    lengths = set(len(columns[name]) for name in columns)
+    if len(lengths) > 1:
+        raise Exception('Payment did not validate: COLUMN_LENGTHS_DIFFER')
+    return lengths.pop() if lengths else 0
+
+
+def optional_column(columns, name, length, default=None):
+    """
+    Helper to get an optional column as list. Empty cells and a missing
+    column are replaced with the default.
+    """
+    if name not in columns:
+        return [default] * length
+    return [default if is_missing(value) else value for value in to_list(columns[name])]
+
+
+def clean_column(column, max_length, cleaner):
+    """
+    Helper to transliterate and truncate a text column like the clean option
+    does for single payments. Values that occur repeatedly, like the names
+    of regular debtors, are only converted once.
+    @param cleaner: The TextCleaner of the builder
+    """
+    cleaned = {}
+    result = []
+    for value in column:
+        if value not in cleaned:
+            cleaned[value] = cleaner.clean(value, max_length)
+        result.append(cleaned[value])
+    return result
+
+
+def amount_column(column):
+    """
+    Check that all amounts are integers (cents) and convert them to decimal
+    strings.
+    @return: tuple of the amounts in cents (int64 array or list of int) and
+    the list of decimal strings
+    @raise exception: when one of the amounts is not an integer
+    """
+    if np is not None:
+        cents = np.asarray(column)
+        if cents.dtype.kind not in "iu":
+            raise Exception('Payment did not validate: AMOUNT_NOT_INTEGER ')
+        cents = cents.astype(np.int64)
+        # Split the absolute value, np.divmod floors negative amounts.
+        euros, rest = np.divmod(np.abs(cents), 100)
+        signs = np.where(cents < 0, "-", "")
+        amounts = np.char.add(np.char.add(np.char.add(signs, euros.astype(str)), "."), np.char.zfill(rest.astype(str), 2))
+        return cents, amounts.tolist()
+
+    cents = to_list(column)
+    if not all(isinstance(amount, int) for amount in cents):
+        raise Exception('Payment did not validate: AMOUNT_NOT_INTEGER ')
+    return cents, [int_to_decimal_str(amount) for amount in cents]
+
+
+def date_column(column, code):
+    """
+    Check that all values are dates and convert them to ISO strings. NumPy
+    datetime64 columns are converted as a whole.
+    @param code: The field name for the validation error, e.g. MANDATE_DATE
+    @return: list of date strings
+    @raise exception: when one of the values is not a date
+    """
+    error = 'Payment did not validate: ' + code + '_INVALID_OR_NOT_DATETIME_INSTANCE'
+    if np is not None:
+        dates = np.asarray(column)
+        if dates.dtype.kind == "M":
+            if np.isnat(dates).any():
+                raise Exception(error)
+            return np.datetime_as_string(dates, unit="D").tolist()
+
+    dates = to_list(column)
+    if not all(isinstance(date, datetime.date) for date in dates):
+        raise Exception(error)
+    return [str(date) for date in dates]
+
+
+def group_rows(keys, cents):
+    """
+    Group the rows by their batch key.
+    @param keys: The batch key of every row
+    @param cents: The amount of every row in cents
+    @return: list of tuples of batch key, row indices and the sum of the
+    amounts in cents, in order of the first row of every batch
+    """
+    if np is not None and len(keys):
+        keys = np.asarray(keys)
+        batch_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        totals = np.zeros(len(batch_keys), dtype=np.int64)
+        np.add.at(totals, inverse, cents)
+        rows = np.argsort(inverse, kind="stable")
+        rows = np.split(rows, np.cumsum(np.bincount(inverse))[:-1])
+        return [
+            (str(batch_keys[i]), rows[i].tolist(), int(totals[i]))
+            for i in np.argsort(first)
+        ]
+
+    groups = OrderedDict()
+    totals = {}
+    for row, (key, amount) in enumerate(zip(keys, cents)):
+        if key in groups:
+            groups[key].append(row)
+            totals[key] += amount
+        else:
+            groups[key] = [row]
+            totals[key] = amount
+    return [(key, rows, totals[key]) for key, rows in groups.items()]
+
+
+def column_sum(cents):
+    """
+    Helper to sum up the amounts of a column as Python int.
+    """
+    return int(sum(to_list(cents)))
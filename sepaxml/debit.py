@@ -1,8 +1,12 @@
 import datetime
-import xml.etree.ElementTree as ET
 
+from .columns import (amount_column, column_length, date_column,
+                      optional_column, to_list)
+from .duplicates import DEBIT_KEYS
+from .payments import DirectDebitPayment
 from .shared import SepaPaymentInitn
-from .utils import int_to_decimal_str, make_id
+from .templates import ByteTemplate, placeholders
+from .utils import int_to_decimal_str, make_id, make_ids
 
 
 class SepaDD(SepaPaymentInitn):
@@ -10,11 +14,39 @@ class SepaDD(SepaPaymentInitn):
     This class creates a Sepa Direct Debit XML File.
     """
     root_el = "CstmrDrctDbtInitn"
-
-    def __init__(self, config, schema="pain.008.001.02", clean=True):
+    payment_class = DirectDebitPayment
+    duplicate_keys = DEBIT_KEYS
+
+    # The paths of the elements of the config values, the transaction field
+    # values (see _TX_values) and the batch key values for check_fields.
+    config_fields = (
+        ("name", "GrpHdr/InitgPty/Nm"),
+        ("IBAN", "PmtInf/CdtrAcct/Id/IBAN"),
+        ("BIC", "PmtInf/CdtrAgt/FinInstnId/BIC"),
+        ("creditor_id", "PmtInf/CdtrSchmeId/Id/PrvtId/Othr/Id"),
+        ("instrument", "PmtInf/PmtTpInf/LclInstrm/Cd"),
+    )
+    TX_fields = (
+        ("endtoend_id", "PmtInf/DrctDbtTxInf/PmtId/EndToEndId"),
+        ("amount", "PmtInf/DrctDbtTxInf/InstdAmt"),
+        ("mandate_id", "PmtInf/DrctDbtTxInf/DrctDbtTx/MndtRltdInf/MndtId"),
+        ("mandate_date", "PmtInf/DrctDbtTxInf/DrctDbtTx/MndtRltdInf/DtOfSgntr"),
+        ("BIC", "PmtInf/DrctDbtTxInf/DbtrAgt/FinInstnId/BIC"),
+        ("name", "PmtInf/DrctDbtTxInf/Dbtr/Nm"),
+        ("IBAN", "PmtInf/DrctDbtTxInf/DbtrAcct/Id/IBAN"),
+        ("description", "PmtInf/DrctDbtTxInf/RmtInf/Ustrd"),
+    )
+    batch_fields = (
+        ("type", "PmtInf/PmtTpInf/SeqTp"),
+        ("collection_date", "PmtInf/ReqdColltnDt"),
+    )
+
+    def __init__(self, config, schema="pain.008.001.02", clean=True, serializer="etree", backend="etree", cleaner=None,
+                 check_iban=False, bank_directory=None, deterministic=False, duplicates=None, check_fields=False):
         if "instrument" not in config:
             config["instrument"] = "CORE"
-        super().__init__(config, schema, clean)
+        super().__init__(config, schema, clean, serializer, backend, cleaner, check_iban, bank_directory,
+                         deterministic, duplicates, check_fields)
 
     def check_config(self, config):
         """
@@ -65,32 +97,184 @@ class SepaDD(SepaPaymentInitn):
     def add_payment(self, payment):
         """
         Function to add payments
-        @param payment: The payment dict
+        @param payment: The payment dict or a DirectDebitPayment
         @raise exception: when payment is invalid
         """
-        if self.clean:
-            from text_unidecode import unidecode
+        self._derived = 0
+        if isinstance(payment, DirectDebitPayment):
+            self._add_TXs([self._record_TX(payment)])
+            return
 
-            payment['name'] = unidecode(payment['name'])[:70]
-            payment['description'] = unidecode(payment['description'])[:140]
+        if self.clean:
+            self._clean_payment(payment)
 
         # Validate the payment
         self.check_payment(payment)
+        if self.check_iban:
+            payment['IBAN'] = self._check_account(payment['IBAN'], payment.get('BIC'))
+        self._find_BICs([payment])
+
+        if not payment.get('endtoend_id', ''):
+            if self.deterministic:
+                payment['endtoend_id'] = self._derive_id(sorted(payment.items()))
+            else:
+                payment['endtoend_id'] = make_id(self._config['name'])
+
+        self._add_TXs([self._payment_TX(payment)])
+
+    def _clean_payment(self, payment):
+        payment['name'] = self.cleaner.clean(payment['name'], 70)
+        payment['description'] = self.cleaner.clean(payment['description'], 140)
+
+    def _clean_record(self, record):
+        """
+        Method to clean the texts of a record without changing it.
+        @return: tuple of the cleaned name and description
+        """
+        return self.cleaner.clean(record.name, 70), self.cleaner.clean(record.description, 140)
+
+    def _prepare_payments(self, payments):
+        """
+        Method to clean and validate a chunk of payments for add_payments and
+        to assign the missing EndToEndIds in one go.
+        @raise exception: when one of the payments is invalid
+        """
+        payments = [payment for payment in payments if not isinstance(payment, DirectDebitPayment)]
+        for payment in payments:
+            if self.clean:
+                self._clean_payment(payment)
+            self.check_payment(payment)
+        if self.check_iban:
+            IBANs = self._check_accounts([payment['IBAN'] for payment in payments],
+                                         [payment.get('BIC') for payment in payments])
+            for payment, IBAN in zip(payments, IBANs):
+                payment['IBAN'] = IBAN
+        self._find_BICs(payments)
+
+        missing = [payment for payment in payments if not payment.get('endtoend_id', '')]
+        if self.deterministic:
+            endtoend_ids = [self._derive_id(sorted(payment.items())) for payment in missing]
+        else:
+            endtoend_ids = make_ids(self._config['name'], len(missing))
+        for payment, endtoend_id in zip(missing, endtoend_ids):
+            payment['endtoend_id'] = endtoend_id
+
+    def _prepare_columns(self, columns):
+        """
+        Method to clean, validate and convert the columns for add_columns.
+        @return: tuple of the amounts in cents, the batch key of every row and
+        the transaction field values of every row
+        @raise exception: when a column is invalid
+        """
+        length = column_length(columns, [
+            "name", "IBAN", "amount", "type", "collection_date", "mandate_id", "mandate_date", "description"
+        ])
+        names = to_list(columns['name'])
+        descriptions = to_list(columns['description'])
+        if self.clean:
+            names, descriptions = self._clean_columns(names, descriptions)
+
+        cents, amounts = amount_column(columns['amount'])
+        mandate_dates = date_column(columns['mandate_date'], "MANDATE_DATE")
+        collection_dates = date_column(columns['collection_date'], "COLLECTION_DATE")
+
+        IBANs = to_list(columns['IBAN'])
+        BICs = optional_column(columns, 'BIC', length)
+        if self.check_iban:
+            IBANs = self._check_accounts(IBANs, BICs)
+        if self.bank_directory is not None:
+            BICs = [self._find_BIC(IBAN, BIC) for IBAN, BIC in zip(IBANs, BICs)]
+
+        endtoend_ids = optional_column(columns, 'endtoend_id', length)
+        missing = [row for row, endtoend_id in enumerate(endtoend_ids) if not endtoend_id]
+        if self.deterministic:
+            derived = [self._derive_id(names[row], IBANs[row], amounts[row], descriptions[row]) for row in missing]
+        else:
+            derived = make_ids(self._config['name'], len(missing))
+        for row, endtoend_id in zip(missing, derived):
+            endtoend_ids[row] = endtoend_id
+
+        batch_keys = [
+            seq_type + "::" + collection_date
+            for seq_type, collection_date in zip(to_list(columns['type']), collection_dates)
+        ]
+        values = list(zip(
+            endtoend_ids,
+            amounts,
+            to_list(columns['mandate_id']),
+            mandate_dates,
+            BICs,
+            names,
+            IBANs,
+            descriptions,
+        ))
+        return cents, batch_keys, values
+
+    def _payment_TX(self, payment):
+        """
+        Method to get the transaction of a payment that has already been
+        cleaned and validated.
+        @return: tuple of the field values, the amount and the batch key
+        values, see _add_TXs
+        """
+        return self._TX_values(payment), payment['amount'], (payment['type'], payment['collection_date'])
+
+    def _record_TX(self, record):
+        """
+        Method to get the transaction of a DirectDebitPayment, which has been
+        validated when it was created. The record itself is not changed.
+        @return: tuple of the field values, the amount and the batch key
+        values, see _add_TXs
+        """
+        name = record.name
+        description = record.description
+        if self.clean:
+            name, description = self._clean_record(record)
+        IBAN = record.IBAN
+        if self.check_iban:
+            IBAN = self._check_account(IBAN, record.BIC)
+        BIC = self._find_BIC(IBAN, record.BIC)
+        endtoend_id = record.endtoend_id
+        if not endtoend_id:
+            if self.deterministic:
+                endtoend_id = self._derive_id(name, IBAN, record.amount, record.mandate_id, description)
+            else:
+                endtoend_id = make_id(self._config['name'])
+        values = (
+            endtoend_id,
+            int_to_decimal_str(record.amount),
+            record.mandate_id,
+            str(record.mandate_date),
+            BIC,
+            name,
+            IBAN,
+            description,
+        )
+        return values, record.amount, (record.type, str(record.collection_date))
+
+    def _add_TX(self, values, amount, seq_type, collection_date):
+        """
+        Method to create the transaction from its field values and add it to
+        its batch or as non batch payment.
+        """
+        batch_key = seq_type + "::" + collection_date
 
         # Get the CstmrDrctDbtInitnNode
         if not self._config['batch']:
             # Start building the non batch payment
             PmtInf_nodes = self._create_PmtInf_node()
-            PmtInf_nodes['PmtInfIdNode'].text = make_id(self._config['name'])
+            if self.deterministic:
+                PmtInf_nodes['PmtInfIdNode'].text = self._derive_id("PmtInf", values)
+            else:
+                PmtInf_nodes['PmtInfIdNode'].text = make_id(self._config['name'])
             PmtInf_nodes['PmtMtdNode'].text = "DD"
             PmtInf_nodes['BtchBookgNode'].text = "false"
             PmtInf_nodes['NbOfTxsNode'].text = "1"
-            PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(
-                payment['amount'])
+            PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(amount)
             PmtInf_nodes['Cd_SvcLvl_Node'].text = "SEPA"
             PmtInf_nodes['Cd_LclInstrm_Node'].text = self._config['instrument']
-            PmtInf_nodes['SeqTpNode'].text = payment['type']
-            PmtInf_nodes['ReqdColltnDtNode'].text = payment['collection_date']
+            PmtInf_nodes['SeqTpNode'].text = seq_type
+            PmtInf_nodes['ReqdColltnDtNode'].text = collection_date
             PmtInf_nodes['Nm_Cdtr_Node'].text = self._config['name']
             PmtInf_nodes['IBAN_CdtrAcct_Node'].text = self._config['IBAN']
 
@@ -103,33 +287,20 @@ class SepaDD(SepaPaymentInitn):
             PmtInf_nodes['Id_Othr_Node'].text = self._config['creditor_id']
             PmtInf_nodes['PrtryNode'].text = "SEPA"
 
-        if 'BIC' in payment:
-            bic = True
-        else:
-            bic = False
-
-        TX_nodes = self._create_TX_node(bic)
-        TX_nodes['InstdAmtNode'].set("Ccy", self._config['currency'])
-        TX_nodes['InstdAmtNode'].text = int_to_decimal_str(payment['amount'])
-
-        TX_nodes['MndtIdNode'].text = payment['mandate_id']
-        TX_nodes['DtOfSgntrNode'].text = payment['mandate_date']
-        if bic:
-            TX_nodes['BIC_DbtrAgt_Node'].text = payment['BIC']
-        else:
-            TX_nodes['Id_DbtrAgt_Node'].text = "NOTPROVIDED"
-
-        TX_nodes['Nm_Dbtr_Node'].text = payment['name']
-        TX_nodes['IBAN_DbtrAcct_Node'].text = payment['IBAN']
-        TX_nodes['UstrdNode'].text = payment['description']
-        if not payment.get('endtoend_id', ''):
-            payment['endtoend_id'] = make_id(self._config['name'])
-        TX_nodes['EndToEndIdNode'].text = payment['endtoend_id']
+        TX = self._create_TX(values)
 
         if self._config['batch']:
-            self._add_batch(TX_nodes, payment)
+            self._measure_TX(TX, batch_key)
+            self._add_to_batch_list(TX, batch_key, amount)
         else:
-            self._add_non_batch(TX_nodes, PmtInf_nodes)
+            self._measure_TX(TX, batch_key, batch=False)
+            self._add_non_batch(TX, PmtInf_nodes)
+
+        self._nb_of_txs_total += 1
+        self._ctrl_sum_total += amount
+        if self.deterministic:
+            # Only transactions that have been added change the hash.
+            self._hash_TX(values, batch_key)
 
     def _create_header(self):
         """
@@ -137,24 +308,24 @@ class SepaDD(SepaPaymentInitn):
         CstmrDrctDbtInit Node
         """
         # Retrieve the node to which we will append the group header.
-        CstmrDrctDbtInitn_node = self._xml.find('CstmrDrctDbtInitn')
+        CstmrDrctDbtInitn_node = self.backend.find(self._xml, 'CstmrDrctDbtInitn')
 
         # Create the header nodes.
-        GrpHdr_node = ET.Element("GrpHdr")
-        MsgId_node = ET.Element("MsgId")
-        CreDtTm_node = ET.Element("CreDtTm")
-        NbOfTxs_node = ET.Element("NbOfTxs")
-        CtrlSum_node = ET.Element("CtrlSum")
-        InitgPty_node = ET.Element("InitgPty")
-        Nm_node = ET.Element("Nm")
-        SupId_node = ET.Element("Id")
-        OrgId_node = ET.Element("OrgId")
-        Othr_node = ET.Element("Othr")
-        Id_node = ET.Element("Id")
+        GrpHdr_node = self.backend.Element("GrpHdr")
+        MsgId_node = self.backend.Element("MsgId")
+        CreDtTm_node = self.backend.Element("CreDtTm")
+        NbOfTxs_node = self.backend.Element("NbOfTxs")
+        CtrlSum_node = self.backend.Element("CtrlSum")
+        InitgPty_node = self.backend.Element("InitgPty")
+        Nm_node = self.backend.Element("Nm")
+        SupId_node = self.backend.Element("Id")
+        OrgId_node = self.backend.Element("OrgId")
+        Othr_node = self.backend.Element("Othr")
+        Id_node = self.backend.Element("Id")
 
         # Add data to some header nodes.
         MsgId_node.text = self.msg_id
-        CreDtTm_node.text = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        CreDtTm_node.text = self._creation_datetime()
         Nm_node.text = self._config['name']
         Id_node.text = self._config['creditor_id']
 
@@ -178,39 +349,39 @@ class SepaDD(SepaPaymentInitn):
         Method to create the blank payment information nodes as a dict.
         """
         ED = dict()  # ED is element dict
-        ED['PmtInfNode'] = ET.Element("PmtInf")
-        ED['PmtInfIdNode'] = ET.Element("PmtInfId")
-        ED['PmtMtdNode'] = ET.Element("PmtMtd")
-        ED['BtchBookgNode'] = ET.Element("BtchBookg")
-        ED['NbOfTxsNode'] = ET.Element("NbOfTxs")
-        ED['CtrlSumNode'] = ET.Element("CtrlSum")
-        ED['PmtTpInfNode'] = ET.Element("PmtTpInf")
-        ED['SvcLvlNode'] = ET.Element("SvcLvl")
-        ED['Cd_SvcLvl_Node'] = ET.Element("Cd")
-        ED['LclInstrmNode'] = ET.Element("LclInstrm")
-        ED['Cd_LclInstrm_Node'] = ET.Element("Cd")
-        ED['SeqTpNode'] = ET.Element("SeqTp")
-        ED['ReqdColltnDtNode'] = ET.Element("ReqdColltnDt")
-        ED['CdtrNode'] = ET.Element("Cdtr")
-        ED['Nm_Cdtr_Node'] = ET.Element("Nm")
-        ED['CdtrAcctNode'] = ET.Element("CdtrAcct")
-        ED['Id_CdtrAcct_Node'] = ET.Element("Id")
-        ED['IBAN_CdtrAcct_Node'] = ET.Element("IBAN")
-        ED['CdtrAgtNode'] = ET.Element("CdtrAgt")
-        ED['FinInstnId_CdtrAgt_Node'] = ET.Element("FinInstnId")
+        ED['PmtInfNode'] = self.backend.Element("PmtInf")
+        ED['PmtInfIdNode'] = self.backend.Element("PmtInfId")
+        ED['PmtMtdNode'] = self.backend.Element("PmtMtd")
+        ED['BtchBookgNode'] = self.backend.Element("BtchBookg")
+        ED['NbOfTxsNode'] = self.backend.Element("NbOfTxs")
+        ED['CtrlSumNode'] = self.backend.Element("CtrlSum")
+        ED['PmtTpInfNode'] = self.backend.Element("PmtTpInf")
+        ED['SvcLvlNode'] = self.backend.Element("SvcLvl")
+        ED['Cd_SvcLvl_Node'] = self.backend.Element("Cd")
+        ED['LclInstrmNode'] = self.backend.Element("LclInstrm")
+        ED['Cd_LclInstrm_Node'] = self.backend.Element("Cd")
+        ED['SeqTpNode'] = self.backend.Element("SeqTp")
+        ED['ReqdColltnDtNode'] = self.backend.Element("ReqdColltnDt")
+        ED['CdtrNode'] = self.backend.Element("Cdtr")
+        ED['Nm_Cdtr_Node'] = self.backend.Element("Nm")
+        ED['CdtrAcctNode'] = self.backend.Element("CdtrAcct")
+        ED['Id_CdtrAcct_Node'] = self.backend.Element("Id")
+        ED['IBAN_CdtrAcct_Node'] = self.backend.Element("IBAN")
+        ED['CdtrAgtNode'] = self.backend.Element("CdtrAgt")
+        ED['FinInstnId_CdtrAgt_Node'] = self.backend.Element("FinInstnId")
         if 'BIC' in self._config:
-            ED['BIC_CdtrAgt_Node'] = ET.Element("BIC")
+            ED['BIC_CdtrAgt_Node'] = self.backend.Element("BIC")
         else:
-            ED['Othr_CdtrAgt_Node'] = ET.Element("Othr")
-            ED['Id_CdtrAgt_Node'] = ET.Element("Id")
-        ED['ChrgBrNode'] = ET.Element("ChrgBr")
-        ED['CdtrSchmeIdNode'] = ET.Element("CdtrSchmeId")
-        ED['Id_CdtrSchmeId_Node'] = ET.Element("Id")
-        ED['PrvtIdNode'] = ET.Element("PrvtId")
-        ED['OthrNode'] = ET.Element("Othr")
-        ED['Id_Othr_Node'] = ET.Element("Id")
-        ED['SchmeNmNode'] = ET.Element("SchmeNm")
-        ED['PrtryNode'] = ET.Element("Prtry")
+            ED['Othr_CdtrAgt_Node'] = self.backend.Element("Othr")
+            ED['Id_CdtrAgt_Node'] = self.backend.Element("Id")
+        ED['ChrgBrNode'] = self.backend.Element("ChrgBr")
+        ED['CdtrSchmeIdNode'] = self.backend.Element("CdtrSchmeId")
+        ED['Id_CdtrSchmeId_Node'] = self.backend.Element("Id")
+        ED['PrvtIdNode'] = self.backend.Element("PrvtId")
+        ED['OthrNode'] = self.backend.Element("Othr")
+        ED['Id_Othr_Node'] = self.backend.Element("Id")
+        ED['SchmeNmNode'] = self.backend.Element("SchmeNm")
+        ED['PrtryNode'] = self.backend.Element("Prtry")
         return ED
 
     def _create_TX_node(self, bic=True):
@@ -219,34 +390,130 @@ class SepaDD(SepaPaymentInitn):
         the BIC node will also be created.
         """
         ED = dict()
-        ED['DrctDbtTxInfNode'] = ET.Element("DrctDbtTxInf")
-        ED['PmtIdNode'] = ET.Element("PmtId")
-        ED['EndToEndIdNode'] = ET.Element("EndToEndId")
-        ED['InstdAmtNode'] = ET.Element("InstdAmt")
-        ED['DrctDbtTxNode'] = ET.Element("DrctDbtTx")
-        ED['MndtRltdInfNode'] = ET.Element("MndtRltdInf")
-        ED['MndtIdNode'] = ET.Element("MndtId")
-        ED['DtOfSgntrNode'] = ET.Element("DtOfSgntr")
-        ED['DbtrAgtNode'] = ET.Element("DbtrAgt")
-        ED['FinInstnId_DbtrAgt_Node'] = ET.Element("FinInstnId")
+        ED['DrctDbtTxInfNode'] = self.backend.Element("DrctDbtTxInf")
+        ED['PmtIdNode'] = self.backend.Element("PmtId")
+        ED['EndToEndIdNode'] = self.backend.Element("EndToEndId")
+        ED['InstdAmtNode'] = self.backend.Element("InstdAmt")
+        ED['DrctDbtTxNode'] = self.backend.Element("DrctDbtTx")
+        ED['MndtRltdInfNode'] = self.backend.Element("MndtRltdInf")
+        ED['MndtIdNode'] = self.backend.Element("MndtId")
+        ED['DtOfSgntrNode'] = self.backend.Element("DtOfSgntr")
+        ED['DbtrAgtNode'] = self.backend.Element("DbtrAgt")
+        ED['FinInstnId_DbtrAgt_Node'] = self.backend.Element("FinInstnId")
         if bic:
-            ED['BIC_DbtrAgt_Node'] = ET.Element("BIC")
+            ED['BIC_DbtrAgt_Node'] = self.backend.Element("BIC")
         else:
-            ED['Id_DbtrAgt_Node'] = ET.Element("Id")
-            ED['Othr_DbtrAgt_Node'] = ET.Element("Othr")
-        ED['DbtrNode'] = ET.Element("Dbtr")
-        ED['Nm_Dbtr_Node'] = ET.Element("Nm")
-        ED['DbtrAcctNode'] = ET.Element("DbtrAcct")
-        ED['Id_DbtrAcct_Node'] = ET.Element("Id")
-        ED['IBAN_DbtrAcct_Node'] = ET.Element("IBAN")
-        ED['RmtInfNode'] = ET.Element("RmtInf")
-        ED['UstrdNode'] = ET.Element("Ustrd")
+            ED['Id_DbtrAgt_Node'] = self.backend.Element("Id")
+            ED['Othr_DbtrAgt_Node'] = self.backend.Element("Othr")
+        ED['DbtrNode'] = self.backend.Element("Dbtr")
+        ED['Nm_Dbtr_Node'] = self.backend.Element("Nm")
+        ED['DbtrAcctNode'] = self.backend.Element("DbtrAcct")
+        ED['Id_DbtrAcct_Node'] = self.backend.Element("Id")
+        ED['IBAN_DbtrAcct_Node'] = self.backend.Element("IBAN")
+        ED['RmtInfNode'] = self.backend.Element("RmtInf")
+        ED['UstrdNode'] = self.backend.Element("Ustrd")
         return ED
 
-    def _add_non_batch(self, TX_nodes, PmtInf_nodes):
+    def _TX_values(self, payment):
+        """
+        Method to collect the final values of all transaction fields.
+        @return: tuple of EndToEndId, amount, mandate id, mandate date, BIC
+        (None if not provided), name, IBAN and description
+        """
+        return (
+            payment['endtoend_id'],
+            int_to_decimal_str(payment['amount']),
+            payment['mandate_id'],
+            payment['mandate_date'],
+            payment['BIC'] if 'BIC' in payment else None,
+            payment['name'],
+            payment['IBAN'],
+            payment['description'],
+        )
+
+    def _create_TX(self, values):
+        """
+        Method to create a transaction from its field values. With the
+        template serializer, the transaction is rendered to bytes right away,
+        with the deferred serializer, the values of batch transactions are
+        kept as they are, otherwise the DrctDbtTxInf node is returned.
+        """
+        if self.serializer == 'deferred' and self._config['batch']:
+            return values
+        if self.serializer == 'template':
+            bic = values[4] is not None
+            template = self._TX_templates.get(bic)
+            if template is None:
+                sample = placeholders(len(values))
+                if not bic:
+                    sample[4] = None
+                template = ByteTemplate(self._create_TX_node_from(sample))
+                self._TX_templates[bic] = template
+            TX = template.render(values)
+            if TX is None:
+                TX = self.backend.tostring(self._create_TX_node_from(values))
+            return TX
+        return self._create_TX_node_from(values)
+
+    def _create_TX_node_from(self, values):
+        """
+        Method to create the folded DrctDbtTxInf node from the transaction
+        field values.
+        """
+        endtoend_id, amount, mandate_id, mandate_date, bic, name, iban, description = values
+        TX_nodes = self._create_TX_node(bic is not None)
+        TX_nodes['InstdAmtNode'].set("Ccy", self._config['currency'])
+        TX_nodes['InstdAmtNode'].text = amount
+
+        TX_nodes['MndtIdNode'].text = mandate_id
+        TX_nodes['DtOfSgntrNode'].text = mandate_date
+        if bic is not None:
+            TX_nodes['BIC_DbtrAgt_Node'].text = bic
+        else:
+            TX_nodes['Id_DbtrAgt_Node'].text = "NOTPROVIDED"
+
+        TX_nodes['Nm_Dbtr_Node'].text = name
+        TX_nodes['IBAN_DbtrAcct_Node'].text = iban
+        TX_nodes['UstrdNode'].text = description
+        TX_nodes['EndToEndIdNode'].text = endtoend_id
+
+        TX_nodes['PmtIdNode'].append(TX_nodes['EndToEndIdNode'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['PmtIdNode'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['InstdAmtNode'])
+
+        TX_nodes['MndtRltdInfNode'].append(TX_nodes['MndtIdNode'])
+        TX_nodes['MndtRltdInfNode'].append(TX_nodes['DtOfSgntrNode'])
+        TX_nodes['DrctDbtTxNode'].append(TX_nodes['MndtRltdInfNode'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DrctDbtTxNode'])
+
+        if 'BIC_DbtrAgt_Node' in TX_nodes and TX_nodes['BIC_DbtrAgt_Node'].text is not None:
+            TX_nodes['FinInstnId_DbtrAgt_Node'].append(
+                TX_nodes['BIC_DbtrAgt_Node'])
+        elif self.schema != 'pain.008.001.02' and self.schema != 'pain.008.002.02':
+            TX_nodes['Othr_DbtrAgt_Node'].append(
+                TX_nodes['Id_DbtrAgt_Node'])
+            TX_nodes['FinInstnId_DbtrAgt_Node'].append(
+                TX_nodes['Othr_DbtrAgt_Node'])
+        TX_nodes['DbtrAgtNode'].append(TX_nodes['FinInstnId_DbtrAgt_Node'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrAgtNode'])
+
+        TX_nodes['DbtrNode'].append(TX_nodes['Nm_Dbtr_Node'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrNode'])
+
+        TX_nodes['Id_DbtrAcct_Node'].append(TX_nodes['IBAN_DbtrAcct_Node'])
+        TX_nodes['DbtrAcctNode'].append(TX_nodes['Id_DbtrAcct_Node'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrAcctNode'])
+
+        TX_nodes['RmtInfNode'].append(TX_nodes['UstrdNode'])
+        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['RmtInfNode'])
+        return TX_nodes['DrctDbtTxInfNode']
+
+    def _add_non_batch(self, TX, PmtInf_nodes):
         """
         Method to add a transaction as non batch, will fold the transaction
-        together with the payment info node and append to the main xml.
+        together with the payment info node and append to the main xml. If
+        the transaction has been rendered by a template already, the payment
+        info node is rendered as well and kept as a fragment.
         """
         PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtInfIdNode'])
         PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtMtdNode'])
@@ -294,94 +561,31 @@ class SepaDD(SepaPaymentInitn):
             PmtInf_nodes['Id_CdtrSchmeId_Node'])
         PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrSchmeIdNode'])
 
-        TX_nodes['PmtIdNode'].append(TX_nodes['EndToEndIdNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['PmtIdNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['InstdAmtNode'])
-
-        TX_nodes['MndtRltdInfNode'].append(TX_nodes['MndtIdNode'])
-        TX_nodes['MndtRltdInfNode'].append(TX_nodes['DtOfSgntrNode'])
-        TX_nodes['DrctDbtTxNode'].append(TX_nodes['MndtRltdInfNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DrctDbtTxNode'])
-
-        if 'BIC_DbtrAgt_Node' in TX_nodes and TX_nodes['BIC_DbtrAgt_Node'].text is not None:
-            TX_nodes['FinInstnId_DbtrAgt_Node'].append(
-                TX_nodes['BIC_DbtrAgt_Node'])
-        elif self.schema != 'pain.008.001.02' and self.schema != 'pain.008.002.02':
-            TX_nodes['Othr_DbtrAgt_Node'].append(
-                TX_nodes['Id_DbtrAgt_Node'])
-            TX_nodes['FinInstnId_DbtrAgt_Node'].append(
-                TX_nodes['Othr_DbtrAgt_Node'])
-        TX_nodes['DbtrAgtNode'].append(TX_nodes['FinInstnId_DbtrAgt_Node'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrAgtNode'])
-
-        TX_nodes['DbtrNode'].append(TX_nodes['Nm_Dbtr_Node'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrNode'])
-
-        TX_nodes['Id_DbtrAcct_Node'].append(TX_nodes['IBAN_DbtrAcct_Node'])
-        TX_nodes['DbtrAcctNode'].append(TX_nodes['Id_DbtrAcct_Node'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrAcctNode'])
-
-        TX_nodes['RmtInfNode'].append(TX_nodes['UstrdNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['RmtInfNode'])
-        PmtInf_nodes['PmtInfNode'].append(TX_nodes['DrctDbtTxInfNode'])
-        CstmrDrctDbtInitn_node = self._xml.find('CstmrDrctDbtInitn')
-        CstmrDrctDbtInitn_node.append(PmtInf_nodes['PmtInfNode'])
-
-    def _add_batch(self, TX_nodes, payment):
-        """
-        Method to add a payment as a batch. The transaction details are already
-        present. Will fold the nodes accordingly and the call the
-        _add_to_batch_list function to store the batch.
-        """
-        TX_nodes['PmtIdNode'].append(TX_nodes['EndToEndIdNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['PmtIdNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['InstdAmtNode'])
-
-        TX_nodes['MndtRltdInfNode'].append(TX_nodes['MndtIdNode'])
-        TX_nodes['MndtRltdInfNode'].append(TX_nodes['DtOfSgntrNode'])
-        TX_nodes['DrctDbtTxNode'].append(TX_nodes['MndtRltdInfNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DrctDbtTxNode'])
-
-        if 'BIC_DbtrAgt_Node' in TX_nodes and TX_nodes['BIC_DbtrAgt_Node'].text is not None:
-            TX_nodes['FinInstnId_DbtrAgt_Node'].append(
-                TX_nodes['BIC_DbtrAgt_Node'])
-        elif self.schema != 'pain.008.001.02' and self.schema != 'pain.008.002.02':
-            TX_nodes['Othr_DbtrAgt_Node'].append(
-                TX_nodes['Id_DbtrAgt_Node'])
-            TX_nodes['FinInstnId_DbtrAgt_Node'].append(
-                TX_nodes['Othr_DbtrAgt_Node'])
-        TX_nodes['DbtrAgtNode'].append(TX_nodes['FinInstnId_DbtrAgt_Node'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrAgtNode'])
-
-        TX_nodes['DbtrNode'].append(TX_nodes['Nm_Dbtr_Node'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrNode'])
-
-        TX_nodes['Id_DbtrAcct_Node'].append(TX_nodes['IBAN_DbtrAcct_Node'])
-        TX_nodes['DbtrAcctNode'].append(TX_nodes['Id_DbtrAcct_Node'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['DbtrAcctNode'])
-
-        TX_nodes['RmtInfNode'].append(TX_nodes['UstrdNode'])
-        TX_nodes['DrctDbtTxInfNode'].append(TX_nodes['RmtInfNode'])
-        self._add_to_batch_list(TX_nodes, payment)
+        if self.serializer == 'template':
+            PmtInf = self.backend.tostring(PmtInf_nodes['PmtInfNode'])
+            self._fragments.append(PmtInf[:-len(b"</PmtInf>")] + TX + b"</PmtInf>")
+        else:
+            PmtInf_nodes['PmtInfNode'].append(TX)
+            CstmrDrctDbtInitn_node = self.backend.find(self._xml, 'CstmrDrctDbtInitn')
+            CstmrDrctDbtInitn_node.append(PmtInf_nodes['PmtInfNode'])
 
-    def _add_to_batch_list(self, TX, payment):
+    def _add_to_batch_list(self, TX, batch_key, amount):
         """
-        Method to add a transaction to the batch list. The correct batch will
-        be determined by the payment dict and the batch will be created if
-        not existant. This will also add the payment amount to the respective
-        batch total.
+        Method to add a transaction to the batch list. The batch will be
+        created if not existant. This will also add the payment amount to the
+        respective batch total.
         """
-        batch_key = payment['type'] + "::" + payment['collection_date']
         if batch_key in self._batches.keys():
-            self._batches[batch_key].append(TX['DrctDbtTxInfNode'])
+            self._batches[batch_key].append(TX)
         else:
             self._batches[batch_key] = []
-            self._batches[batch_key].append(TX['DrctDbtTxInfNode'])
+            self._batches[batch_key].append(TX)
 
         if batch_key in self._batch_totals:
-            self._batch_totals[batch_key] += payment['amount']
+            self._batch_totals[batch_key] += amount
         else:
-            self._batch_totals[batch_key] = payment['amount']
+            self._batch_totals[batch_key] = amount
+        self._add_payment_run(batch_key, self._nb_of_txs_total)
 
     def _finalize_batch(self):
         """
@@ -391,82 +595,91 @@ class SepaDD(SepaPaymentInitn):
         transaction nodes will be folded. Finally, the batches will be added to
         the main XML.
         """
+        CstmrDrctDbtInitn_node = self.backend.find(self._xml, 'CstmrDrctDbtInitn')
         for batch_meta, batch_nodes in self._batches.items():
-            batch_meta_split = batch_meta.split("::")
-            PmtInf_nodes = self._create_PmtInf_node()
+            PmtInf_node = self._create_batch_PmtInf_node(batch_meta, batch_nodes)
+            for txnode in batch_nodes:
+                PmtInf_node.append(txnode)
+            CstmrDrctDbtInitn_node.append(PmtInf_node)
+
+    def _create_batch_PmtInf_node(self, batch_meta, batch_nodes):
+        """
+        Method to create the PmtInf node of a single batch, filled with the
+        batch information but without the transaction nodes.
+        """
+        batch_meta_split = batch_meta.split("::")
+        PmtInf_nodes = self._create_PmtInf_node()
+        if self.deterministic:
+            PmtInf_nodes['PmtInfIdNode'].text = self._document_id("PmtInf", batch_meta)
+        else:
             PmtInf_nodes['PmtInfIdNode'].text = make_id(self._config['name'])
-            PmtInf_nodes['PmtMtdNode'].text = "DD"
-            PmtInf_nodes['BtchBookgNode'].text = "true"
-            PmtInf_nodes['Cd_SvcLvl_Node'].text = "SEPA"
-            PmtInf_nodes['Cd_LclInstrm_Node'].text = self._config['instrument']
-            PmtInf_nodes['SeqTpNode'].text = batch_meta_split[0]
-            PmtInf_nodes['ReqdColltnDtNode'].text = batch_meta_split[1]
-            PmtInf_nodes['Nm_Cdtr_Node'].text = self._config['name']
-            PmtInf_nodes['IBAN_CdtrAcct_Node'].text = self._config['IBAN']
+        PmtInf_nodes['PmtMtdNode'].text = "DD"
+        PmtInf_nodes['BtchBookgNode'].text = "true"
+        PmtInf_nodes['Cd_SvcLvl_Node'].text = "SEPA"
+        PmtInf_nodes['Cd_LclInstrm_Node'].text = self._config['instrument']
+        PmtInf_nodes['SeqTpNode'].text = batch_meta_split[0]
+        PmtInf_nodes['ReqdColltnDtNode'].text = batch_meta_split[1]
+        PmtInf_nodes['Nm_Cdtr_Node'].text = self._config['name']
+        PmtInf_nodes['IBAN_CdtrAcct_Node'].text = self._config['IBAN']
 
-            if 'BIC' in self._config:
-                PmtInf_nodes['BIC_CdtrAgt_Node'].text = self._config['BIC']
-            else:
-                PmtInf_nodes['Id_CdtrAgt_Node'].text = "NOTPROVIDED"
+        if 'BIC' in self._config:
+            PmtInf_nodes['BIC_CdtrAgt_Node'].text = self._config['BIC']
+        else:
+            PmtInf_nodes['Id_CdtrAgt_Node'].text = "NOTPROVIDED"
 
-            PmtInf_nodes['ChrgBrNode'].text = "SLEV"
-            PmtInf_nodes['Id_Othr_Node'].text = self._config['creditor_id']
-            PmtInf_nodes['PrtryNode'].text = "SEPA"
+        PmtInf_nodes['ChrgBrNode'].text = "SLEV"
+        PmtInf_nodes['Id_Othr_Node'].text = self._config['creditor_id']
+        PmtInf_nodes['PrtryNode'].text = "SEPA"
 
-            PmtInf_nodes['NbOfTxsNode'].text = str(len(batch_nodes))
-            PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(self._batch_totals[batch_meta])
-
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtInfIdNode'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtMtdNode'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['BtchBookgNode'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['NbOfTxsNode'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CtrlSumNode'])
-
-            PmtInf_nodes['SvcLvlNode'].append(PmtInf_nodes['Cd_SvcLvl_Node'])
-            PmtInf_nodes['LclInstrmNode'].append(
-                PmtInf_nodes['Cd_LclInstrm_Node'])
-            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SvcLvlNode'])
-            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['LclInstrmNode'])
-            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SeqTpNode'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtTpInfNode'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['ReqdColltnDtNode'])
-
-            PmtInf_nodes['CdtrNode'].append(PmtInf_nodes['Nm_Cdtr_Node'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrNode'])
-
-            PmtInf_nodes['Id_CdtrAcct_Node'].append(
-                PmtInf_nodes['IBAN_CdtrAcct_Node'])
-            PmtInf_nodes['CdtrAcctNode'].append(
-                PmtInf_nodes['Id_CdtrAcct_Node'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrAcctNode'])
+        PmtInf_nodes['NbOfTxsNode'].text = str(len(batch_nodes))
+        PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(self._batch_totals.get(batch_meta, 0))
 
-            if 'BIC' in self._config:
-                PmtInf_nodes['FinInstnId_CdtrAgt_Node'].append(
-                    PmtInf_nodes['BIC_CdtrAgt_Node'])
-            else:
-                PmtInf_nodes['Othr_CdtrAgt_Node'].append(
-                    PmtInf_nodes['Id_CdtrAgt_Node'])
-                PmtInf_nodes['FinInstnId_CdtrAgt_Node'].append(
-                    PmtInf_nodes['Othr_CdtrAgt_Node'])
-
-            PmtInf_nodes['CdtrAgtNode'].append(
-                PmtInf_nodes['FinInstnId_CdtrAgt_Node'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrAgtNode'])
-
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['ChrgBrNode'])
-
-            PmtInf_nodes['OthrNode'].append(PmtInf_nodes['Id_Othr_Node'])
-            PmtInf_nodes['SchmeNmNode'].append(PmtInf_nodes['PrtryNode'])
-            PmtInf_nodes['OthrNode'].append(PmtInf_nodes['SchmeNmNode'])
-            PmtInf_nodes['PrvtIdNode'].append(PmtInf_nodes['OthrNode'])
-            PmtInf_nodes['Id_CdtrSchmeId_Node'].append(
-                PmtInf_nodes['PrvtIdNode'])
-            PmtInf_nodes['CdtrSchmeIdNode'].append(
-                PmtInf_nodes['Id_CdtrSchmeId_Node'])
-            PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrSchmeIdNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtInfIdNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtMtdNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['BtchBookgNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['NbOfTxsNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CtrlSumNode'])
 
-            for txnode in batch_nodes:
-                PmtInf_nodes['PmtInfNode'].append(txnode)
+        PmtInf_nodes['SvcLvlNode'].append(PmtInf_nodes['Cd_SvcLvl_Node'])
+        PmtInf_nodes['LclInstrmNode'].append(
+            PmtInf_nodes['Cd_LclInstrm_Node'])
+        PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SvcLvlNode'])
+        PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['LclInstrmNode'])
+        PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SeqTpNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['PmtTpInfNode'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['ReqdColltnDtNode'])
 
-            CstmrDrctDbtInitn_node = self._xml.find('CstmrDrctDbtInitn')
-            CstmrDrctDbtInitn_node.append(PmtInf_nodes['PmtInfNode'])
+        PmtInf_nodes['CdtrNode'].append(PmtInf_nodes['Nm_Cdtr_Node'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrNode'])
+
+        PmtInf_nodes['Id_CdtrAcct_Node'].append(
+            PmtInf_nodes['IBAN_CdtrAcct_Node'])
+        PmtInf_nodes['CdtrAcctNode'].append(
+            PmtInf_nodes['Id_CdtrAcct_Node'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrAcctNode'])
+
+        if 'BIC' in self._config:
+            PmtInf_nodes['FinInstnId_CdtrAgt_Node'].append(
+                PmtInf_nodes['BIC_CdtrAgt_Node'])
+        else:
+            PmtInf_nodes['Othr_CdtrAgt_Node'].append(
+                PmtInf_nodes['Id_CdtrAgt_Node'])
+            PmtInf_nodes['FinInstnId_CdtrAgt_Node'].append(
+                PmtInf_nodes['Othr_CdtrAgt_Node'])
+
+        PmtInf_nodes['CdtrAgtNode'].append(
+            PmtInf_nodes['FinInstnId_CdtrAgt_Node'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrAgtNode'])
+
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['ChrgBrNode'])
+
+        PmtInf_nodes['OthrNode'].append(PmtInf_nodes['Id_Othr_Node'])
+        PmtInf_nodes['SchmeNmNode'].append(PmtInf_nodes['PrtryNode'])
+        PmtInf_nodes['OthrNode'].append(PmtInf_nodes['SchmeNmNode'])
+        PmtInf_nodes['PrvtIdNode'].append(PmtInf_nodes['OthrNode'])
+        PmtInf_nodes['Id_CdtrSchmeId_Node'].append(
+            PmtInf_nodes['PrvtIdNode'])
+        PmtInf_nodes['CdtrSchmeIdNode'].append(
+            PmtInf_nodes['Id_CdtrSchmeId_Node'])
+        PmtInf_nodes['PmtInfNode'].append(PmtInf_nodes['CdtrSchmeIdNode'])
+        return PmtInf_nodes['PmtInfNode']
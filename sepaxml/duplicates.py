@@ -0,0 +1,132 @@
+"""
+Detection of payments that are added twice, e.g. by retries of the system
+that produces them. The keys of all added transactions are kept in hash sets,
+so every check takes constant time per payment.
+"""
+
+
+def _debit_endtoend_id(values, batch_key):
+    return values[0]
+
+
+def _debit_mandate(values, batch_key):
+    # The mandate id, the amount and the collection date of the batch key.
+    return values[2], values[1], batch_key.split("::")[1]
+
+
+def _transfer_endtoend_id(values, batch_key):
+    if values[1] == 'NOTPROVIDED':
+        return None
+    return values[1]
+
+
+def _transfer_account(values, batch_key):
+    # The IBAN, the amount and the execution date.
+    return values[5], values[2], batch_key
+
+
+# The key functions of the builders by name. A key function returns the key
+# of a transaction from its field values and its batch key, None if the
+# transaction has no such key.
+DEBIT_KEYS = {
+    "endtoend_id": _debit_endtoend_id,
+    "mandate": _debit_mandate,
+}
+
+TRANSFER_KEYS = {
+    "endtoend_id": _transfer_endtoend_id,
+    "account": _transfer_account,
+}
+
+
+class DuplicateIndex:
+    """
+    Hash index of the keys of all transactions that are added to one or more
+    documents, e.g. all files of a RolloverWriter.
+    """
+
+    def __init__(self, keys=("endtoend_id",), report=False):
+        """
+        Constructor.
+        @param keys: The keys to check, names of the key functions of the
+        builders ("endtoend_id", "mandate" for SepaDD, "account" for
+        SepaTransfer) or tuples of a name and a key function, which gets the
+        field values and the batch key of a transaction.
+        @param report: False to reject duplicates with an exception, True to
+        add them and collect them in duplicates.
+        """
+        self.keys = keys
+        self.report = report
+        self.duplicates = []  # Tuples of the transaction number, the key name and the key.
+        self.count = 0  # Number of transactions in the index.
+        self._functions = None
+        self._seen = {}
+
+    def __len__(self):
+        return self.count
+
+    def bind(self, key_functions):
+        """
+        Resolve the key names with the key functions of a builder.
+        @param key_functions: dict of key functions by name
+        @raise exception: when a key name is unknown
+        """
+        functions = []
+        for key in self.keys:
+            if isinstance(key, str):
+                if key not in key_functions:
+                    raise Exception("Unknown duplicate key: " + key)
+                key = (key, key_functions[key])
+            functions.append(key)
+            self._seen.setdefault(key[0], set())
+        self._functions = functions
+
+    def check(self, entries):
+        """
+        Compute the keys of transactions and check them against the index and
+        against each other. The keys are not added to the index yet.
+        @param entries: list of tuples of the field values and the batch key
+        @return: list of the keys of every transaction for insert
+        @raise exception: when a transaction is a duplicate and report is
+        False
+        """
+        keys = [
+            tuple(function(values, batch_key) for name, function in self._functions)
+            for values, batch_key in entries
+        ]
+        if not self.report:
+            for i, (name, function) in enumerate(self._functions):
+                column = [key[i] for key in keys if key[i] is not None]
+                if len(set(column)) != len(column) or not self._seen[name].isdisjoint(column):
+                    raise Exception('Payment did not validate: DUPLICATE_' + name.upper())
+        return keys
+
+    def insert(self, keys):
+        """
+        Add the keys of transactions that have been added to the index. In
+        report mode, the duplicates are collected.
+        @param keys: list of keys returned by check
+        """
+        if self.report:
+            for number, key in enumerate(keys, self.count):
+                for (name, function), value in zip(self._functions, key):
+                    if value is None:
+                        continue
+                    seen = self._seen[name]
+                    if value in seen:
+                        self.duplicates.append((number, name, value))
+                    else:
+                        seen.add(value)
+        else:
+            for i, (name, function) in enumerate(self._functions):
+                self._seen[name].update(key[i] for key in keys if key[i] is not None)
+        self.count += len(keys)
+
+    def clear(self):
+        """
+        Empty the index and the collected duplicates.
+        """
+        self.duplicates = []
+        self.count = 0
+        for seen in self._seen.values():
+            seen.clear()
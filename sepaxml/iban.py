@@ -0,0 +1,112 @@
+"""
+Normalization and checks of IBANs and BICs: the format, the length of the
+IBAN for its country, the mod-97 checksum and whether the BIC belongs to the
+country of the IBAN.
+"""
+import re
+import string
+
+from .columns import is_missing, to_list
+
+# The length of the IBAN per country according to the SWIFT IBAN registry.
+IBAN_LENGTHS = {
+    "AD": 24, "AE": 23, "AL": 28, "AT": 20, "AZ": 28, "BA": 20, "BE": 16, "BG": 22, "BH": 22, "BI": 27,
+    "BR": 29, "BY": 28, "CH": 21, "CR": 22, "CY": 28, "CZ": 24, "DE": 22, "DJ": 27, "DK": 18, "DO": 28,
+    "EE": 20, "EG": 29, "ES": 24, "FI": 18, "FK": 18, "FO": 18, "FR": 27, "GB": 22, "GE": 22, "GI": 23,
+    "GL": 18, "GR": 27, "GT": 28, "HR": 21, "HU": 28, "IE": 22, "IL": 23, "IQ": 23, "IS": 26, "IT": 27,
+    "JO": 30, "KW": 30, "KZ": 20, "LB": 28, "LC": 32, "LI": 21, "LT": 20, "LU": 20, "LV": 21, "LY": 25,
+    "MC": 27, "MD": 24, "ME": 22, "MK": 19, "MN": 20, "MR": 27, "MT": 31, "MU": 30, "NI": 28, "NL": 18,
+    "NO": 15, "OM": 23, "PK": 24, "PL": 28, "PS": 29, "PT": 25, "QA": 29, "RO": 24, "RS": 22, "RU": 33,
+    "SA": 24, "SC": 31, "SD": 18, "SE": 24, "SI": 19, "SK": 24, "SM": 27, "SO": 23, "ST": 25, "SV": 28,
+    "TL": 23, "TN": 24, "TR": 26, "UA": 29, "VA": 22, "VG": 24, "XK": 20, "YE": 30,
+}
+
+# Countries and territories whose banks have BICs with their own country
+# code, but use the IBANs of another country.
+IBAN_COUNTRIES = {
+    "AX": "FI",
+    "BL": "FR", "GF": "FR", "GP": "FR", "MF": "FR", "MQ": "FR", "NC": "FR", "PF": "FR", "PM": "FR",
+    "RE": "FR", "TF": "FR", "WF": "FR", "YT": "FR",
+    "GG": "GB", "IM": "GB", "JE": "GB",
+}
+
+# Translation table that replaces every letter with its number for mod-97.
+_LETTERS = str.maketrans({letter: str(number) for number, letter in enumerate(string.ascii_uppercase, 10)})
+
+_IBAN_FORMAT = re.compile(r"[A-Z]{2}[0-9]{2}[A-Z0-9]{1,30}")
+_BIC_FORMAT = re.compile(r"[A-Z]{6}[A-Z0-9]{2}(?:[A-Z0-9]{3})?")
+
+
+def normalize_iban(iban):
+    """
+    Remove the spaces of the printed format and convert to upper case.
+    """
+    return iban.replace(" ", "").upper()
+
+
+def iban_error(iban):
+    """
+    Check a normalized IBAN.
+    @return: None if the IBAN is valid, the error code otherwise
+    """
+    if not _IBAN_FORMAT.fullmatch(iban):
+        return "IBAN_INVALID_FORMAT"
+    length = IBAN_LENGTHS.get(iban[:2])
+    if length is None:
+        return "IBAN_UNKNOWN_COUNTRY"
+    if len(iban) != length:
+        return "IBAN_INVALID_LENGTH"
+    if int((iban[4:] + iban[:4]).translate(_LETTERS)) % 97 != 1:
+        return "IBAN_INVALID_CHECKSUM"
+    return None
+
+
+def bic_error(bic, iban):
+    """
+    Check a BIC and whether it belongs to the country of a valid IBAN.
+    @return: None if the BIC is valid, the error code otherwise
+    """
+    if not _BIC_FORMAT.fullmatch(bic):
+        return "BIC_INVALID_FORMAT"
+    country = bic[4:6]
+    if IBAN_COUNTRIES.get(country, country) != iban[:2]:
+        return "BIC_COUNTRY_MISMATCH"
+    return None
+
+
+def check_account(iban, bic=None):
+    """
+    Normalize and check an IBAN and the BIC, if given.
+    @return: tuple of the normalized IBAN and None if both are valid, the
+    error code otherwise
+    """
+    iban = normalize_iban(iban)
+    error = iban_error(iban)
+    if error is None and bic:
+        error = bic_error(bic, iban)
+    return iban, error
+
+
+def check_accounts(ibans, bics=None):
+    """
+    Normalize and check whole columns of IBANs and BICs at once, e.g. lists,
+    NumPy arrays or pandas Series.
+    @param bics: Optional column of BICs, empty values are not checked
+    @return: tuple of the list of normalized IBANs and a list of tuples of the
+    row and the error code for every invalid row
+    """
+    ibans = [normalize_iban(iban) for iban in to_list(ibans)]
+    errors = []
+    for row, iban in enumerate(ibans):
+        error = iban_error(iban)
+        if error is not None:
+            errors.append((row, error))
+    if bics is not None:
+        invalid = set(row for row, error in errors)
+        for row, (iban, bic) in enumerate(zip(ibans, to_list(bics))):
+            if bic and not is_missing(bic) and row not in invalid:
+                error = bic_error(bic, iban)
+                if error is not None:
+                    errors.append((row, error))
+        errors.sort()
+    return ibans, errors
@@ -0,0 +1,138 @@
+"""
+Generators for the random part of the ids of a document (MsgId, PmtInfId,
+EndToEndId). Every generator returns tokens of TOKEN_LENGTH characters, which
+keeps the ids within the 35 characters allowed by the schemas. The generator
+that is used by make_id and make_msg_id can be replaced process-wide with
+set_generator.
+"""
+import os
+import threading
+import time
+
+TOKEN_LENGTH = 12
+
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+class IdGenerator:
+    """
+    Base class of the id generators.
+    """
+
+    def token(self):
+        """
+        @return: A new token of TOKEN_LENGTH characters
+        """
+        raise NotImplementedError()
+
+    def tokens(self, count):
+        """
+        @return: A list of count new tokens
+        """
+        return [self.token() for i in range(count)]
+
+
+class BulkRandomGenerator(IdGenerator):
+    """
+    Random hex tokens like get_rand_string, but the entropy is drawn from
+    os.urandom in blocks of block_size bytes instead of once per character.
+    Forked processes draw a new block, so they never repeat the tokens of
+    their parent.
+    """
+
+    def __init__(self, block_size=4096):
+        self.block_size = max(block_size, TOKEN_LENGTH)
+        self._lock = threading.Lock()
+        self._buffer = ""
+        self._position = 0
+        self._pid = None
+
+    def token(self):
+        return self.tokens(1)[0]
+
+    def tokens(self, count):
+        result = []
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._buffer = ""
+            while len(result) < count:
+                available = (len(self._buffer) - self._position) // TOKEN_LENGTH
+                if not available:
+                    self._buffer = os.urandom(self.block_size).hex()
+                    self._position = 0
+                    continue
+                start = self._position
+                self._position += min(available, count - len(result)) * TOKEN_LENGTH
+                buffer = self._buffer
+                result.extend(buffer[i:i + TOKEN_LENGTH] for i in range(start, self._position, TOKEN_LENGTH))
+        return result
+
+
+class SnowflakeGenerator(IdGenerator):
+    """
+    Monotonic tokens that are unique without any randomness: two base36
+    characters of the worker number followed by ten base36 characters of the
+    milliseconds since EPOCH and a sequence number within the millisecond.
+    Tokens of one generator always increase, even if the clock goes back.
+    Processes that run at the same time need different worker numbers, by
+    default the worker number is derived from the process id. The tokens
+    fit until 2051.
+    """
+    EPOCH = 1704067200000  # 2024-01-01 00:00 UTC in milliseconds
+    SEQUENCE_BITS = 12
+    WORKERS = 36 ** 2
+
+    def __init__(self, worker=None):
+        """
+        Constructor.
+        @param worker: Optional worker number below 1296
+        @raise exception: when the worker number is out of range
+        """
+        if worker is not None and not 0 <= worker < self.WORKERS:
+            raise Exception("The worker number has to be between 0 and %d." % (self.WORKERS - 1))
+        self.worker = worker
+        self._lock = threading.Lock()
+        self._last = 0
+        self._pid = None
+        self._prefix = None
+
+    def token(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                worker = self.worker if self.worker is not None else self._pid % self.WORKERS
+                self._prefix = _base36(worker, 2)
+            now = (int(time.time() * 1000) - self.EPOCH) << self.SEQUENCE_BITS
+            self._last = max(now, self._last + 1)
+            return self._prefix + _base36(self._last, TOKEN_LENGTH - 2)
+
+
+def _base36(number, width):
+    digits = []
+    for i in range(width):
+        number, digit = divmod(number, 36)
+        digits.append(_BASE36[digit])
+    return "".join(reversed(digits))
+
+
+_generator = BulkRandomGenerator()
+
+
+def get_generator():
+    """
+    @return: The id generator that is currently used
+    """
+    return _generator
+
+
+def set_generator(generator):
+    """
+    Replace the id generator for all ids that are made from now on.
+    @param generator: An IdGenerator
+    @return: The previous generator
+    """
+    global _generator
+    previous = _generator
+    _generator = generator
+    return previous
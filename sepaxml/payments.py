@@ -0,0 +1,106 @@
+import datetime
+
+
+class DirectDebitPayment:
+    """
+    A direct debit payment for SepaDD as a compact record instead of a payment
+    dict. The values are validated once when the record is created, the
+    builder reads them as they are and never changes the record, so it can be
+    kept and added to several documents.
+    @param amount: The amount in cents
+    @param type: The sequence type, e.g. FRST or RCUR
+    @param collection_date: datetime.date
+    @param mandate_date: datetime.date
+    @param BIC: Optional, the BIC of the debtor
+    @param endtoend_id: Optional, a random id is generated if missing
+    @raise exception: when a value is invalid
+    """
+    __slots__ = (
+        "name", "IBAN", "BIC", "amount", "type", "collection_date", "mandate_id", "mandate_date", "description",
+        "endtoend_id",
+    )
+
+    def __init__(self, name, IBAN, amount, type, collection_date, mandate_id, mandate_date, description,
+                 BIC=None, endtoend_id=None):
+        validation = ""
+
+        if not isinstance(amount, int):
+            validation += "AMOUNT_NOT_INTEGER "
+
+        if not isinstance(mandate_date, datetime.date):
+            validation += "MANDATE_DATE_INVALID_OR_NOT_DATETIME_INSTANCE"
+
+        if not isinstance(collection_date, datetime.date):
+            validation += "COLLECTION_DATE_INVALID_OR_NOT_DATETIME_INSTANCE"
+
+        if validation != "":
+            raise Exception('Payment did not validate: ' + validation)
+
+        self.name = name
+        self.IBAN = IBAN
+        self.BIC = BIC
+        self.amount = amount
+        self.type = type
+        self.collection_date = collection_date
+        self.mandate_id = mandate_id
+        self.mandate_date = mandate_date
+        self.description = description
+        self.endtoend_id = endtoend_id
+
+
+class CreditTransferPayment:
+    """
+    A credit transfer payment for SepaTransfer as a compact record instead of
+    a payment dict. The values are validated once when the record is created,
+    the builder reads them as they are and never changes the record.
+    @param amount: The amount in cents
+    @param description: The unstructured remittance information, either
+    description or document is required
+    @param document: List of invoice dicts for structured remittance
+    information, the dates are converted into strings when the record is
+    created
+    @param BIC: Optional, the BIC of the creditor
+    @param execution_date: Optional datetime.date, the execution date of the
+    config is used if missing
+    @param endtoend_id: Optional, NOTPROVIDED is used if missing
+    @raise exception: when a value is invalid
+    """
+    __slots__ = ("name", "IBAN", "BIC", "amount", "description", "document", "execution_date", "endtoend_id")
+
+    def __init__(self, name, IBAN, amount, description=None, document=None, BIC=None, execution_date=None,
+                 endtoend_id=None):
+        validation = ""
+
+        if description is None and document is None:
+            validation += "DESCRIPTION_OR_DOCUMENT_REQUIRED"
+        if description is not None and document is not None:
+            validation += "DESCRIPTION_AND_DOCUMENT_DONT_CO-EXIST"
+
+        if not isinstance(amount, int):
+            validation += "AMOUNT_NOT_INTEGER "
+
+        if document is not None:
+            invoices = []
+            for invoice in document:
+                if 'date' in invoice:
+                    if not isinstance(invoice['date'], datetime.date):
+                        validation += "INVOICE_DATE_INVALID_OR_NOT_DATETIME_INSTANCE"
+                        continue
+                    invoice = dict(invoice, date=invoice['date'].isoformat())
+                invoices.append(invoice)
+            document = invoices
+
+        if execution_date is not None and not isinstance(execution_date, datetime.date):
+            validation += "EXECUTION_DATE_INVALID_OR_NOT_DATETIME_INSTANCE"
+
+        if validation != "":
+            raise Exception('Payment did not validate: ' + validation)
+
+        self.name = name
+        self.IBAN = IBAN
+        self.BIC = BIC
+        self.amount = amount
+        self.description = description
+        self.document = document
+        self.execution_date = execution_date
+        self.endtoend_id = endtoend_id
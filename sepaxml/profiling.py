@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from time import perf_counter
+
+# The phases of the payment pipeline in order and the methods of the builder
+# that are timed for each of them.
+PHASES = OrderedDict([
+    ("add_payment", ("add_payment", "add_payments", "add_columns")),
+    ("clean", ("_clean_payment", "_clean_record", "_clean_columns")),
+    ("check", ("check_payment",)),
+    ("create_TX", ("_create_TX_node_from",)),
+    ("finalize", ("_finalize_batch",)),
+    ("export", ("export",)),
+    ("serialize", ()),
+    ("validate", ("_validate_parallel",)),
+])
+
+# The phases that are timed on the serialization backend of the builder.
+BACKEND_PHASES = OrderedDict([
+    ("serialize", ("tostring",)),
+    ("validate", ("validate",)),
+])
+
+
+class Profiler:
+    """
+    Records the wall time and the number of calls of every phase of the
+    payment pipeline of a builder. The timed methods are replaced on the
+    builder instance and its backend only, so builders without a profiler run
+    the plain methods without any overhead.
+    """
+
+    def __init__(self, callback=None):
+        """
+        Constructor.
+        @param callback: Optional function that is called with the name of
+        the phase and the wall time in seconds after every timed call.
+        """
+        self.callback = callback
+        self.stats = OrderedDict()
+
+    def attach(self, builder):
+        """
+        Replace the methods of the builder and its backend with timed wrappers.
+        """
+        for phases, target in ((PHASES, builder), (BACKEND_PHASES, builder.backend)):
+            for phase, names in phases.items():
+                self.stats.setdefault(phase, {'calls': 0, 'time': 0.0})
+                for name in names:
+                    method = getattr(target, name, None)
+                    if method is not None:
+                        setattr(target, name, self._timed(phase, method))
+
+    def report(self):
+        """
+        @return: dict with the number of calls and the wall time in seconds
+        per phase, in pipeline order. The time of a phase includes the phases
+        that it calls, e.g. export includes finalize and serialize.
+        """
+        return OrderedDict((phase, dict(stats)) for phase, stats in self.stats.items())
+
+    def record(self, phase, elapsed):
+        """
+        Add a call of a phase that has been timed elsewhere.
+        @param elapsed: The wall time of the call in seconds
+        """
+        stats = self.stats[phase]
+        stats['calls'] += 1
+        stats['time'] += elapsed
+        if self.callback is not None:
+            self.callback(phase, elapsed)
+
+    def time_future(self, phase, future):
+        """
+        Record a call of a phase that runs in an executor, from its submission
+        until it is done, in this process. The work itself is not wrapped, so
+        it can be pickled for a process pool.
+        """
+        start = perf_counter()
+        future.add_done_callback(lambda future: self.record(phase, perf_counter() - start))
+
+    def _timed(self, phase, method):
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.record(phase, perf_counter() - start)
+        return timed
@@ -0,0 +1,131 @@
+from .shared import SizeLimitExceeded
+
+
+class RolloverWriter:
+    """
+    Writer that splits a large run of payments into several SEPA documents.
+    A new document with its own MsgId and group header totals is started
+    whenever the next transaction would exceed the transaction count or the
+    byte limit of a file. Every finished document is written to its own file
+    right away, so only one document is kept in memory at a time.
+
+    The byte limit is kept with an upper bound of the document size, the
+    transactions are measured as they are added and the group header and the
+    PmtInf block of every batch are measured once, with room for their
+    checksums. The files can therefore end up a little smaller than
+    necessary, but never larger than max_bytes.
+    """
+
+    def __init__(self, builder_class, config, path_pattern, max_transactions=None, max_bytes=None, validate=True,
+                 **kwargs):
+        """
+        Constructor.
+        @param builder_class: SepaDD or SepaTransfer
+        @param config: The config dict, every document gets its own copy.
+        @param path_pattern: The path of the files, formatted with the running
+        number of the file as index, e.g. "debit-{index:03d}.xml"
+        @param max_transactions: The maximum number of transactions per file
+        @param max_bytes: The maximum size of a file in bytes
+        @param validate: Whether every document is validated before it is
+        written. Otherwise the document is streamed into the file.
+        @param kwargs: Further arguments for the builder, e.g. schema
+        """
+        self.builder_class = builder_class
+        self.config = config
+        self.path_pattern = path_pattern
+        self.max_transactions = max_transactions
+        self.max_bytes = max_bytes
+        self.validate = validate
+        self.kwargs = kwargs
+        self.files = []  # Will contain the paths of the written files.
+        self._builder = None  # The document that is currently being filled.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def add_payment(self, payment):
+        """
+        Function to add a payment to the current document, a new document is
+        started if it is full.
+        @param payment: The payment dict or a payment record
+        @raise exception: when the payment is invalid or does not fit into an
+        empty document
+        """
+        if self._builder is not None and self.max_transactions is not None:
+            if self._builder._nb_of_txs_total >= self.max_transactions:
+                self._write()
+        if self._builder is None:
+            self._builder = self._new_builder()
+        if self.max_bytes is None:
+            self._builder.add_payment(payment)
+            return
+
+        # The builder cleans and converts payment dicts in place, so it gets a
+        # copy in case the payment has to be added to the next document.
+        try:
+            self._builder.add_payment(_copy_payment(payment))
+        except SizeLimitExceeded:
+            if not self._builder._nb_of_txs_total:
+                raise
+            self._write()
+            self._builder = self._new_builder()
+            self._builder.add_payment(payment)
+
+    def add_payments(self, payments):
+        """
+        Function to add many payments, see add_payment.
+        @param payments: Iterable of payment dicts or payment records
+        @return: The number of added payments
+        """
+        count = 0
+        for payment in payments:
+            self.add_payment(payment)
+            count += 1
+        return count
+
+    def close(self):
+        """
+        Function to write the last document.
+        @return: The paths of all written files
+        """
+        if self._builder is not None and self._builder._nb_of_txs_total:
+            self._write()
+        self._builder = None
+        return self.files
+
+    def _new_builder(self):
+        builder = self.builder_class(dict(self.config), **self.kwargs)
+        builder._max_bytes = self.max_bytes
+        return builder
+
+    def _write(self):
+        """
+        Method to write the current document into the next file and release
+        it.
+        """
+        path = self.path_pattern.format(index=len(self.files) + 1)
+        with open(path, "wb") as f:
+            if self.validate:
+                f.write(self._builder.export())
+            else:
+                for chunk in self._builder.iter_export():
+                    f.write(chunk)
+        self.files.append(path)
+        self._builder = None
+
+
+def _copy_payment(payment):
+    """
+    Helper to copy a payment dict with its invoices, records are never
+    changed by the builders.
+    """
+    if not isinstance(payment, dict):
+        return payment
+    payment = dict(payment)
+    if payment.get('document'):
+        payment['document'] = [dict(invoice) for invoice in payment['document']]
+    return payment
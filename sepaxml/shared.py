@@ -1,34 +1,134 @@
-import xml.etree.ElementTree as ET
+import datetime
+import hashlib
 from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import chain
+
+from .backends import get_backend
+from .cleaning import text_cleaner
+from .columns import clean_column, column_sum, group_rows
+from .facets import field_checks
+from .iban import check_account, check_accounts
+from .profiling import Profiler
+from .utils import (chunked, fork_context, int_to_decimal_str, make_content_id,
+                    make_id, make_msg_id)
+from .validation import (ValidationError, try_valid_xml_parallel,
+                         validation_executor)
+
+XML_DECLARATION = b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+
+# Upper bounds for the bytes that the MsgId and the checksums (NbOfTxs with up
+# to 15 digits, CtrlSum with up to 18 digits and the point) can add to the
+# measured size of an empty group header or PmtInf block.
+MSG_ID_SIZE = 35
+CHECKSUM_SIZE = 15 + 18 + 1
+
+# The builder whose document is being exported with workers, only set in the
+# forked worker processes by their initializer.
+_fork_builder = None
+
+
+class SizeLimitExceeded(Exception):
+    """
+    Raised when a transaction would make the document larger than its byte
+    limit. The transaction has not been added then.
+    """
 
-from utils import decimal_str_to_int, int_to_decimal_str, make_msg_id, make_id
-from validation import try_valid_xml
 
 class SepaPaymentInitn:
 
-    def __init__(self, config, schema, clean=True):
+    def __init__(self, config, schema, clean=True, serializer="etree", backend="etree", cleaner=None,
+                 check_iban=False, bank_directory=None, deterministic=False, duplicates=None, check_fields=False):
         """
         Constructor. Checks the config, prepares the document and
         builds the header.
         @param param: The config dict.
+        @param serializer: "etree" to build every transaction as ElementTree
+        nodes, "template" to render it with a pre-compiled byte template,
+        "deferred" to keep only the field values of batch transactions and
+        build their nodes one at a time on export.
+        @param backend: The library to build and serialize the nodes with,
+        "etree" for xml.etree.ElementTree or "lxml" (requires lxml).
+        @param cleaner: The TextCleaner for the clean option, the
+        process-wide one if missing.
+        @param check_iban: Whether the IBANs are normalized and checked (mod-97
+        checksum and length) and the BICs are checked against the country of
+        their IBAN, for the config and all payments.
+        @param bank_directory: Optional BankDirectory to look up the BIC of
+        payments without one.
+        @param deterministic: Whether the MsgId, PmtInfIds and missing
+        EndToEndIds are derived from a hash of the config and the payments
+        instead of being random, so that the same config and payments always
+        result in the same document. Requires creation_datetime in the config.
+        @param duplicates: Optional DuplicateIndex to reject or report payments
+        that are added twice.
+        @param check_fields: Whether the config and every transaction are
+        checked against the lengths, patterns and enumerations of the schema
+        when they are added, so that an illegal value is rejected with its
+        field instead of failing the validation of the whole document.
         @raise exception: When the config file is invalid.
         """
         self._config = None  # Will contain the config file.
         self._xml = None  # Will contain the final XML file.
         self._batches = OrderedDict()  # Will contain the SEPA batches.
         self._batch_totals = OrderedDict()  # Will contain the total amount to debit per batch for checksum total.
+        self._nb_of_txs_total = 0  # Running number of transactions for the group header.
+        self._ctrl_sum_total = 0  # Running amount of all transactions for the group header.
+        self._fragments = []  # Will contain pre-rendered nodes that follow the nodes of the XML tree.
+        self._TX_templates = {}  # Will contain the compiled byte templates per transaction variant.
+        self._max_bytes = None  # Byte limit for the document, the size is only measured if set.
+        self._size = None  # Upper bound for the size of the document while it is measured.
+        self._PmtInf_sizes = {}  # Upper bounds for the size of the PmtInf blocks without transactions per batch.
+        self._profiler = None  # Will contain the Profiler if profiling is enabled.
+        self._config_digest = None  # Will contain the hash of the config in deterministic mode.
+        self._digest = ""  # Running hash of all transactions in deterministic mode.
+        self._derived = 0  # Number of ids derived since payments were last added in deterministic mode.
+        self._payment_runs = OrderedDict()  # Will contain the runs of consecutive payment numbers per batch.
         self.schema = schema
         self.msg_id = make_msg_id()
         self.clean = clean
+        self.cleaner = cleaner or text_cleaner
+        self.check_iban = check_iban
+        self.bank_directory = bank_directory
+        self.deterministic = deterministic
+        self.duplicates = duplicates
+        self.check_fields = check_fields
+        if duplicates is not None:
+            duplicates.bind(self.duplicate_keys)
+        if serializer not in ("etree", "template", "deferred"):
+            raise Exception("Unknown serializer: " + serializer)
+        self.serializer = serializer
+        if serializer == "template" and backend != "etree":
+            raise Exception("The template serializer requires the etree backend.")
+        self.backend_name = backend
+        self.backend = None  # Will contain the serialization backend, set up with the document.
 
         config_result = self.check_config(config)
         if config_result:
             self._config = config
+            if 'creation_datetime' in config:
+                if not isinstance(config['creation_datetime'], datetime.datetime):
+                    raise Exception("Config file did not validate. CREATION_DATETIME_INVALID_OR_NOT_DATETIME_INSTANCE")
+            elif self.deterministic:
+                raise Exception("Config file did not validate. CREATION_DATETIME_MISSING")
             if self.clean:
-                from text_unidecode import unidecode
-
-                self._config['name'] = unidecode(self._config['name'])[:70]
-                self._config["unique_id"] = make_id(self._config['name'])
+                self._config['name'] = self.cleaner.clean(self._config['name'], 70)
+            if self.check_iban:
+                IBAN, error = check_account(self._config['IBAN'], self._config.get('BIC'))
+                if error is not None:
+                    raise Exception("Config file did not validate. " + error)
+                self._config['IBAN'] = IBAN
+            if self.check_fields:
+                self._compile_field_checks()
+                values = tuple(self._config.get(field) for field, path in self.config_fields)
+                self._check_fields(self._config_checks, values, "Config file did not validate. ")
+            if self.deterministic:
+                self._config_digest = hashlib.sha256(repr(sorted(self._config.items())).encode('utf-8')).hexdigest()
+            if self.clean:
+                if self.deterministic:
+                    self._config["unique_id"] = make_content_id(self._config['name'], self._config_digest)
+                else:
+                    self._config["unique_id"] = make_id(self._config['name'])
 
         self._prepare_document()
         self._create_header()
@@ -39,32 +139,17 @@ class SepaPaymentInitn:
         """
 
         if (self.schema == 'CBIPaymentRequest.00.04.00'):
-            self._xml = ET.Element("CBIPaymentRequest")
-            self._xml.set("xsi:schemaLocation",
-                          "urn:CBI:xsd:CBIPaymentRequest.00.04.00 " + self.schema + ".xsd")
-            self._xml.set("xmlns",
-                          "urn:CBI:xsd:" + self.schema)
-            self._xml.set("xmlns:xsi",
-                          "http://www.w3.org/2001/XMLSchema-instance")
-            ET.register_namespace("",
-                                  "urn:CBI:xsd:" + self.schema)
-            ET.register_namespace("xsi",
-                                  "http://www.w3.org/2001/XMLSchema-instance")
-            n1 = ET.Element(self.root_el_g)
+            self.backend = get_backend(self.backend_name, "urn:CBI:xsd:" + self.schema)
+            self._xml = self.backend.document(
+                "CBIPaymentRequest", "urn:CBI:xsd:CBIPaymentRequest.00.04.00 " + self.schema + ".xsd")
+            n1 = self.backend.Element(self.root_el_g)
             self._xml.append(n1)
-            n2 = ET.Element(self.root_el_p)
+            n2 = self.backend.Element(self.root_el_p)
             self._xml.append(n2)
         else :
-            self._xml = ET.Element("Document")
-            self._xml.set("xmlns",
-                          "urn:iso:std:iso:20022:tech:xsd:" + self.schema)
-            self._xml.set("xmlns:xsi",
-                          "http://www.w3.org/2001/XMLSchema-instance")
-            ET.register_namespace("",
-                                  "urn:iso:std:iso:20022:tech:xsd:" + self.schema)
-            ET.register_namespace("xsi",
-                                  "http://www.w3.org/2001/XMLSchema-instance")
-            n = ET.Element(self.root_el)
+            self.backend = get_backend(self.backend_name, "urn:iso:std:iso:20022:tech:xsd:" + self.schema)
+            self._xml = self.backend.document("Document")
+            n = self.backend.Element(self.root_el)
             self._xml.append(n)
 
     def _create_header(self):
@@ -73,54 +158,678 @@ class SepaPaymentInitn:
     def _finalize_batch(self):
         raise NotImplementedError()
 
-    def export(self, validate=True):
+    def add_payments(self, payments, chunk_size=1000):
+        """
+        Function to add many payments at once, e.g. for payroll runs. The
+        payments are taken from the iterable in chunks, every chunk is cleaned
+        and validated as a whole before any of its payments is added. If a
+        payment is invalid, none of the payments of its chunk are added, the
+        payments of earlier chunks stay added.
+        @param payments: Iterable of payment dicts or payment records
+        @param chunk_size: The number of payments to prepare at once
+        @return: The number of added payments
+        @raise exception: when a payment is invalid
+        """
+        count = 0
+        for chunk in chunked(payments, chunk_size):
+            self._derived = 0
+            self._prepare_payments(chunk)
+            self._add_TXs([
+                self._record_TX(payment) if isinstance(payment, self.payment_class) else self._payment_TX(payment)
+                for payment in chunk
+            ])
+            count += len(chunk)
+        return count
+
+    def _add_TXs(self, TXs):
+        """
+        Method to check transactions against the schema facets and the
+        duplicate index as a whole and to add them, so that if one of them is
+        invalid, none of them are added.
+        @param TXs: list of tuples of the field values, the amount and the
+        tuple of the batch key values of every transaction
+        @raise exception: when one of the transactions is invalid
+        """
+        if self.check_fields:
+            for values, amount, batch in TXs:
+                self._check_fields(self._TX_checks, values)
+                self._check_fields(self._batch_checks, batch)
+        keys = None
+        if self.duplicates is not None:
+            keys = self.duplicates.check([(values, "::".join(batch)) for values, amount, batch in TXs])
+        added = 0
+        try:
+            for values, amount, batch in TXs:
+                self._add_TX(values, amount, *batch)
+                added += 1
+        finally:
+            # Transactions that were added before e.g. the byte limit was hit
+            # stay in the document, so their keys are indexed.
+            if keys is not None:
+                self.duplicates.insert(keys[:added])
+
+    @classmethod
+    def from_columns(cls, config, columns, *args, **kwargs):
+        """
+        Alternative constructor that creates the document and adds the
+        payments given as columns, see add_columns.
+        @param config: The config dict.
+        @param columns: Mapping of payment field names to columns
+        @return: The new instance
+        """
+        sepa = cls(config, *args, **kwargs)
+        sepa.add_columns(columns)
+        return sepa
+
+    def add_columns(self, columns):
+        """
+        Function to add payments given as columns instead of payment dicts,
+        e.g. a pandas DataFrame or a dict of NumPy arrays or lists. The column
+        names are the keys of the payment dict and the amounts have to be
+        integer columns (cents). The checks and conversions are done for
+        whole columns and the transactions are added to their batches in one
+        go, so if a value is invalid, none of the payments are added. Columns
+        can only be added in batch mode.
+        @param columns: Mapping of payment field names to columns
+        @return: The number of added payments
+        @raise exception: when a column is invalid
+        """
+        if not self._config['batch']:
+            raise Exception("Payments can only be added as columns in batch mode.")
+
+        self._derived = 0
+        cents, batch_keys, values = self._prepare_columns(columns)
+        if self.check_fields:
+            for row_values in values:
+                self._check_fields(self._TX_checks, row_values)
+            for batch_key in set(batch_keys):
+                self._check_fields(self._batch_checks, batch_key.split("::"))
+        if self.duplicates is not None:
+            keys = self.duplicates.check(zip(values, batch_keys))
+        for batch_key, rows, ctrl_sum in group_rows(batch_keys, cents):
+            if batch_key not in self._batches:
+                self._batches[batch_key] = []
+                self._batch_totals[batch_key] = 0
+            self._batches[batch_key].extend(self._create_TX(values[row]) for row in rows)
+            if self.deterministic:
+                for row in rows:
+                    self._hash_TX(values[row], batch_key)
+            for row in rows:
+                self._add_payment_run(batch_key, self._nb_of_txs_total + row)
+            self._batch_totals[batch_key] += ctrl_sum
+
+        self._nb_of_txs_total += len(values)
+        self._ctrl_sum_total += column_sum(cents)
+        if self.duplicates is not None:
+            self.duplicates.insert(keys)
+        return len(values)
+
+    def _clean_columns(self, names, descriptions):
+        """
+        Method to clean the name and description columns for add_columns.
+        @return: tuple of the cleaned names and descriptions
+        """
+        return clean_column(names, 70, self.cleaner), clean_column(descriptions, 140, self.cleaner)
+
+    def _check_account(self, IBAN, BIC):
+        """
+        Method to normalize and check the IBAN and BIC of a payment.
+        @return: The normalized IBAN
+        @raise exception: when the IBAN or the BIC is invalid
+        """
+        IBAN, error = check_account(IBAN, BIC)
+        if error is not None:
+            raise Exception('Payment did not validate: ' + error)
+        return IBAN
+
+    def _check_accounts(self, IBANs, BICs):
+        """
+        Method to normalize and check the IBANs and BICs of many payments or a
+        column in one go.
+        @return: list of the normalized IBANs
+        @raise exception: when one of the IBANs or BICs is invalid
+        """
+        IBANs, errors = check_accounts(IBANs, BICs)
+        if errors:
+            raise Exception('Payment did not validate: ' + errors[0][1])
+        return IBANs
+
+    def _compile_field_checks(self):
+        """
+        Method to get the field checkers of the config, the transactions and
+        the batches from the facets of the schema.
+        """
+        if self.schema == 'CBIPaymentRequest.00.04.00':
+            root = "CBIPaymentRequest"
+        else:
+            root = "Document/" + self.root_el
+        self._config_checks = field_checks(self.schema, root, self.config_fields)
+        self._TX_checks = field_checks(self.schema, root, self.TX_fields)
+        self._batch_checks = field_checks(self.schema, root, self.batch_fields)
+
+    def _check_fields(self, checks, values, message='Payment did not validate: '):
+        """
+        Method to check field values with the checkers of their fields.
+        @param checks: The field checkers, see field_checks
+        @param values: tuple of the field values, None if not given
+        @raise exception: when one of the values is illegal
+        """
+        for position, field, check in checks:
+            value = values[position]
+            if value is not None:
+                error = check(value)
+                if error is not None:
+                    raise Exception(message + field.upper() + "_" + error)
+
+    def _find_BIC(self, IBAN, BIC):
+        """
+        Method to look up the BIC of a payment without one in the bank
+        directory.
+        @return: The given or the found BIC, None if there is neither
+        """
+        if BIC or self.bank_directory is None:
+            return BIC
+        return self.bank_directory.bic(IBAN)
+
+    def _find_BICs(self, payments):
+        """
+        Method to fill in the BICs of payment dicts without one from the bank
+        directory.
+        """
+        if self.bank_directory is None:
+            return
+        for payment in payments:
+            if not payment.get('BIC'):
+                BIC = self.bank_directory.bic(payment['IBAN'])
+                if BIC:
+                    payment['BIC'] = BIC
+
+    def export(self, validate=True, workers=None, executor=None):
         """
         Method to output the xml as string. It will finalize the batches and
-        then calculate the checksums (amount sum and transaction count),
-        fill these into the group header and output the XML.
+        then fill the checksums (amount sum and transaction count) from the
+        running counters into the group header and output the XML.
+        @param validate: True to validate the output before it is returned,
+        "parallel" to validate it in chunks in a pool of processes (see
+        try_valid_xml_parallel, with workers processes), "async" to return it
+        right away together with a concurrent.futures.Future of the
+        validation, whose result is None or whose exception is the
+        ValidationError.
+        @param workers: If more than one, the PmtInf blocks are serialized in a
+        pool of that many processes and the rendered fragments are joined in
+        document order. The output is the same as without workers. This has no
+        effect with the template and the deferred serializer, which export
+        the document as a stream. The processes are forked, which is unsafe
+        while other threads hold locks, e.g. while validations run in the
+        thread pool of validate="async".
+        @param executor: The executor for "async" validation, e.g. a
+        ProcessPoolExecutor, which gets the output only. A process-wide thread
+        pool if missing.
+        @return: The XML, or a tuple of the XML and the Future of its
+        validation for "async".
         """
+        if workers is not None and workers > 1 and self.serializer == 'etree':
+            out = self._export_parallel(workers)
+            return self._validate(self._xml, out, validate, executor, workers)
+
+        if self.serializer != 'etree':
+            # Rendered or deferred transactions can not be part of the XML
+            # tree, so the document is assembled from the stream instead.
+            out = b"".join(self.iter_export())
+            return self._validate(None, out, validate, executor, workers)
+
         self._finalize_batch()
+        self._fill_group_header(self._ctrl_sum_total, self._nb_of_txs_total)
+
+        # Prepending the XML version is hacky, but cElementTree only offers this
+        # automatically if you write to a file, which we don't necessarily want.
+        out = XML_DECLARATION + self.backend.tostring(self._xml)
+        return self._validate(self._xml, out, validate, executor, workers)
+
+    def _validate(self, root, out, validate, executor, workers=None):
+        """
+        Method to validate the output of export, now or in the background.
+        Processes of an executor can not share the document tree, so they
+        validate the output only.
+        @return: The output, or a tuple of the output and the Future of its
+        validation for "async"
+        """
+        if validate == "async":
+            backend = self.backend
+            if executor is None:
+                executor = validation_executor()
+            elif isinstance(executor, ProcessPoolExecutor):
+                # The processes get a backend of their own, the one of the
+                # builder can not be pickled while it is profiled.
+                root = None
+                backend = type(backend)(backend.namespace)
+            # The validation is submitted without the timed wrapper of the
+            # profiler, it is timed in this process instead.
+            future = executor.submit(type(backend).validate, backend, root, out, self.schema)
+            if self._profiler is not None:
+                self._profiler.time_future("validate", future)
+            return out, self._locate_future(future)
+        try:
+            if validate == "parallel":
+                self._validate_parallel(out, workers)
+            elif validate:
+                self.backend.validate(root, out, self.schema)
+        except ValidationError as e:
+            self._locate_error(e)
+            raise
+        return out
 
-        ctrl_sum_total = 0
-        nb_of_txs_total = 0
+    def _validate_parallel(self, out, workers):
+        """
+        Method to validate the output in chunks, see try_valid_xml_parallel.
+        """
+        try_valid_xml_parallel(out, self.schema, workers)
 
-        if ((self.schema == 'CBIPaymentRequest.00.04.00')):
-            for ctrl_sum in self._xml.iter('InstdAmt'):
-                if ctrl_sum.text is None:
-                    continue
-                ctrl_sum_total += decimal_str_to_int(ctrl_sum.text)
+    def _add_payment_run(self, batch_key, number):
+        """
+        Method to note the number of a payment, counted in the order the
+        payments were added, in its batch. Consecutive numbers are kept as
+        one run, so this takes constant memory for payments that are added
+        batch by batch.
+        """
+        runs = self._payment_runs.get(batch_key)
+        if runs is None:
+            self._payment_runs[batch_key] = [[number, number + 1]]
+        elif runs[-1][1] == number:
+            runs[-1][1] += 1
         else:
-            for ctrl_sum in self._xml.iter('CtrlSum'):
-                if ctrl_sum.text is None:
-                    continue
-                ctrl_sum_total += decimal_str_to_int(ctrl_sum.text)
+            runs.append([number, number + 1])
 
-        if ((self.schema == 'CBIPaymentRequest.00.04.00')):
-            for nb_of_txs in self._xml.iter('CdtTrfTxInf'):
-                nb_of_txs_total += 1
-                PmtIdNode = nb_of_txs.find('PmtId')
-                InstrId_Node = PmtIdNode.find('InstrId')
-                InstrId_Node.text = str(nb_of_txs_total)
+    def _payment_index(self, PmtInf_index, TX_index):
+        """
+        Method to find the payment of a transaction in the document.
+        @param PmtInf_index: The index of the PmtInf block
+        @param TX_index: The index of the transaction in the PmtInf block,
+        None for the PmtInf block itself
+        @return: The number of the payment, counted in the order the payments
+        were added, None if there is no single payment
+        """
+        cbi = self.schema == 'CBIPaymentRequest.00.04.00'
+        if not self._config['batch']:
+            # Every payment has its own PmtInf block, except for CBI, which
+            # has one for all.
+            return TX_index if cbi else PmtInf_index
+        if TX_index is None:
+            return None
+        if cbi:
+            batches = self._payment_runs.values()
         else:
-            for nb_of_txs in self._xml.iter('NbOfTxs'):
-                if nb_of_txs.text is None:
-                    continue
-                nb_of_txs_total += int(nb_of_txs.text)
+            batches = list(self._payment_runs.values())[PmtInf_index:PmtInf_index + 1]
+        for runs in batches:
+            for first, stop in runs:
+                if TX_index < stop - first:
+                    return first + TX_index
+                TX_index -= stop - first
+        return None
+
+    def _locate_error(self, error):
+        """
+        Method to add the number of the payment to a ValidationError that is
+        located in the document.
+        """
+        if error.PmtInf_index is not None and self._config is not None:
+            error.payment_index = self._payment_index(error.PmtInf_index, error.TX_index)
 
+    def _locate_future(self, future):
+        """
+        Method to chain the Future of a validation with one whose
+        ValidationError carries the number of the payment.
+        """
+        located = Future()
+
+        def done(future):
+            if future.cancelled():
+                located.cancel()
+                located.set_running_or_notify_cancel()
+                return
+            error = future.exception()
+            if isinstance(error, ValidationError):
+                self._locate_error(error)
+            if error is not None:
+                located.set_exception(error)
+            else:
+                located.set_result(future.result())
+        future.add_done_callback(done)
+        return located
+
+    def summary(self):
+        """
+        Method to get the checksums of the document without exporting it. The
+        values are kept up to date while payments are added, so this is cheap
+        for large files as well.
+        @return: dict with the number of transactions (nb_of_txs) and the
+        total amount in cents (ctrl_sum), overall and per batch.
+        """
+        batches = OrderedDict()
+        for batch_meta, batch_nodes in self._batches.items():
+            batches[batch_meta] = {
+                'nb_of_txs': len(batch_nodes),
+                'ctrl_sum': self._batch_totals[batch_meta],
+            }
+        return {
+            'nb_of_txs': self._nb_of_txs_total,
+            'ctrl_sum': self._ctrl_sum_total,
+            'batches': batches,
+        }
+
+    def enable_profiling(self, callback=None):
+        """
+        Function to record the wall time and the number of calls of every
+        phase of the pipeline from now on: add_payment (which includes
+        add_payments and add_columns), clean, check, create_TX, finalize,
+        export, serialize and validate. Without it, the
+        builder runs without any instrumentation. With export workers, the
+        serialization in the worker processes is only part of export.
+        @param callback: Optional function that is called with the name of
+        the phase and the wall time in seconds after every timed call.
+        """
+        if self._profiler is not None:
+            raise Exception("Profiling is already enabled.")
+        self._profiler = Profiler(callback)
+        self._profiler.attach(self)
+
+    def profile(self):
+        """
+        Method to get the profiling report, see enable_profiling.
+        @return: dict with the number of calls (calls) and the wall time in
+        seconds (time) per phase, in pipeline order.
+        @raise exception: when profiling is not enabled
+        """
+        if self._profiler is None:
+            raise Exception("Profiling is not enabled.")
+        return self._profiler.report()
+
+    def iter_export(self):
+        """
+        Method to output the xml as a sequence of byte chunks, e.g. to stream
+        it into a file or a HTTP response. The checksums of the group header
+        are taken from the running counters, the batches are finalized one at
+        a time and every node is released as soon as it has been written, so
+        the output is the same as export(validate=False) but the builder can
+        not be exported a second time. The output is not validated.
+        """
+        for item in self._iter_export_items():
+            if isinstance(item, bytes):
+                yield item
+            else:
+                yield self.backend.tostring(item)
+
+    def _export_parallel(self, workers, chunk_size=1000):
+        """
+        Method to finalize the document and serialize it in a pool of forked
+        worker processes. The workers inherit the finished XML tree, so only
+        the position of the nodes to serialize and the rendered bytes have to
+        be transferred. Large PmtInf blocks are split into chunks of up to
+        chunk_size nodes, small ones are grouped. Where fork is not available
+        and before Python 3.7, the chunks are serialized in this process. The
+        builder is handed to the workers by their initializer, so builders can
+        be exported from several threads at the same time.
+        """
+        self._finalize_batch()
+        self._fill_group_header(self._ctrl_sum_total, self._nb_of_txs_total)
+
+        # The tasks are tuples of the path to the parent node (indices from
+        # the root) and the range of its children to serialize.
+        tasks = []
+        root_open, root_close = self.backend.split_tags(self._xml)
+        tasks.append(XML_DECLARATION + root_open)
+        tasks.append(((), 0, len(self._xml) - 1))
+        body = self._xml[-1]
+        body_open, body_close = self.backend.split_tags(body)
+        tasks.append(body_open)
+        start = size = 0
+        for i, node in enumerate(body):
+            if len(node) > chunk_size:
+                if size:
+                    tasks.append(((-1,), start, i))
+                node_open, node_close = self.backend.split_tags(node)
+                tasks.append(node_open)
+                for j in range(0, len(node), chunk_size):
+                    tasks.append(((-1, i), j, j + chunk_size))
+                tasks.append(node_close)
+                start, size = i + 1, 0
+                continue
+            size += len(node) + 1
+            if size >= chunk_size:
+                tasks.append(((-1,), start, i + 1))
+                start, size = i + 1, 0
+        if size:
+            tasks.append(((-1,), start, len(body)))
+        tasks.append(body_close + root_close)
+
+        mp_context = fork_context()
+        if mp_context is None:
+            return b"".join(
+                task if isinstance(task, bytes) else _serialize_children(*task, builder=self)
+                for task in tasks
+            )
+        # The forked workers inherit the arguments of the initializer, the
+        # builder is not pickled.
+        with ProcessPoolExecutor(workers, mp_context=mp_context, initializer=_init_fork_builder,
+                                 initargs=(self,)) as pool:
+            parts = [
+                task if isinstance(task, bytes) else pool.submit(_serialize_children, *task)
+                for task in tasks
+            ]
+            return b"".join(
+                part if isinstance(part, bytes) else part.result()
+                for part in parts
+            )
+
+    def _iter_export_items(self):
+        """
+        Generator that yields the document in output order as a mix of
+        already rendered byte strings and nodes that still have to be
+        serialized. The nodes are removed from the document and from the
+        batch list before they are yielded. Deferred transactions are built
+        from their values right before they are yielded.
+        """
+        self._fill_group_header(self._ctrl_sum_total, self._nb_of_txs_total)
+        yield XML_DECLARATION
+
+        root_open, root_close = self.backend.split_tags(self._xml)
+        yield root_open
+        # For CBI, the group header is a direct child of the root node, all
+        # other children live in the last child of the root node.
+        body = self._xml[-1]
+        for node in _pop_children(self._xml, end=-1):
+            yield node
+        del self._xml[:]
+
+        body_open, body_close = self.backend.split_tags(body)
+        yield body_open
+        instr_id = 0
+        for node in chain(_pop_children(body), _pop_children(self._fragments)):
+            if self._is_CBI_TX(node):
+                instr_id += 1
+                node = self._number_CBI_TX(node, instr_id)
+            yield node
+
+        while self._batches:
+            batch_meta, batch_nodes = self._batches.popitem(last=False)
+            PmtInf_node = self._create_batch_PmtInf_node(batch_meta, batch_nodes)
+            del self._batch_totals[batch_meta]
+            if self.schema == 'CBIPaymentRequest.00.04.00':
+                PmtInf_open, PmtInf_close = b"", b""
+            else:
+                PmtInf_open, PmtInf_close = self.backend.split_tags(PmtInf_node)
+            yield PmtInf_open
+            for node in _pop_children(PmtInf_node):
+                yield node
+            for node in _pop_children(batch_nodes):
+                if self.serializer == 'deferred':
+                    node = self._create_TX_node_from(node)
+                if self.schema == 'CBIPaymentRequest.00.04.00':
+                    instr_id += 1
+                    node = self._number_CBI_TX(node, instr_id)
+                yield node
+            yield PmtInf_close
+
+        yield body_close
+        yield root_close
+
+    def _measure_TX(self, TX, batch_key, batch=True):
+        """
+        Method to add the size of a new transaction to the size of the
+        document if the document has a byte limit. It has to be called before
+        the transaction is added.
+        @param batch_key: The batch of the transaction
+        @param batch: False for a non batch payment, which comes with its own
+        PmtInf block
+        @raise SizeLimitExceeded: when the transaction does not fit into the
+        document anymore
+        """
+        if self._max_bytes is None:
+            return
+        if self._size is None:
+            self._size = len(XML_DECLARATION) + len(self.backend.tostring(self._xml)) + MSG_ID_SIZE + CHECKSUM_SIZE
+        size = self._TX_size(TX)
+        if not batch or batch_key not in self._batches:
+            size += self._PmtInf_size(batch_key)
+        if self._size + size > self._max_bytes:
+            raise SizeLimitExceeded("The transaction does not fit into %d bytes." % self._max_bytes)
+        self._size += size
+
+    def _PmtInf_size(self, batch_key):
+        """
+        Method to get an upper bound for the serialized size of the PmtInf
+        block of a batch without its transactions. The block is only built
+        and measured once per batch key, a non batch PmtInf block has the
+        same size apart from its checksums.
+        """
+        size = self._PmtInf_sizes.get(batch_key)
+        if size is None:
+            node = self._create_batch_PmtInf_node(batch_key, [])
+            size = len(self.backend.tostring(node)) + CHECKSUM_SIZE
+            self._PmtInf_sizes[batch_key] = size
+        return size
+
+    def _TX_size(self, TX):
+        """
+        Method to get the serialized size of a transaction in bytes.
+        """
+        if isinstance(TX, bytes):
+            return len(TX)
+        if isinstance(TX, tuple) and self.serializer == 'template':
+            # The InstrId of a rendered CBI transaction is only filled in on
+            # export and has at most as many digits as the number of
+            # transactions.
+            return len(TX[0]) + len(TX[1]) + len(str(self._nb_of_txs_total + 1))
+        if isinstance(TX, tuple):
+            TX = self._create_TX_node_from(TX)
+        size = len(self.backend.tostring(TX))
+        if self._is_CBI_TX(TX):
+            size += len(str(self._nb_of_txs_total + 1)) + len("<InstrId></InstrId>")
+        return size
+
+    def _is_CBI_TX(self, node):
+        if self.schema != 'CBIPaymentRequest.00.04.00':
+            return False
+        return isinstance(node, tuple) or (not isinstance(node, bytes) and node.tag == self.backend.tag('CdtTrfTxInf'))
+
+    def _number_CBI_TX(self, node, instr_id):
+        """
+        Method to fill the running InstrId into a CBI transaction.
+        Transactions rendered by a template are kept as tuple of the bytes
+        before and after the InstrId value.
+        """
+        if isinstance(node, tuple):
+            return node[0] + str(instr_id).encode("utf-8") + node[1]
+        self.backend.find(node, 'PmtId/InstrId').text = str(instr_id)
+        return node
+
+    def _creation_datetime(self):
+        """
+        Method to format the creation time of the document, the
+        creation_datetime of the config or the current time.
+        """
+        created = self._config.get('creation_datetime') or datetime.datetime.now()
+        return created.strftime('%Y-%m-%dT%H:%M:%S')
+
+    def _hash_TX(self, values, batch_key):
+        """
+        Method to chain the field values of a transaction to the running hash
+        of the document in deterministic mode.
+        """
+        self._digest = hashlib.sha256((self._digest + repr((batch_key, values))).encode('utf-8')).hexdigest()
+
+    def _derive_id(self, *content):
+        """
+        Method to derive an id of a single transaction in deterministic mode
+        from the config, the given content, the number of transactions in the
+        document and the number of ids derived since payments were last added,
+        so that identical payments still get distinct ids. Payments that are
+        rejected do not change the ids of the payments after them.
+        """
+        self._derived += 1
+        return make_content_id(self._config['name'], self._config_digest, self._nb_of_txs_total, self._derived,
+                               *content)
+
+    def _document_id(self, *content):
+        """
+        Method to derive an id in deterministic mode from the config, all
+        transactions of the document and the given content.
+        """
+        return make_content_id(self._config['name'], self._config_digest, self._digest, *content)
+
+    def _fill_group_header(self, ctrl_sum_total, nb_of_txs_total):
+        """
+        Method to fill the checksums (amount sum and transaction count) into
+        the group header. In deterministic mode, the MsgId is derived from the
+        transactions here as well.
+        """
         if ((self.schema == 'CBIPaymentRequest.00.04.00')):
-            GrpHdr_node = self._xml.find('GrpHdr')
+            GrpHdr_node = self.backend.find(self._xml, 'GrpHdr')
         else:
-            n = self._xml.find(self.root_el)
-            GrpHdr_node = n.find('GrpHdr')
-        CtrlSum_node = GrpHdr_node.find('CtrlSum')
-        NbOfTxs_node = GrpHdr_node.find('NbOfTxs')
+            n = self.backend.find(self._xml, self.root_el)
+            GrpHdr_node = self.backend.find(n, 'GrpHdr')
+        CtrlSum_node = self.backend.find(GrpHdr_node, 'CtrlSum')
+        NbOfTxs_node = self.backend.find(GrpHdr_node, 'NbOfTxs')
         CtrlSum_node.text = int_to_decimal_str(ctrl_sum_total)
         NbOfTxs_node.text = str(nb_of_txs_total)
+        if self.deterministic:
+            self.msg_id = self._document_id("MsgId")
+            self.backend.find(GrpHdr_node, 'MsgId').text = self.msg_id
 
-        # Prepending the XML version is hacky, but cElementTree only offers this
-        # automatically if you write to a file, which we don't necessarily want.
-        out = b"<?xml version=\"1.0\" encoding=\"UTF-8\"?>" + ET.tostring(
-            self._xml, "utf-8")
-        if validate:
-            try_valid_xml(out, self.schema)
-        return out
+
+def _init_fork_builder(builder):
+    """
+    Initializer of the worker processes of an export with workers.
+    """
+    global _fork_builder
+    _fork_builder = builder
+
+
+def _serialize_children(path, start, end, builder=None):
+    """
+    Helper to serialize a range of children of a node of the document that is
+    being exported, in a worker process or in the exporting process.
+    @param path: The indices of the node, starting from the root
+    @param builder: The builder, the one of the worker process if missing
+    """
+    if builder is None:
+        builder = _fork_builder
+    parent = builder._xml
+    for index in path:
+        parent = parent[index]
+    tostring = builder.backend.tostring
+    return b"".join(tostring(node) for node in parent[start:end])
+
+
+def _pop_children(nodes, end=None):
+    """
+    Generator over the children of a node (or a list of nodes) that removes
+    every child before it is yielded, so it can be released as soon as the
+    consumer is done with it.
+    @param end: Stop before this index, the remaining children are kept.
+    """
+    children = nodes[:end]
+    del nodes[:end]
+    children.reverse()
+    while children:
+        yield children.pop()
@@ -1,8 +1,12 @@
 import datetime
-import xml.etree.ElementTree as ET
 
-from shared import SepaPaymentInitn
-from utils import int_to_decimal_str
+from .columns import (amount_column, column_length, date_column,
+                      optional_column, to_list)
+from .duplicates import TRANSFER_KEYS
+from .payments import CreditTransferPayment
+from .shared import SepaPaymentInitn
+from .templates import ByteTemplate, placeholders
+from .utils import int_to_decimal_str
 
 
 class SepaTransfer(SepaPaymentInitn):
@@ -12,9 +16,33 @@ class SepaTransfer(SepaPaymentInitn):
     root_el_g = "GrpHdr"
     root_el_p = "PmtInf"
     root_el = "CstmrCdtTrfInitn"
-
-    def __init__(self, config, schema="pain.001.001.03", clean=True):
-        super().__init__(config, schema, clean)
+    payment_class = CreditTransferPayment
+    duplicate_keys = TRANSFER_KEYS
+
+    # The paths of the elements of the config values, the transaction field
+    # values (see _TX_values) and the batch key values for check_fields.
+    config_fields = (
+        ("name", "GrpHdr/InitgPty/Nm"),
+        ("IBAN", "PmtInf/DbtrAcct/Id/IBAN"),
+        ("BIC", "PmtInf/DbtrAgt/FinInstnId/BIC"),
+    )
+    TX_fields = (
+        ("instr_id", "PmtInf/CdtTrfTxInf/PmtId/InstrId"),
+        ("endtoend_id", "PmtInf/CdtTrfTxInf/PmtId/EndToEndId"),
+        ("amount", "PmtInf/CdtTrfTxInf/Amt/InstdAmt"),
+        ("BIC", "PmtInf/CdtTrfTxInf/CdtrAgt/FinInstnId/BIC"),
+        ("name", "PmtInf/CdtTrfTxInf/Cdtr/Nm"),
+        ("IBAN", "PmtInf/CdtTrfTxInf/CdtrAcct/Id/IBAN"),
+        ("description", "PmtInf/CdtTrfTxInf/RmtInf/Ustrd"),
+    )
+    batch_fields = (
+        ("execution_date", "PmtInf/ReqdExctnDt"),
+    )
+
+    def __init__(self, config, schema="pain.001.001.03", clean=True, serializer="etree", backend="etree", cleaner=None,
+                 check_iban=False, bank_directory=None, deterministic=False, duplicates=None, check_fields=False):
+        super().__init__(config, schema, clean, serializer, backend, cleaner, check_iban, bank_directory,
+                         deterministic, duplicates, check_fields)
 
     def check_config(self, config):
         """
@@ -82,23 +110,158 @@ class SepaTransfer(SepaPaymentInitn):
     def add_payment(self, payment):
         """
         Function to add payments
-        @param payment: The payment dict
+        @param payment: The payment dict or a CreditTransferPayment
         @raise exception: when payment is invalid
         """
+        self._derived = 0
+        if isinstance(payment, CreditTransferPayment):
+            self._add_TXs([self._record_TX(payment)])
+            return
+
         # Validate the payment
         self.check_payment(payment)
+        if self.check_iban:
+            payment['IBAN'] = self._check_account(payment['IBAN'], payment.get('BIC'))
+        self._find_BICs([payment])
+
+        if self.clean:
+            self._clean_payment(payment)
+
+        self._add_TXs([self._payment_TX(payment)])
+
+    def _clean_payment(self, payment):
+        payment['name'] = self.cleaner.clean(payment['name'], 70)
+        if ("description" in payment):
+            payment['description'] = self.cleaner.clean(payment['description'], 140)
+
+    def _clean_record(self, record):
+        """
+        Method to clean the texts of a record without changing it.
+        @return: tuple of the cleaned name and description
+        """
+        description = record.description
+        if description is not None:
+            description = self.cleaner.clean(description, 140)
+        return self.cleaner.clean(record.name, 70), description
 
+    def _prepare_payments(self, payments):
+        """
+        Method to validate and clean a chunk of payments for add_payments.
+        @raise exception: when one of the payments is invalid
+        """
+        payments = [payment for payment in payments if not isinstance(payment, CreditTransferPayment)]
+        for payment in payments:
+            self.check_payment(payment)
+        if self.check_iban:
+            IBANs = self._check_accounts([payment['IBAN'] for payment in payments],
+                                         [payment.get('BIC') for payment in payments])
+            for payment, IBAN in zip(payments, IBANs):
+                payment['IBAN'] = IBAN
+        self._find_BICs(payments)
         if self.clean:
-            from text_unidecode import unidecode
+            for payment in payments:
+                self._clean_payment(payment)
+
+    def _prepare_columns(self, columns):
+        """
+        Method to validate, clean and convert the columns for add_columns.
+        Structured remittance information (documents) is not supported for
+        columns, every payment needs a description.
+        @return: tuple of the amounts in cents, the batch key of every row and
+        the transaction field values of every row
+        @raise exception: when a column is invalid
+        """
+        length = column_length(columns, ["name", "IBAN", "amount", "description"])
+        cents, amounts = amount_column(columns['amount'])
+        if 'execution_date' in columns:
+            batch_keys = date_column(columns['execution_date'], "EXECUTION_DATE")
+        else:
+            batch_keys = [self._config['execution_date']] * length
 
-            payment['name'] = unidecode(payment['name'])[:70]
-            if ("description" in payment):
-                payment['description'] = unidecode(payment['description'])[:140]
+        names = to_list(columns['name'])
+        descriptions = to_list(columns['description'])
+        if self.clean:
+            names, descriptions = self._clean_columns(names, descriptions)
+
+        IBANs = to_list(columns['IBAN'])
+        BICs = optional_column(columns, 'BIC', length)
+        if self.check_iban:
+            IBANs = self._check_accounts(IBANs, BICs)
+        if self.bank_directory is not None:
+            BICs = [self._find_BIC(IBAN, BIC) for IBAN, BIC in zip(IBANs, BICs)]
+
+        values = list(zip(
+            [None] * length,
+            optional_column(columns, 'endtoend_id', length, 'NOTPROVIDED'),
+            amounts,
+            BICs,
+            names,
+            IBANs,
+            descriptions,
+            [None] * length,
+        ))
+        return cents, batch_keys, values
+
+    def _payment_TX(self, payment):
+        """
+        Method to get the transaction of a payment that has already been
+        validated and cleaned.
+        @return: tuple of the field values, the amount and the batch key
+        values, see _add_TXs
+        """
+        if 'execution_date' in payment:
+            execution_date = payment['execution_date']
+        else:
+            execution_date = self._config['execution_date']
+        return self._TX_values(payment), payment['amount'], (execution_date,)
+
+    def _record_TX(self, record):
+        """
+        Method to get the transaction of a CreditTransferPayment, which has
+        been validated when it was created. The record itself is not changed.
+        @return: tuple of the field values, the amount and the batch key
+        values, see _add_TXs
+        """
+        name = record.name
+        description = record.description
+        if self.clean:
+            name, description = self._clean_record(record)
+        IBAN = record.IBAN
+        if self.check_iban:
+            IBAN = self._check_account(IBAN, record.BIC)
+        BIC = self._find_BIC(IBAN, record.BIC)
+        if record.execution_date is not None:
+            execution_date = record.execution_date.isoformat()
+        else:
+            execution_date = self._config['execution_date']
+        values = (
+            None,
+            record.endtoend_id or 'NOTPROVIDED',
+            int_to_decimal_str(record.amount),
+            BIC,
+            name,
+            IBAN,
+            description,
+            record.document if description is None else None,
+        )
+        return values, record.amount, (execution_date,)
+
+    def _add_TX(self, values, amount, execution_date):
+        """
+        Method to create the transaction from its field values and add it to
+        its batch or as non batch payment. The InstrId of a non batch payment
+        is its running number, which is only known here.
+        """
+        if not self._config['batch']:
+            values = (str(self._nb_of_txs_total + 1),) + values[1:]
 
         if not self._config['batch']:
             # Start building the non batch payment
             PmtInf_nodes = self._create_PmtInf_node()
-            PmtInf_nodes['PmtInfIdNode'].text = self._config['unique_id']
+            if self.deterministic:
+                PmtInf_nodes['PmtInfIdNode'].text = self._derive_id("PmtInf", values)
+            else:
+                PmtInf_nodes['PmtInfIdNode'].text = self._config['unique_id']
             if ('notify' in self._config):
                 if not self._config['notify']:
                     PmtInf_nodes['PmtMtdNode'].text = "TRF"
@@ -109,8 +272,7 @@ class SepaTransfer(SepaPaymentInitn):
 
             PmtInf_nodes['BtchBookgNode'].text = "false"
             PmtInf_nodes['NbOfTxsNode'].text = "1"
-            PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(
-                payment['amount'])
+            PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(amount)
 
             if ('priority' in self._config):
                 if not self._config['priority']:
@@ -122,10 +284,7 @@ class SepaTransfer(SepaPaymentInitn):
 
             if not self._config.get('domestic', False):
                 PmtInf_nodes['Cd_SvcLvl_Node'].text = "SEPA"
-            if 'execution_date' in payment:
-                PmtInf_nodes['ReqdExctnDtNode'].text = payment['execution_date']
-            else:
-                PmtInf_nodes['ReqdExctnDtNode'].text = self._config['execution_date']
+            PmtInf_nodes['ReqdExctnDtNode'].text = execution_date
 
 
             PmtInf_nodes['Nm_Dbtr_Node'].text = self._config['name']
@@ -136,26 +295,19 @@ class SepaTransfer(SepaPaymentInitn):
             PmtInf_nodes['ChrgBrNode'].text = "SLEV"
             PmtInf_nodes['MmbId_Node'].text = self._config['bank_code']
 
-        if 'BIC' in payment:
-            TX_nodes = self._create_TX_node(payment, bic = True)
-            TX_nodes['BIC_CdtrAgt_Node'].text = payment['BIC']
-        else:
-            TX_nodes = self._create_TX_node(payment, bic = False)
-
-        TX_nodes['Nm_Cdtr_Node'].text = payment['name']
-        TX_nodes['InstdAmtNode'].set("Ccy", self._config['currency'])
-        TX_nodes['InstdAmtNode'].text = int_to_decimal_str(payment['amount'])
-        TX_nodes['Cd_CtgyPurp'].text = "SUPP"
-        TX_nodes['IBAN_CdtrAcct_Node'].text = payment['IBAN']
-        TX_nodes['EndToEnd_PmtId_Node'].text = payment.get('endtoend_id', 'NOTPROVIDED')
-
-        if ("description" in payment):
-            TX_nodes['UstrdNode'].text = payment['description']
+        TX = self._create_TX(values)
         if self._config['batch']:
-            self._add_batch(TX_nodes, payment)
+            self._measure_TX(TX, execution_date)
+            self._add_to_batch_list(TX, execution_date, amount)
         else:
-            TX_nodes['InstrId_Node'].text = "1"
-            self._add_non_batch(TX_nodes,  PmtInf_nodes)
+            self._measure_TX(TX, execution_date, batch=False)
+            self._add_non_batch(TX, PmtInf_nodes)
+
+        self._nb_of_txs_total += 1
+        self._ctrl_sum_total += amount
+        if self.deterministic:
+            # Only transactions that have been added change the hash.
+            self._hash_TX(values, execution_date)
 
     def _create_header(self):
         """
@@ -163,24 +315,24 @@ class SepaTransfer(SepaPaymentInitn):
         """
 
         if (self.schema != 'CBIPaymentRequest.00.04.00'):
-            CstmrCdtTrfInitn_node = self._xml.find('CstmrCdtTrfInitn')
-            GrpHdr_node = ET.Element("GrpHdr")
+            CstmrCdtTrfInitn_node = self.backend.find(self._xml, 'CstmrCdtTrfInitn')
+            GrpHdr_node = self.backend.Element("GrpHdr")
         # Create the header nodes.
-        MsgId_node = ET.Element("MsgId")
-        CreDtTm_node = ET.Element("CreDtTm")
-        NbOfTxs_node = ET.Element("NbOfTxs")
-        CtrlSum_node = ET.Element("CtrlSum")
-        InitgPty_node = ET.Element("InitgPty")
-        Nm_node = ET.Element("Nm")
-        Id_Othr_node = ET.Element("Id")
-        Id_InitgPty_node = ET.Element("Id")
-        Issr_node = ET.Element("Issr")
-        Othr_node = ET.Element("Othr")
-        OrgId_node = ET.Element("OrgId")
+        MsgId_node = self.backend.Element("MsgId")
+        CreDtTm_node = self.backend.Element("CreDtTm")
+        NbOfTxs_node = self.backend.Element("NbOfTxs")
+        CtrlSum_node = self.backend.Element("CtrlSum")
+        InitgPty_node = self.backend.Element("InitgPty")
+        Nm_node = self.backend.Element("Nm")
+        Id_Othr_node = self.backend.Element("Id")
+        Id_InitgPty_node = self.backend.Element("Id")
+        Issr_node = self.backend.Element("Issr")
+        Othr_node = self.backend.Element("Othr")
+        OrgId_node = self.backend.Element("OrgId")
 
         # Add data to some header nodes.
         MsgId_node.text = self._config['unique_id']
-        CreDtTm_node.text = datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S')
+        CreDtTm_node.text = self._creation_datetime()
         Nm_node.text = self._config['name']
         if (self.schema == 'CBIPaymentRequest.00.04.00'):
             Id_Othr_node.text = self._config['issuer_id']
@@ -194,7 +346,7 @@ class SepaTransfer(SepaPaymentInitn):
             OrgId_node.append(Othr_node)
             Id_InitgPty_node.append(OrgId_node)
             InitgPty_node.append(Id_InitgPty_node)
-            GrpHdr_node = self._xml.find('GrpHdr')
+            GrpHdr_node = self.backend.find(self._xml, 'GrpHdr')
         GrpHdr_node.append(MsgId_node)
         GrpHdr_node.append(CreDtTm_node)
         GrpHdr_node.append(NbOfTxs_node)
@@ -210,104 +362,143 @@ class SepaTransfer(SepaPaymentInitn):
         """
         ED = dict()  # ED is element dict
         if (self.schema != 'CBIPaymentRequest.00.04.00'):
-            ED['PmtInfNode'] = ET.Element("PmtInf")
-        ED['PmtInfIdNode'] = ET.Element("PmtInfId")
-        ED['PmtMtdNode'] = ET.Element("PmtMtd")
-        ED['BtchBookgNode'] = ET.Element("BtchBookg")
-        ED['NbOfTxsNode'] = ET.Element("NbOfTxs")
-        ED['CtrlSumNode'] = ET.Element("CtrlSum")
-        ED['InstrPrtyNode'] = ET.Element("InstrPrty")
-        ED['PmtTpInfNode'] = ET.Element("PmtTpInf")
+            ED['PmtInfNode'] = self.backend.Element("PmtInf")
+        ED['PmtInfIdNode'] = self.backend.Element("PmtInfId")
+        ED['PmtMtdNode'] = self.backend.Element("PmtMtd")
+        ED['BtchBookgNode'] = self.backend.Element("BtchBookg")
+        ED['NbOfTxsNode'] = self.backend.Element("NbOfTxs")
+        ED['CtrlSumNode'] = self.backend.Element("CtrlSum")
+        ED['InstrPrtyNode'] = self.backend.Element("InstrPrty")
+        ED['PmtTpInfNode'] = self.backend.Element("PmtTpInf")
         if not self._config.get('domestic', False):
-            ED['SvcLvlNode'] = ET.Element("SvcLvl")
-            ED['Cd_SvcLvl_Node'] = ET.Element("Cd")
-        ED['ReqdExctnDtNode'] = ET.Element("ReqdExctnDt")
-
-        ED['DbtrNode'] = ET.Element("Dbtr")
-        ED['Nm_Dbtr_Node'] = ET.Element("Nm")
-        ED['DbtrAcctNode'] = ET.Element("DbtrAcct")
-        ED['Id_DbtrAcct_Node'] = ET.Element("Id")
-        ED['IBAN_DbtrAcct_Node'] = ET.Element("IBAN")
-        ED['DbtrAgtNode'] = ET.Element("DbtrAgt")
-        ED['FinInstnId_DbtrAgt_Node'] = ET.Element("FinInstnId")
-        ED['ClrSysMmbId_Node'] = ET.Element("ClrSysMmbId")
-        ED['MmbId_Node'] = ET.Element("MmbId")
+            ED['SvcLvlNode'] = self.backend.Element("SvcLvl")
+            ED['Cd_SvcLvl_Node'] = self.backend.Element("Cd")
+        ED['ReqdExctnDtNode'] = self.backend.Element("ReqdExctnDt")
+
+        ED['DbtrNode'] = self.backend.Element("Dbtr")
+        ED['Nm_Dbtr_Node'] = self.backend.Element("Nm")
+        ED['DbtrAcctNode'] = self.backend.Element("DbtrAcct")
+        ED['Id_DbtrAcct_Node'] = self.backend.Element("Id")
+        ED['IBAN_DbtrAcct_Node'] = self.backend.Element("IBAN")
+        ED['DbtrAgtNode'] = self.backend.Element("DbtrAgt")
+        ED['FinInstnId_DbtrAgt_Node'] = self.backend.Element("FinInstnId")
+        ED['ClrSysMmbId_Node'] = self.backend.Element("ClrSysMmbId")
+        ED['MmbId_Node'] = self.backend.Element("MmbId")
         if 'BIC' in self._config:
-            ED['BIC_DbtrAgt_Node'] = ET.Element("BIC")
-        ED['ChrgBrNode'] = ET.Element("ChrgBr")
+            ED['BIC_DbtrAgt_Node'] = self.backend.Element("BIC")
+        ED['ChrgBrNode'] = self.backend.Element("ChrgBr")
         return ED
 
-    def _create_TX_node(self, payment, bic=True):
+    def _create_TX_node(self, bic=True, ustrd=True):
         """
         Method to create the blank transaction nodes as a dict. If bic is True,
-        the BIC node will also be created.
+        the BIC node will also be created. If ustrd is True, the node for the
+        unstructured remittance information will be created.
         """
         ED = dict()
-        ED['CdtTrfTxInfNode'] = ET.Element("CdtTrfTxInf")
-        ED['PmtIdNode'] = ET.Element("PmtId")
-        ED['PmtTpInfNode'] = ET.Element("PmtTpInf")
-        ED['CtgyPurpNode'] = ET.Element("CtgyPurp")
-        ED['Cd_CtgyPurp'] = ET.Element("Cd")
-        ED['EndToEnd_PmtId_Node'] = ET.Element("EndToEndId")
-        ED['InstrId_Node'] = ET.Element("InstrId")
-        ED['AmtNode'] = ET.Element("Amt")
-        ED['InstdAmtNode'] = ET.Element("InstdAmt")
-        ED['CdtrNode'] = ET.Element("Cdtr")
-        ED['Nm_Cdtr_Node'] = ET.Element("Nm")
-
-        ED['CdtrAgtNode'] = ET.Element("CdtrAgt")
-        ED['FinInstnId_CdtrAgt_Node'] = ET.Element("FinInstnId")
+        ED['CdtTrfTxInfNode'] = self.backend.Element("CdtTrfTxInf")
+        ED['PmtIdNode'] = self.backend.Element("PmtId")
+        ED['PmtTpInfNode'] = self.backend.Element("PmtTpInf")
+        ED['CtgyPurpNode'] = self.backend.Element("CtgyPurp")
+        ED['Cd_CtgyPurp'] = self.backend.Element("Cd")
+        ED['EndToEnd_PmtId_Node'] = self.backend.Element("EndToEndId")
+        ED['InstrId_Node'] = self.backend.Element("InstrId")
+        ED['AmtNode'] = self.backend.Element("Amt")
+        ED['InstdAmtNode'] = self.backend.Element("InstdAmt")
+        ED['CdtrNode'] = self.backend.Element("Cdtr")
+        ED['Nm_Cdtr_Node'] = self.backend.Element("Nm")
+
+        ED['CdtrAgtNode'] = self.backend.Element("CdtrAgt")
+        ED['FinInstnId_CdtrAgt_Node'] = self.backend.Element("FinInstnId")
         if bic:
-            ED['BIC_CdtrAgt_Node'] = ET.Element("BIC")
-        ED['CdtrAcctNode'] = ET.Element("CdtrAcct")
-        ED['Id_CdtrAcct_Node'] = ET.Element("Id")
-        ED['IBAN_CdtrAcct_Node'] = ET.Element("IBAN")
-        ED['RmtInfNode'] = ET.Element("RmtInf")
-        if ("description" in payment):
-            ED['UstrdNode'] = ET.Element("Ustrd")
+            ED['BIC_CdtrAgt_Node'] = self.backend.Element("BIC")
+        ED['CdtrAcctNode'] = self.backend.Element("CdtrAcct")
+        ED['Id_CdtrAcct_Node'] = self.backend.Element("Id")
+        ED['IBAN_CdtrAcct_Node'] = self.backend.Element("IBAN")
+        ED['RmtInfNode'] = self.backend.Element("RmtInf")
+        if ustrd:
+            ED['UstrdNode'] = self.backend.Element("Ustrd")
         return ED
 
-    def _add_non_batch(self, TX_nodes,  PmtInf_nodes):
+    def _TX_values(self, payment):
         """
-        Method to add a transaction as non batch, will fold the transaction
-        together with the payment info node and append to the main xml.
+        Method to collect the final values of all transaction fields.
+        @return: tuple of InstrId (None, it is filled in by _add_TX),
+        EndToEndId, amount, BIC (None if not provided), name, IBAN,
+        description and the list of documents (None if a description is given)
         """
+        return (
+            None,
+            payment.get('endtoend_id', 'NOTPROVIDED'),
+            int_to_decimal_str(payment['amount']),
+            payment['BIC'] if 'BIC' in payment else None,
+            payment['name'],
+            payment['IBAN'],
+            payment.get('description'),
+            None if 'description' in payment else payment['document'],
+        )
+
+    def _create_TX(self, values):
+        """
+        Method to create a transaction from its field values. With the
+        template serializer, the transaction is rendered to bytes right away,
+        otherwise the CdtTrfTxInf node is returned. Transactions with
+        structured remittance information are always built as nodes. For CBI,
+        the InstrId is only numbered on export, so a rendered transaction is
+        kept as tuple of the bytes before and after the InstrId value and a
+        node is kept as is. With the deferred serializer, the values of batch
+        transactions are kept as they are.
+        """
+        if self.serializer == 'deferred' and self._config['batch']:
+            return values
+        if self.serializer != 'template':
+            return self._create_TX_node_from(values)
+
+        cbi = self.schema == 'CBIPaymentRequest.00.04.00'
+        if values[7] is None:
+            bic = values[3] is not None
+            template = self._TX_templates.get(bic)
+            if template is None:
+                sample = placeholders(len(values))
+                if not bic:
+                    sample[3] = None
+                sample[7] = None
+                template = ByteTemplate(self._create_TX_node_from(sample))
+                self._TX_templates[bic] = template
+            if cbi:
+                values = ("",) + values[1:]
+            TX = template.render(values)
+            if TX is not None:
+                if cbi:
+                    head, sep, tail = TX.partition(b"</InstrId>")
+                    return (head, sep + tail)
+                return TX
+
+        node = self._create_TX_node_from(values)
+        if cbi:
+            return node
+        return self.backend.tostring(node)
+
+    def _create_TX_node_from(self, values):
+        """
+        Method to create the folded CdtTrfTxInf node from the transaction
+        field values.
+        """
+        instr_id, endtoend_id, amount, bic, name, iban, description, documents = values
+        TX_nodes = self._create_TX_node(bic is not None, documents is None)
+        if bic is not None:
+            TX_nodes['BIC_CdtrAgt_Node'].text = bic
 
-        if (self.schema == 'CBIPaymentRequest.00.04.00'):
-            PmtInfnode = self._xml.find('PmtInf')
-        else:
-            PmtInfnode = PmtInf_nodes['PmtInfNode']
-        PmtInfnode.append(PmtInf_nodes['PmtInfIdNode'])
-        PmtInfnode.append(PmtInf_nodes['PmtMtdNode'])
-        PmtInfnode.append(PmtInf_nodes['BtchBookgNode'])
-        if (self.schema != 'CBIPaymentRequest.00.04.00'):
-            PmtInfnode.append(PmtInf_nodes['NbOfTxsNode'])
-            PmtInfnode.append(PmtInf_nodes['CtrlSumNode'])
-
-        PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['InstrPrtyNode'])
-        if not self._config.get('domestic', False):
-            PmtInf_nodes['SvcLvlNode'].append(PmtInf_nodes['Cd_SvcLvl_Node'])
-            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SvcLvlNode'])
-
-        PmtInfnode.append(PmtInf_nodes['PmtTpInfNode'])
-        PmtInfnode.append(PmtInf_nodes['ReqdExctnDtNode'])
-
-        PmtInf_nodes['DbtrNode'].append(PmtInf_nodes['Nm_Dbtr_Node'])
-        PmtInfnode.append(PmtInf_nodes['DbtrNode'])
-
-        PmtInf_nodes['Id_DbtrAcct_Node'].append(PmtInf_nodes['IBAN_DbtrAcct_Node'])
-        PmtInf_nodes['DbtrAcctNode'].append(PmtInf_nodes['Id_DbtrAcct_Node'])
-        PmtInfnode.append(PmtInf_nodes['DbtrAcctNode'])
-
-        if 'BIC' in self._config:
-            PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['BIC_DbtrAgt_Node'])
-        if (self.schema == 'CBIPaymentRequest.00.04.00'):
-            PmtInf_nodes['ClrSysMmbId_Node'].append(PmtInf_nodes['MmbId_Node'])
-            PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['ClrSysMmbId_Node'])
-        PmtInf_nodes['DbtrAgtNode'].append(PmtInf_nodes['FinInstnId_DbtrAgt_Node'])
-        PmtInfnode.append(PmtInf_nodes['DbtrAgtNode'])
+        TX_nodes['Nm_Cdtr_Node'].text = name
+        TX_nodes['InstdAmtNode'].set("Ccy", self._config['currency'])
+        TX_nodes['InstdAmtNode'].text = amount
+        TX_nodes['Cd_CtgyPurp'].text = "SUPP"
+        TX_nodes['IBAN_CdtrAcct_Node'].text = iban
+        TX_nodes['EndToEnd_PmtId_Node'].text = endtoend_id
+        TX_nodes['InstrId_Node'].text = instr_id
 
-        PmtInfnode.append(PmtInf_nodes['ChrgBrNode'])
+        if documents is None:
+            TX_nodes['UstrdNode'].text = description
 
         if (self.schema == 'CBIPaymentRequest.00.04.00'):
             TX_nodes['PmtIdNode'].append(TX_nodes['InstrId_Node'])
@@ -337,72 +528,90 @@ class SepaTransfer(SepaPaymentInitn):
             TX_nodes['RmtInfNode'].append(TX_nodes['UstrdNode'])
             TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['RmtInfNode'])
         else:
-            for x in self.strd_data(payment):
+            for x in self._strd_nodes(documents):
                 TX_nodes['RmtInfNode'].append(x['StrdNode'])
             TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['RmtInfNode'])
-        PmtInfnode.append(TX_nodes['CdtTrfTxInfNode'])
+        return TX_nodes['CdtTrfTxInfNode']
 
-        if (self.schema != 'CBIPaymentRequest.00.04.00'):
-            CstmrCdtTrfInitn_node = self._xml.find('CstmrCdtTrfInitn')
-            CstmrCdtTrfInitn_node.append(PmtInfnode)
-
-    def _add_batch(self, TX_nodes, payment):
+    def _add_non_batch(self, TX, PmtInf_nodes):
         """
-        Method to add a payment as a batch. The transaction details are already
-        present. Will fold the nodes accordingly and the call the
-        _add_to_batch_list function to store the batch.
+        Method to add a transaction as non batch, will fold the transaction
+        together with the payment info node and append to the main xml. With
+        the template serializer, the payment info node is rendered as well
+        and kept as a fragment.
         """
+
         if (self.schema == 'CBIPaymentRequest.00.04.00'):
-            TX_nodes['PmtIdNode'].append(TX_nodes['InstrId_Node'])
-        TX_nodes['PmtIdNode'].append(TX_nodes['EndToEnd_PmtId_Node'])
-        TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['PmtIdNode'])
+            if self.serializer == 'template':
+                PmtInfnode = self.backend.Element("PmtInf")
+            else:
+                PmtInfnode = self.backend.find(self._xml, 'PmtInf')
+        else:
+            PmtInfnode = PmtInf_nodes['PmtInfNode']
+        PmtInfnode.append(PmtInf_nodes['PmtInfIdNode'])
+        PmtInfnode.append(PmtInf_nodes['PmtMtdNode'])
+        PmtInfnode.append(PmtInf_nodes['BtchBookgNode'])
+        if (self.schema != 'CBIPaymentRequest.00.04.00'):
+            PmtInfnode.append(PmtInf_nodes['NbOfTxsNode'])
+            PmtInfnode.append(PmtInf_nodes['CtrlSumNode'])
+
+        PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['InstrPrtyNode'])
+        if not self._config.get('domestic', False):
+            PmtInf_nodes['SvcLvlNode'].append(PmtInf_nodes['Cd_SvcLvl_Node'])
+            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SvcLvlNode'])
+
+        PmtInfnode.append(PmtInf_nodes['PmtTpInfNode'])
+        PmtInfnode.append(PmtInf_nodes['ReqdExctnDtNode'])
+
+        PmtInf_nodes['DbtrNode'].append(PmtInf_nodes['Nm_Dbtr_Node'])
+        PmtInfnode.append(PmtInf_nodes['DbtrNode'])
+
+        PmtInf_nodes['Id_DbtrAcct_Node'].append(PmtInf_nodes['IBAN_DbtrAcct_Node'])
+        PmtInf_nodes['DbtrAcctNode'].append(PmtInf_nodes['Id_DbtrAcct_Node'])
+        PmtInfnode.append(PmtInf_nodes['DbtrAcctNode'])
+
+        if 'BIC' in self._config:
+            PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['BIC_DbtrAgt_Node'])
         if (self.schema == 'CBIPaymentRequest.00.04.00'):
-            TX_nodes['CtgyPurpNode'].append(TX_nodes['Cd_CtgyPurp'])
-            TX_nodes['PmtTpInfNode'].append(TX_nodes['CtgyPurpNode'])
-            TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['PmtTpInfNode'])
-        TX_nodes['AmtNode'].append(TX_nodes['InstdAmtNode'])
-        TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['AmtNode'])
+            PmtInf_nodes['ClrSysMmbId_Node'].append(PmtInf_nodes['MmbId_Node'])
+            PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['ClrSysMmbId_Node'])
+        PmtInf_nodes['DbtrAgtNode'].append(PmtInf_nodes['FinInstnId_DbtrAgt_Node'])
+        PmtInfnode.append(PmtInf_nodes['DbtrAgtNode'])
 
-        if 'BIC_CdtrAgt_Node' in TX_nodes and TX_nodes['BIC_CdtrAgt_Node'].text is not None:
-            TX_nodes['FinInstnId_CdtrAgt_Node'].append(
-                TX_nodes['BIC_CdtrAgt_Node'])
-            TX_nodes['CdtrAgtNode'].append(TX_nodes['FinInstnId_CdtrAgt_Node'])
-            TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['CdtrAgtNode'])
+        PmtInfnode.append(PmtInf_nodes['ChrgBrNode'])
 
-        TX_nodes['CdtrNode'].append(TX_nodes['Nm_Cdtr_Node'])
-        TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['CdtrNode'])
+        if self.serializer == 'template':
+            if (self.schema == 'CBIPaymentRequest.00.04.00'):
+                self._fragments.append(b"".join([self.backend.tostring(node) for node in PmtInfnode]))
+                self._fragments.append(TX)
+            else:
+                PmtInf = self.backend.tostring(PmtInfnode)
+                self._fragments.append(PmtInf[:-len(b"</PmtInf>")] + TX + b"</PmtInf>")
+            return
 
-        TX_nodes['Id_CdtrAcct_Node'].append(TX_nodes['IBAN_CdtrAcct_Node'])
-        TX_nodes['CdtrAcctNode'].append(TX_nodes['Id_CdtrAcct_Node'])
-        TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['CdtrAcctNode'])
+        PmtInfnode.append(TX)
 
-        if('UstrdNode' in TX_nodes):
-            TX_nodes['RmtInfNode'].append(TX_nodes['UstrdNode'])
-            TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['RmtInfNode'])
-        else:
-            for x in self.strd_data(payment):
-                TX_nodes['RmtInfNode'].append(x['StrdNode'])
-            TX_nodes['CdtTrfTxInfNode'].append(TX_nodes['RmtInfNode'])
-        self._add_to_batch_list(TX_nodes, payment)
+        if (self.schema != 'CBIPaymentRequest.00.04.00'):
+            CstmrCdtTrfInitn_node = self.backend.find(self._xml, 'CstmrCdtTrfInitn')
+            CstmrCdtTrfInitn_node.append(PmtInfnode)
 
-    def _add_to_batch_list(self, TX_nodes, payment):
+    def _add_to_batch_list(self, TX, batch_key, amount):
         """
-        Method to add a transaction to the batch list. The correct batch will
-        be determined by the payment dict and the batch will be created if
-        not existant. This will also add the payment amount to the respective
-        batch total.
+        Method to add a transaction to the batch list. The batch will be
+        created if not existant. This will also add the payment amount to the
+        respective batch total.
         """
-        batch_key = payment.get('execution_date', self._config['execution_date'])
         if batch_key in self._batches.keys():
-            self._batches[batch_key].append(TX_nodes['CdtTrfTxInfNode'])
+            self._batches[batch_key].append(TX)
         else:
             self._batches[batch_key] = []
-            self._batches[batch_key].append(TX_nodes['CdtTrfTxInfNode'])
+            self._batches[batch_key].append(TX)
 
         if batch_key in self._batch_totals:
-            self._batch_totals[batch_key] += payment['amount']
+            self._batch_totals[batch_key] += amount
         else:
-            self._batch_totals[batch_key] = payment['amount']
+            self._batch_totals[batch_key] = amount
+        self._add_payment_run(batch_key, self._nb_of_txs_total)
 
     def _finalize_batch(self):
         """
@@ -412,108 +621,132 @@ class SepaTransfer(SepaPaymentInitn):
         transaction nodes will be folded. Finally, the batches will be added to
         the main XML.
         """
+        if (self.schema == 'CBIPaymentRequest.00.04.00'):
+            PmtInfnode = self.backend.find(self._xml, 'PmtInf')
+        else:
+            CstmrCdtTrfInitn_node = self.backend.find(self._xml, 'CstmrCdtTrfInitn')
+        instr_id = 0
         for batch_meta, batch_nodes in self._batches.items():
-            PmtInf_nodes = self._create_PmtInf_node()
+            PmtInf_node = self._create_batch_PmtInf_node(batch_meta, batch_nodes)
+            if (self.schema == 'CBIPaymentRequest.00.04.00'):
+                PmtInfnode.extend(PmtInf_node)
+            else:
+                PmtInfnode = PmtInf_node
+                CstmrCdtTrfInitn_node.append(PmtInfnode)
+            for txnode in batch_nodes:
+                if (self.schema == 'CBIPaymentRequest.00.04.00'):
+                    # The CBI InstrId is numbered in document order.
+                    instr_id += 1
+                    self.backend.find(txnode, 'PmtId/InstrId').text = str(instr_id)
+                PmtInfnode.append(txnode)
+
+    def _create_batch_PmtInf_node(self, batch_meta, batch_nodes):
+        """
+        Method to create the PmtInf node of a single batch, filled with the
+        batch information but without the transaction nodes. For the CBI
+        schema, all batches share the single PmtInf node of the document, so
+        the children of the returned node have to be moved there.
+        """
+        PmtInf_nodes = self._create_PmtInf_node()
+        if self.deterministic:
+            PmtInf_nodes['PmtInfIdNode'].text = self._document_id("PmtInf", batch_meta)
+        else:
             PmtInf_nodes['PmtInfIdNode'].text = self._config['unique_id']
 
-            if ('notify' in self._config):
-                if not self._config['notify']:
-                    PmtInf_nodes['PmtMtdNode'].text = "TRF"
-                else :
-                    PmtInf_nodes['PmtMtdNode'].text = "TRA"
-            else :
+        if ('notify' in self._config):
+            if not self._config['notify']:
                 PmtInf_nodes['PmtMtdNode'].text = "TRF"
-
-            PmtInf_nodes['BtchBookgNode'].text = "true"
-            if not self._config.get('domestic', False):
-                PmtInf_nodes['Cd_SvcLvl_Node'].text = "SEPA"
-            if batch_meta:
-                PmtInf_nodes['ReqdExctnDtNode'].text = batch_meta
-
-            PmtInf_nodes['NbOfTxsNode'].text = str(len(batch_nodes))
-            PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(self._batch_totals[batch_meta])
-
-            if ('priority' in self._config):
-                if not self._config['priority']:
-                    PmtInf_nodes['InstrPrtyNode'].text = "NORM"
-                else :
-                    PmtInf_nodes['InstrPrtyNode'].text = "HIGH"
             else :
-                PmtInf_nodes['InstrPrtyNode'].text = "NORM"
+                PmtInf_nodes['PmtMtdNode'].text = "TRA"
+        else :
+            PmtInf_nodes['PmtMtdNode'].text = "TRF"
 
-            PmtInf_nodes['Nm_Dbtr_Node'].text = self._config['name']
-            PmtInf_nodes['IBAN_DbtrAcct_Node'].text = self._config['IBAN']
-            if 'BIC' in self._config:
-                PmtInf_nodes['BIC_DbtrAgt_Node'].text = self._config['BIC']
+        PmtInf_nodes['BtchBookgNode'].text = "true"
+        if not self._config.get('domestic', False):
+            PmtInf_nodes['Cd_SvcLvl_Node'].text = "SEPA"
+        if batch_meta:
+            PmtInf_nodes['ReqdExctnDtNode'].text = batch_meta
 
-            PmtInf_nodes['ChrgBrNode'].text = "SLEV"
-            PmtInf_nodes['MmbId_Node'].text = self._config['bank_code']
+        PmtInf_nodes['NbOfTxsNode'].text = str(len(batch_nodes))
+        PmtInf_nodes['CtrlSumNode'].text = int_to_decimal_str(self._batch_totals.get(batch_meta, 0))
 
-            if (self.schema == 'CBIPaymentRequest.00.04.00'):
-                PmtInfnode = self._xml.find('PmtInf')
-            else:
-                PmtInfnode = PmtInf_nodes['PmtInfNode']
-            PmtInfnode.append(PmtInf_nodes['PmtInfIdNode'])
-            PmtInfnode.append(PmtInf_nodes['PmtMtdNode'])
-            PmtInfnode.append(PmtInf_nodes['BtchBookgNode'])
+        if ('priority' in self._config):
+            if not self._config['priority']:
+                PmtInf_nodes['InstrPrtyNode'].text = "NORM"
+            else :
+                PmtInf_nodes['InstrPrtyNode'].text = "HIGH"
+        else :
+            PmtInf_nodes['InstrPrtyNode'].text = "NORM"
 
-            if (self.schema != 'CBIPaymentRequest.00.04.00'):
-                PmtInfnode.append(PmtInf_nodes['NbOfTxsNode'])
-                PmtInfnode.append(PmtInf_nodes['CtrlSumNode'])
+        PmtInf_nodes['Nm_Dbtr_Node'].text = self._config['name']
+        PmtInf_nodes['IBAN_DbtrAcct_Node'].text = self._config['IBAN']
+        if 'BIC' in self._config:
+            PmtInf_nodes['BIC_DbtrAgt_Node'].text = self._config['BIC']
 
-            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['InstrPrtyNode'])
+        PmtInf_nodes['ChrgBrNode'].text = "SLEV"
+        PmtInf_nodes['MmbId_Node'].text = self._config['bank_code']
 
-            if not self._config.get('domestic', False):
-                PmtInf_nodes['SvcLvlNode'].append(PmtInf_nodes['Cd_SvcLvl_Node'])
-                PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SvcLvlNode'])
-            PmtInfnode.append(PmtInf_nodes['PmtTpInfNode'])
-            PmtInfnode.append(PmtInf_nodes['ReqdExctnDtNode'])
+        if (self.schema == 'CBIPaymentRequest.00.04.00'):
+            PmtInfnode = self.backend.Element("PmtInf")
+        else:
+            PmtInfnode = PmtInf_nodes['PmtInfNode']
+        PmtInfnode.append(PmtInf_nodes['PmtInfIdNode'])
+        PmtInfnode.append(PmtInf_nodes['PmtMtdNode'])
+        PmtInfnode.append(PmtInf_nodes['BtchBookgNode'])
 
-            PmtInf_nodes['DbtrNode'].append(PmtInf_nodes['Nm_Dbtr_Node'])
-            PmtInfnode.append(PmtInf_nodes['DbtrNode'])
+        if (self.schema != 'CBIPaymentRequest.00.04.00'):
+            PmtInfnode.append(PmtInf_nodes['NbOfTxsNode'])
+            PmtInfnode.append(PmtInf_nodes['CtrlSumNode'])
 
-            PmtInf_nodes['Id_DbtrAcct_Node'].append(PmtInf_nodes['IBAN_DbtrAcct_Node'])
-            PmtInf_nodes['DbtrAcctNode'].append(PmtInf_nodes['Id_DbtrAcct_Node'])
-            PmtInfnode.append(PmtInf_nodes['DbtrAcctNode'])
+        PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['InstrPrtyNode'])
 
-            if 'BIC' in self._config:
-                PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['BIC_DbtrAgt_Node'])
-            if (self.schema == 'CBIPaymentRequest.00.04.00'):
-                PmtInf_nodes['ClrSysMmbId_Node'].append(PmtInf_nodes['MmbId_Node'])
-                PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['ClrSysMmbId_Node'])
-            PmtInf_nodes['DbtrAgtNode'].append(PmtInf_nodes['FinInstnId_DbtrAgt_Node'])
-            PmtInfnode.append(PmtInf_nodes['DbtrAgtNode'])
+        if not self._config.get('domestic', False):
+            PmtInf_nodes['SvcLvlNode'].append(PmtInf_nodes['Cd_SvcLvl_Node'])
+            PmtInf_nodes['PmtTpInfNode'].append(PmtInf_nodes['SvcLvlNode'])
+        PmtInfnode.append(PmtInf_nodes['PmtTpInfNode'])
+        PmtInfnode.append(PmtInf_nodes['ReqdExctnDtNode'])
 
-            PmtInfnode.append(PmtInf_nodes['ChrgBrNode'])
+        PmtInf_nodes['DbtrNode'].append(PmtInf_nodes['Nm_Dbtr_Node'])
+        PmtInfnode.append(PmtInf_nodes['DbtrNode'])
 
-            for txnode in batch_nodes:
-                PmtInfnode.append(txnode)
+        PmtInf_nodes['Id_DbtrAcct_Node'].append(PmtInf_nodes['IBAN_DbtrAcct_Node'])
+        PmtInf_nodes['DbtrAcctNode'].append(PmtInf_nodes['Id_DbtrAcct_Node'])
+        PmtInfnode.append(PmtInf_nodes['DbtrAcctNode'])
 
-            if (self.schema != 'CBIPaymentRequest.00.04.00'):
-                CstmrCdtTrfInitn_node = self._xml.find('CstmrCdtTrfInitn')
-                CstmrCdtTrfInitn_node.append(PmtInf_nodes['PmtInfNode'])
+        if 'BIC' in self._config:
+            PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['BIC_DbtrAgt_Node'])
+        if (self.schema == 'CBIPaymentRequest.00.04.00'):
+            PmtInf_nodes['ClrSysMmbId_Node'].append(PmtInf_nodes['MmbId_Node'])
+            PmtInf_nodes['FinInstnId_DbtrAgt_Node'].append(PmtInf_nodes['ClrSysMmbId_Node'])
+        PmtInf_nodes['DbtrAgtNode'].append(PmtInf_nodes['FinInstnId_DbtrAgt_Node'])
+        PmtInfnode.append(PmtInf_nodes['DbtrAgtNode'])
 
+        PmtInfnode.append(PmtInf_nodes['ChrgBrNode'])
+        return PmtInfnode
 
     def _create_strd_nodes(self):
 
         ED = dict()
-        ED['Nb_Node'] = ET.Element('Nb')
-        ED['Cd_Node'] = ET.Element('Cd')
-        ED['CdtNoteAmt_Node'] = ET.Element('CdtNoteAmt')
-        ED['RltdDt_Node'] = ET.Element('RltdDt')
-        ED['StrdNode'] = ET.Element("Strd")
-        ED['CdOrPrtryNode'] = ET.Element("CdOrPrtry")
-        ED['TpNode'] = ET.Element("Tp")
-        ED['RfrdDocInfNode'] = ET.Element("RfrdDocInf")
-        ED['RfrdDocAmtNode'] = ET.Element("RfrdDocAmt")
-        ED['AddtlRmtInfNode'] = ET.Element("AddtlRmtInf")
+        ED['Nb_Node'] = self.backend.Element('Nb')
+        ED['Cd_Node'] = self.backend.Element('Cd')
+        ED['CdtNoteAmt_Node'] = self.backend.Element('CdtNoteAmt')
+        ED['RltdDt_Node'] = self.backend.Element('RltdDt')
+        ED['StrdNode'] = self.backend.Element("Strd")
+        ED['CdOrPrtryNode'] = self.backend.Element("CdOrPrtry")
+        ED['TpNode'] = self.backend.Element("Tp")
+        ED['RfrdDocInfNode'] = self.backend.Element("RfrdDocInf")
+        ED['RfrdDocAmtNode'] = self.backend.Element("RfrdDocAmt")
+        ED['AddtlRmtInfNode'] = self.backend.Element("AddtlRmtInf")
 
         return ED
 
     def strd_data(self, payment):
+        return self._strd_nodes(payment['document'])
+
+    def _strd_nodes(self, documents):
 
         lst =  list()
-        for batches in payment['document']:
+        for batches in documents:
             # adding data to TX_Nodes
             strd_node = self._create_strd_nodes()
             strd_node['Nb_Node'].text = batches["number"]
@@ -1,7 +1,13 @@
 import hashlib
+import multiprocessing
 import random
 import re
+import sys
 import time
+from functools import lru_cache
+from itertools import islice
+
+from .ids import TOKEN_LENGTH, get_generator
 
 try:
     random = random.SystemRandom()
@@ -38,27 +44,79 @@ def get_rand_string(length=12, allowed_chars='0123456789abcdef'):
 
 def make_msg_id():
     """
-    Create a semi random message id, by using 12 char random hex string and
-    a timestamp.
-    @return: string consisting of timestamp, -, random value
+    Create a semi random message id, by using a 12 char token of the id
+    generator and a timestamp.
+    @return: string consisting of timestamp, -, token
     """
-    random_string = get_rand_string(12)
     timestamp = time.strftime("%Y%m%d%I%M%S")
-    msg_id = timestamp + "-" + random_string
-    return msg_id
+    return timestamp + "-" + get_generator().token()
 
 
 def make_id(name):
     """
     Create a random id combined with the creditor name.
     @return string consisting of name (truncated at 22 chars), -,
-    12 char rand hex string.
+    12 char token of the id generator.
+    """
+    return id_prefix(name) + "-" + get_generator().token()
+
+
+def make_ids(name, count):
+    """
+    Create multiple random ids combined with the creditor name, like make_id
+    but the name is only prepared once.
+    @return list of count ids
+    """
+    name = id_prefix(name)
+    return [name + "-" + token for token in get_generator().tokens(count)]
+
+
+def make_content_id(name, *content):
+    """
+    Create an id from a hash of the content combined with the creditor name,
+    the same content always results in the same id.
+    @return string consisting of name (truncated at 22 chars), -, the first
+    12 hex chars of the SHA-256 hash of the content.
+    """
+    digest = hashlib.sha256(repr(content).encode('utf-8')).hexdigest()
+    return id_prefix(name) + "-" + digest[:TOKEN_LENGTH]
+
+
+@lru_cache(maxsize=256)
+def id_prefix(name):
+    """
+    Helper to strip the creditor name down to the first 22 alphanumeric
+    characters for the ids. The result is cached, as every id of a document
+    is made from the same name.
+    """
+    return re.sub(r'[^a-zA-Z0-9]', '', name)[:22]
+
+
+def chunked(iterable, size):
+    """
+    Helper to split an iterable into lists of at most size items.
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def fork_context():
+    """
+    Helper to get the multiprocessing context for process pools whose
+    workers inherit their data by fork.
+    @return: The fork context, None if fork is not available or if the
+    ProcessPoolExecutor does not take a context and an initializer yet
+    (before Python 3.7)
     """
-    name = re.sub(r'[^a-zA-Z0-9]', '', name)
-    r = get_rand_string(12)
-    if len(name) > 22:
-        name = name[:22]
-    return name + "-" + r
+    if sys.version_info < (3, 7):
+        return None
+    try:
+        return multiprocessing.get_context("fork")
+    except ValueError:
+        return None
 
 
 def int_to_decimal_str(integer):
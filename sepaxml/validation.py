@@ -1,18 +1,508 @@
 import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from decimal import Decimal
+
+from .utils import fork_context
 
 
 class ValidationError(Exception):
-    pass
+    """
+    Raised when a document is invalid. Where it is known, the location of the
+    first error is given as well: the path of the element, the index of the
+    PmtInf block and of the transaction within it (from 0), the EndToEndId
+    and the MndtId of the transaction and, set by the builders, the index of
+    the payment in the order the payments were added.
+    """
+
+    def __init__(self, message, path=None, PmtInf_index=None, TX_index=None, endtoend_id=None, mandate_id=None,
+                 payment_index=None):
+        super().__init__(message)
+        self.path = path
+        self.PmtInf_index = PmtInf_index
+        self.TX_index = TX_index
+        self.endtoend_id = endtoend_id
+        self.mandate_id = mandate_id
+        self.payment_index = payment_index
+
+    def __reduce__(self):
+        # Keep the location when the error is sent from a worker process.
+        return (self.__class__, (self.args[0], self.path, self.PmtInf_index, self.TX_index, self.endtoend_id,
+                                 self.mandate_id, self.payment_index))
+
+
+MESSAGE = (
+    "The output SEPA file contains validation errors. This is likely due to an illegal value in one of "
+    "your input fields."
+)
+
+_PATH_STEP = re.compile(r"/(PmtInf|DrctDbtTxInf|CdtTrfTxInf)(?:\[(\d+)\])?(?=/|$)")
+_TX_IDS = re.compile(rb"<(EndToEndId|MndtId)>([^<]*)<")
+
+
+def located_error(path, xmlout=None, TX_node=None):
+    """
+    Create the ValidationError of the first error of a document, which is
+    only done when the document is invalid.
+    @param path: The path of the invalid element, with the index of an
+    element among its siblings of the same name if it has any
+    @param xmlout: The document, to find the ids of the transaction in
+    @param TX_node: The lxml node of the transaction, if the error is in one
+    @return: The ValidationError
+    """
+    PmtInf_index = TX_index = None
+    for match in _PATH_STEP.finditer(path):
+        index = int(match.group(2) or 1) - 1
+        if match.group(1) == "PmtInf":
+            PmtInf_index = index
+        else:
+            TX_index = index
+    ids = {}
+    if TX_node is not None:
+        for tag in ("EndToEndId", "MndtId"):
+            ids[tag] = TX_node.findtext(".//{*}" + tag)
+    elif xmlout is not None and PmtInf_index is not None and TX_index is not None:
+        ids = _TX_ids(xmlout, PmtInf_index, TX_index)
+    error = ValidationError(MESSAGE, path, PmtInf_index, TX_index, ids.get("EndToEndId"), ids.get("MndtId"))
+    error.args = (MESSAGE + " " + _describe(error),)
+    return error
+
+
+def _describe(error):
+    """
+    Helper to describe the location of an error for its message.
+    """
+    description = "The first error is at " + error.path
+    ids = ["%s %s" % (name, value) for name, value in (("EndToEndId", error.endtoend_id), ("MndtId", error.mandate_id))
+           if value is not None]
+    if ids:
+        description += " (" + ", ".join(ids) + ")"
+    return description + "."
+
+
+def _TX_ids(xmlout, PmtInf_index, TX_index):
+    """
+    Helper to find the EndToEndId and MndtId of a transaction in a document.
+    @return: dict of the ids by tag
+    """
+    position = -1
+    for i in range(PmtInf_index + 1):
+        position = xmlout.find(_PMTINF_OPEN, position + 1)
+        if position < 0:
+            return {}
+    end = xmlout.find(_PMTINF_CLOSE, position)
+    starts = [match.start() for match in _TX_START.finditer(xmlout, position, end)]
+    if TX_index >= len(starts):
+        return {}
+    TX_end = starts[TX_index + 1] if TX_index + 1 < len(starts) else end
+    return {tag.decode(): value.decode() for tag, value in _TX_IDS.findall(xmlout[starts[TX_index]:TX_end])}
+
+
+def _lxml_error(error, root):
+    """
+    Helper to locate the first error of an lxml validation, whose path only
+    consists of positions, in the document tree.
+    """
+    from lxml import etree  # lxml is an optional dependency
+    nodes = root.getroottree().xpath(error.error_log[0].path) if len(error.error_log) else []
+    if not nodes:
+        return ValidationError(MESSAGE)
+    steps = []
+    TX_node = None
+    node = nodes[0]
+    while node is not None:
+        parent = node.getparent()
+        name = etree.QName(node).localname
+        if name in ("DrctDbtTxInf", "CdtTrfTxInf"):
+            TX_node = node
+        if parent is not None:
+            siblings = [child for child in parent if child.tag == node.tag]
+            if len(siblings) > 1:
+                name += "[%d]" % (siblings.index(node) + 1)
+        steps.append(name)
+        node = parent
+    return located_error("/" + "/".join(reversed(steps)), TX_node=TX_node)
+
+
+class SchemaCache:
+    """
+    Process-wide registry of compiled XML schemas. Every schema is parsed and
+    compiled on first use only and then kept for the life of the process,
+    unless it is evicted explicitly with clear().
+    """
+
+    def __init__(self):
+        self._schemas = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, schema):
+        """
+        Return the compiled schema, compiling it if it is not cached yet.
+        @param schema: The schema name, e.g. pain.008.001.02
+        @return: The compiled xmlschema.XMLSchema object
+        """
+        with self._lock:
+            compiled = self._schemas.get(schema)
+            if compiled is not None:
+                self.hits += 1
+                return compiled
+            self.misses += 1
+            compiled = self._compile(schema)
+            self._schemas[schema] = compiled
+            return compiled
+
+    def _compile(self, schema):
+        import xmlschema  # xmlschema does some weird monkeypatching in etree, if we import it globally, things fail
+        return xmlschema.XMLSchema(schema_path(schema))
+
+    def clear(self, schema=None):
+        """
+        Evict a single schema or, if no schema is given, all schemas from the
+        cache. The hit/miss counters are kept.
+        @param schema: The schema name to evict
+        """
+        with self._lock:
+            if schema is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop(schema, None)
+
+    def stats(self):
+        """
+        @return: dict with the hit and miss counters and the cached schema names
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'schemas': sorted(self._schemas.keys()),
+            }
+
+
+schema_cache = SchemaCache()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# The document that is being validated in chunks, only set in the forked
+# worker processes by their initializer.
+_fork_document = None
+
+_PMTINF_OPEN = b"<PmtInf>"
+_PMTINF_CLOSE = b"</PmtInf>"
+_TX_START = re.compile(rb"<(?:DrctDbtTxInf|CdtTrfTxInf)>")
+_AMOUNT = re.compile(rb"<InstdAmt[^>]*>([^<]*)</InstdAmt>")
+_NB_OF_TXS = re.compile(rb"<NbOfTxs>([^<]*)</NbOfTxs>")
+_CTRL_SUM = re.compile(rb"<CtrlSum>([^<]*)</CtrlSum>")
+
+
+def validation_executor():
+    """
+    @return: The process-wide thread pool for background validation, which is
+    started on first use.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(thread_name_prefix="sepaxml-validation")
+        return _executor
+
+
+def schema_path(schema):
+    return os.path.join(os.path.dirname(__file__), 'schemas', schema + '.xsd')
 
 
 def try_valid_xml(xmlout, schema):
-    import xmlschema  # xmlschema does some weird monkeypatching in etree, if we import it globally, things fail
+    """
+    Validate a serialized document with the current validator.
+    @param xmlout: The document as UTF-8 bytes
+    @raise ValidationError: when the document is invalid
+    """
+    _validator.validate(xmlout, schema)
+
+
+def try_valid_file(path, schema):
+    """
+    Validate a document file with the current validator.
+    @raise ValidationError: when the document is invalid
+    """
+    _validator.validate_file(path, schema)
+
+
+class LxmlSchemaCache(SchemaCache):
+    """
+    Process-wide registry of XML schemas compiled with lxml.
+    """
+
+    def _compile(self, schema):
+        from lxml import etree  # lxml is an optional dependency
+        return etree.XMLSchema(file=schema_path(schema))
+
+
+lxml_schema_cache = LxmlSchemaCache()
+
+
+def try_valid_tree(root, schema):
+    """
+    Validate a document tree built with lxml without serializing it.
+    @param root: The lxml root node of the document
+    @raise ValidationError: when the document is invalid
+    """
+    from lxml import etree  # lxml is an optional dependency
+    try:
+        lxml_schema_cache.get(schema).assertValid(root)
+
+    except etree.DocumentInvalid as e:
+        raise _lxml_error(e, root) from e
+
+
+class XmlschemaValidator:
+    """
+    Validation with xmlschema, which validates the decoded document in pure
+    Python.
+    """
+    name = "xmlschema"
+
+    def validate(self, xmlout, schema):
+        """
+        @param xmlout: The document as UTF-8 bytes
+        @raise ValidationError: when the document is invalid
+        """
+        import xmlschema  # xmlschema does some weird monkeypatching in etree, if we import it globally, things fail
+        try:
+            schema_cache.get(schema).validate(xmlout.decode())
+
+        except xmlschema.XMLSchemaValidationError as e:
+            raise located_error(e.path, xmlout) from e
+
+    def validate_file(self, path, schema):
+        """
+        @param path: The path of the document file
+        @raise ValidationError: when the document is invalid
+        """
+        import xmlschema  # xmlschema does some weird monkeypatching in etree, if we import it globally, things fail
+        try:
+            schema_cache.get(schema).validate(path)
+
+        except xmlschema.XMLSchemaValidationError as e:
+            with open(path, "rb") as f:
+                raise located_error(e.path, f.read()) from e
+
+
+class LxmlValidator:
+    """
+    Validation with lxml, which parses the UTF-8 bytes or the file and
+    validates the tree in C without decoding the document into a string.
+    Requires lxml.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        try:
+            from lxml import etree  # lxml is an optional dependency
+        except ImportError:
+            raise Exception("The lxml validator requires lxml to be installed.")
+        self._etree = etree
+
+    def _parser(self):
+        return self._etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+
+    def validate(self, xmlout, schema):
+        """
+        @param xmlout: The document as UTF-8 bytes
+        @raise ValidationError: when the document is invalid
+        """
+        try:
+            root = self._etree.fromstring(xmlout, self._parser())
+        except self._etree.XMLSyntaxError as e:
+            raise ValidationError(MESSAGE) from e
+        try_valid_tree(root, schema)
+
+    def validate_file(self, path, schema):
+        """
+        @param path: The path of the document file
+        @raise ValidationError: when the document is invalid
+        """
+        try:
+            root = self._etree.parse(path, self._parser()).getroot()
+        except self._etree.XMLSyntaxError as e:
+            raise ValidationError(MESSAGE) from e
+        try_valid_tree(root, schema)
+
+
+VALIDATORS = {
+    "xmlschema": XmlschemaValidator,
+    "lxml": LxmlValidator,
+}
+
+_validator = XmlschemaValidator()
+
+
+def get_validator():
+    """
+    @return: The validator that is currently used
+    """
+    return _validator
+
+
+def set_validator(validator):
+    """
+    Replace the validator for all documents that are validated from now on.
+    @param validator: A validator or the name of one, "xmlschema" or "lxml"
+    @return: The previous validator
+    @raise exception: when the name is unknown
+    """
+    global _validator
+    if isinstance(validator, str):
+        if validator not in VALIDATORS:
+            raise Exception("Unknown validator: " + validator)
+        validator = VALIDATORS[validator]()
+    previous = _validator
+    _validator = validator
+    return previous
+
+
+def try_valid_xml_parallel(xmlout, schema, workers=None, chunk_size=10000):
+    """
+    Validate a large document in chunks in a pool of forked processes. The
+    document is split at the PmtInf boundaries, PmtInf blocks with more than
+    chunk_size transactions at the transaction boundaries, and every chunk is
+    validated with the current validator as a document of its own with the
+    same group header. The NbOfTxs and CtrlSum of the PmtInf blocks and of
+    the group header are checked against the transactions as well. Where
+    fork is not available and before Python 3.7, the chunks are validated in
+    this process. The document is handed to the workers by their
+    initializer, so documents can be validated from several threads at the
+    same time, but forking is unsafe while other threads hold locks, e.g.
+    while validations run in the thread pool of validation_executor.
+    @param workers: The number of processes, the number of CPUs if missing
+    @param chunk_size: The number of transactions per chunk
+    @raise ValidationError: when a chunk is invalid or the checksums do not
+    add up
+    """
+    start = xmlout.find(_PMTINF_OPEN)
+    if start < 0:
+        try_valid_xml(xmlout, schema)
+        return
+    end = xmlout.rfind(_PMTINF_CLOSE) + len(_PMTINF_CLOSE)
+
+    # The pieces are tuples of the number of transactions and the piece: the
+    # index of the PmtInf block, the range of its header, the range of some of
+    # its transactions and the index of the first of them.
+    pieces = []
+    declared = []
+    block_start = start
+    while block_start >= 0 and block_start < end:
+        block_end = xmlout.find(_PMTINF_CLOSE, block_start)
+        TX_starts = [match.start() for match in _TX_START.finditer(xmlout, block_start, block_end)]
+        header_end = TX_starts[0] if TX_starts else block_end
+        declared.append(_checksums(xmlout, block_start, header_end))
+        TX_starts.append(block_end)
+        for i in range(0, max(len(TX_starts) - 1, 1), chunk_size):
+            last = min(i + chunk_size, len(TX_starts) - 1)
+            pieces.append((last - i, (len(declared) - 1, block_start, header_end, TX_starts[i], TX_starts[last], i)))
+        block_start = xmlout.find(_PMTINF_OPEN, block_end)
+
+    chunks = []
+    chunk = []
+    size = 0
+    for count, piece in pieces:
+        chunk.append(piece)
+        size += count
+        if size >= chunk_size:
+            chunks.append(chunk)
+            chunk, size = [], 0
+    if chunk:
+        chunks.append(chunk)
+
+    mp_context = fork_context()
+    document = (xmlout, start, end)
+    if mp_context is None or workers == 1 or len(chunks) == 1:
+        results = [_validate_chunk(chunk, schema, document) for chunk in chunks]
+    else:
+        # The forked workers inherit the arguments of the initializer, the
+        # document is not pickled.
+        with ProcessPoolExecutor(workers, mp_context=mp_context, initializer=_init_fork_document,
+                                 initargs=(document,)) as pool:
+            results = list(pool.map(_validate_chunk, chunks, [schema] * len(chunks)))
+
+    counted = [[0, Decimal(0)] for i in declared]
+    for result in results:
+        for block, nb_of_txs, ctrl_sum in result:
+            counted[block][0] += nb_of_txs
+            counted[block][1] += ctrl_sum
+    for i, ((nb_of_txs, ctrl_sum), (TX_count, TX_sum)) in enumerate(zip(declared, counted)):
+        _compare_checksums("PmtInf %d" % i, nb_of_txs, ctrl_sum, TX_count, TX_sum)
+    nb_of_txs, ctrl_sum = _checksums(xmlout, 0, start)
+    _compare_checksums("GrpHdr", nb_of_txs, ctrl_sum, sum(count[0] for count in counted),
+                       sum(count[1] for count in counted))
+
+
+def _checksums(xmlout, start, end):
+    """
+    Helper to read the NbOfTxs and CtrlSum of a header, None if missing.
+    """
+    nb_of_txs = _NB_OF_TXS.search(xmlout, start, end)
+    ctrl_sum = _CTRL_SUM.search(xmlout, start, end)
+    return (
+        None if nb_of_txs is None else int(nb_of_txs.group(1)),
+        None if ctrl_sum is None else Decimal(ctrl_sum.group(1).decode()),
+    )
+
+
+def _compare_checksums(where, nb_of_txs, ctrl_sum, TX_count, TX_sum):
+    if nb_of_txs is not None and nb_of_txs != TX_count:
+        raise ValidationError("The NbOfTxs of the %s is %d, but there are %d transactions." % (where, nb_of_txs, TX_count))
+    if ctrl_sum is not None and ctrl_sum != TX_sum:
+        raise ValidationError("The CtrlSum of the %s is %s, but the transactions add up to %s." % (where, ctrl_sum, TX_sum))
+
+
+def _init_fork_document(document):
+    """
+    Initializer of the worker processes of try_valid_xml_parallel.
+    """
+    global _fork_document
+    _fork_document = document
+
+
+def _validate_chunk(chunk, schema, document=None):
+    """
+    Validate the pieces of a document as a document of their own.
+    @param document: tuple of the document and the range of its PmtInf
+    blocks, the one of the worker process if missing
+    @return: list of tuples of the index of the PmtInf block, the number and
+    the sum of the transactions of every piece
+    @raise ValidationError: when the chunk is invalid, located in the whole
+    document
+    """
+    xmlout, start, end = document or _fork_document
+    parts = [xmlout[:start]]
+    result = []
+    for block, header_start, header_end, TX_start, TX_end, first_TX in chunk:
+        TXs = xmlout[TX_start:TX_end]
+        parts.append(xmlout[header_start:header_end])
+        parts.append(TXs)
+        parts.append(_PMTINF_CLOSE)
+        amounts = _AMOUNT.findall(TXs)
+        result.append((block, len(_TX_START.findall(TXs)), sum(Decimal(amount.decode()) for amount in amounts)))
+    parts.append(xmlout[end:])
     try:
-        my_schema = xmlschema.XMLSchema(os.path.join(os.path.dirname(__file__), 'schemas', schema + '.xsd'))
-        my_schema.validate(xmlout.decode())
-
-    except xmlschema.XMLSchemaValidationError as e:
-        raise ValidationError(
-            "The output SEPA file contains validation errors. This is likely due to an illegal value in one of "
-            "your input fields."
-        ) from e
+        try_valid_xml(b"".join(parts), schema)
+    except ValidationError as e:
+        if e.PmtInf_index is None:
+            raise
+        block, header_start, header_end, TX_start, TX_end, first_TX = chunk[e.PmtInf_index]
+        TX_index = None if e.TX_index is None else first_TX + e.TX_index
+
+        def step(match):
+            # Every PmtInf block and transaction is numbered in the whole document.
+            index = block if match.group(1) == "PmtInf" else TX_index
+            return "/%s[%d]" % (match.group(1), index + 1)
+        error = ValidationError(MESSAGE, _PATH_STEP.sub(step, e.path), block, TX_index, e.endtoend_id, e.mandate_id)
+        error.args = (MESSAGE + " " + _describe(error),)
+        raise error from e
+    return result
@@ -0,0 +1,53 @@
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from tests.utils import (clean_ids, debit_config, debit_payment,
+                         transfer_config, transfer_payment)
+
+
+def debit():
+    return SepaDD(debit_config(), schema="pain.008.003.02")
+
+
+def debit_payments(count):
+    for i in range(count):
+        yield debit_payment(i, type="FRST" if i % 3 else "RCUR")
+
+
+def test_add_payments_debit():
+    sdd = debit()
+    assert sdd.add_payments(debit_payments(25), chunk_size=10) == 25
+
+    reference = debit()
+    for payment in debit_payments(25):
+        reference.add_payment(payment)
+
+    assert sdd.summary() == reference.summary()
+    assert clean_ids(sdd.export()) == clean_ids(reference.export())
+
+
+def test_add_payments_assigns_endtoend_ids():
+    sdd = debit()
+    payments = list(debit_payments(3))
+    payments[1]["endtoend_id"] = "given"
+    sdd.add_payments(payments)
+    assert payments[0]["endtoend_id"].startswith("TestCreditor-")
+    assert payments[1]["endtoend_id"] == "given"
+    assert payments[0]["endtoend_id"] != payments[2]["endtoend_id"]
+
+
+def test_add_payments_rejects_chunk():
+    sdd = debit()
+    payments = list(debit_payments(25))
+    payments[12]["amount"] = "12.00"
+    with pytest.raises(Exception):
+        sdd.add_payments(payments, chunk_size=10)
+    assert sdd.summary()['nb_of_txs'] == 10
+
+
+def test_add_payments_transfer():
+    strf = SepaTransfer(transfer_config())
+    payments = (transfer_payment(i, name="Tëst du Test") for i in range(7))
+    assert strf.add_payments(payments, chunk_size=3) == 7
+    assert strf.summary()['ctrl_sum'] == 3521
+    assert b"<Nm>Test du Test</Nm>" in strf.export()
@@ -0,0 +1,66 @@
+import copy
+
+import pytest
+from lxml import etree
+
+from sepaxml import SepaDD, SepaTransfer
+from sepaxml.validation import ValidationError
+from tests.utils import (clean_ids, debit_config, debit_payment,
+                         transfer_config, transfer_payment)
+
+
+def debit(schema, batch, backend):
+    sdd = SepaDD(debit_config(batch=batch), schema=schema, backend=backend)
+    for i, seq in enumerate(["FRST", "RCUR", "FRST", "RCUR"]):
+        BIC = "BANKNL2A" if i % 2 or schema != "pain.008.003.02" else None
+        sdd.add_payment(debit_payment(i, type=seq, BIC=BIC, description="Test transaction & <more>"))
+    return sdd
+
+
+def transfer(schema, batch, backend):
+    strf = SepaTransfer(transfer_config(batch=batch), schema=schema, backend=backend)
+    for i in range(1 if schema.startswith("CBI") else 4):
+        strf.add_payment(transfer_payment(i, BIC="BANKNL2A" if i % 2 else None))
+    return strf
+
+
+def canonical(xmlout):
+    return etree.tostring(etree.fromstring(clean_ids(xmlout)), method="c14n")
+
+
+VARIANTS = [
+    (debit, ("pain.008.001.02", True)),
+    (debit, ("pain.008.002.02", True)),
+    (debit, ("pain.008.003.02", True)),
+    (debit, ("pain.008.003.02", False)),
+    (transfer, ("pain.001.001.03", True)),
+    (transfer, ("pain.001.001.03", False)),
+    (transfer, ("CBIPaymentRequest.00.04.00", True)),
+    (transfer, ("CBIPaymentRequest.00.04.00", False)),
+]
+
+
+@pytest.mark.parametrize("builder,args", VARIANTS)
+def test_lxml_equivalent(builder, args):
+    expected = canonical(builder(*args, backend="etree").export())
+    sepa = builder(*args, backend="lxml")
+    streamed = copy.deepcopy(sepa)
+    assert canonical(sepa.export()) == expected
+    assert canonical(b"".join(streamed.iter_export())) == expected
+
+
+def test_lxml_validates_tree():
+    sdd = debit("pain.008.003.02", True, "lxml")
+    sdd.add_payment(debit_payment(IBAN="NL50 BANK", BIC=None, amount=100, type="OOFF"))
+    with pytest.raises(ValidationError):
+        sdd.export()
+
+
+def test_unknown_backend():
+    with pytest.raises(Exception):
+        debit("pain.008.003.02", True, "minidom")
+
+
+def test_template_requires_etree():
+    with pytest.raises(Exception):
+        SepaDD(debit_config(), serializer="template", backend="lxml")
@@ -0,0 +1,64 @@
+import datetime
+
+import pytest
+
+from sepaxml import DirectDebitPayment, SepaDD
+from sepaxml.bankdir import BankDirectory, compile_directory
+from tests.utils import debit_config, debit_payment
+
+
+def blz_line(blz, feature, name, bic):
+    line = blz + feature + name.ljust(58) + "60311" + "Frankfurt".ljust(35) + name[:27].ljust(27) + "     "
+    return line + bic.ljust(11) + "09000001" + "A0" + "00000000"
+
+
+@pytest.fixture
+def directory(tmp_path):
+    source = tmp_path / "blz.txt"
+    source.write_text("\n".join([
+        blz_line("37040044", "1", "Commerzbank Köln", "COBADEFFXXX"),
+        blz_line("37040044", "2", "Commerzbank Köln Filiale", ""),
+        blz_line("10000000", "1", "Bundesbank", "MARKDEF1100"),
+        blz_line("50010517", "1", "ING-DiBa", "INGDDEFFXXX"),
+    ]) + "\n", encoding="latin-1")
+    index = str(tmp_path / "blz.idx")
+    assert compile_directory(str(source), index) == 3
+    directory = BankDirectory(index)
+    yield directory
+    directory.close()
+
+
+def test_lookup(directory):
+    assert len(directory) == 3
+    assert directory.country == "DE"
+    assert directory.lookup("10000000") == "MARKDEF1100"
+    assert directory.lookup("37040044") == "COBADEFFXXX"
+    assert directory.lookup("50010517") == "INGDDEFFXXX"
+    assert directory.lookup("20000000") is None
+    assert directory.lookup("1") is None
+    assert directory.bic("DE89 3704 0044 0532 0130 00") == "COBADEFFXXX"
+    assert directory.bic("NL91ABNA0417164300") is None
+
+
+def test_csv(tmp_path):
+    source = tmp_path / "banks.csv"
+    source.write_text("bank_code,bic\nABNA,ABNANL2A\nINGB,INGBNL2A\n")
+    index = str(tmp_path / "banks.idx")
+    assert compile_directory(str(source), index, country="NL", format="csv") == 2
+    assert BankDirectory(index).bic("NL91ABNA0417164300") == "ABNANL2A"
+    with pytest.raises(Exception):
+        compile_directory(str(source), index, country="DE", format="csv")
+
+
+def test_builder_derives_bic(directory):
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", bank_directory=directory)
+    payment = debit_payment(IBAN="DE89370400440532013000", BIC=None, amount=1000, type="FRST")
+    sdd.add_payment(dict(payment))
+    sdd.add_payments([dict(payment, IBAN="DE02500105170137075030"), dict(payment, IBAN="DE02100000000000000000")])
+    sdd.add_payment(DirectDebitPayment("Test", "NL91ABNA0417164300", 100, "FRST", datetime.date.today(), "1234",
+                                       datetime.date.today(), "Test transaction"))
+    xmlout = sdd.export()
+    assert b"<BIC>COBADEFFXXX</BIC>" in xmlout
+    assert b"<BIC>INGDDEFFXXX</BIC>" in xmlout
+    assert b"<BIC>MARKDEF1100</BIC>" in xmlout
+    assert xmlout.count(b"<Id>NOTPROVIDED</Id>") == 1
@@ -0,0 +1,79 @@
+import subprocess
+import sys
+
+import pytest
+
+from sepaxml import SepaDD, TextCleaner
+from sepaxml.cleaning import to_ascii, to_epc
+from sepaxml.utils import make_id
+from tests.utils import debit_config, debit_payment
+
+
+def payment(i):
+    return debit_payment(i, name="Müller %d" % (i % 3), type="RCUR", description="Mitgliedsbeitrag Oktober")
+
+
+def test_cleaner_stats():
+    cleaner = TextCleaner(maxsize=2)
+    assert cleaner.clean("Müller", 70) == "Muller"
+    assert cleaner.clean("Müller", 3) == "Mul"
+    assert cleaner.clean("Müller", 70) == "Muller"
+    cleaner.clean("Straße", 70)
+    cleaner.clean("Müller", 3)
+    assert cleaner.stats() == {'hits': 1, 'misses': 4, 'maxsize': 2, 'currsize': 2}
+    cleaner.clear()
+    assert cleaner.stats()['currsize'] == 0
+
+
+def test_builders_share_cleaner():
+    cleaner = TextCleaner()
+    for run in range(2):
+        sdd = SepaDD(debit_config(name="Gläubiger"), schema="pain.008.003.02", cleaner=cleaner)
+        for i in range(10):
+            sdd.add_payment(payment(i))
+        xmlout = sdd.export()
+        assert b"<Nm>Glaubiger</Nm>" in xmlout
+        assert b"<Nm>Muller 2</Nm>" in xmlout
+
+    # The creditor name, three debtor names and one description
+    stats = cleaner.stats()
+    assert stats['misses'] == 5
+    assert stats['hits'] == 2 * 21 - 5
+
+
+def test_make_id():
+    assert make_id("Müller & Söhne GmbH, Hamburg-Altona")[:-13] == "MllerShneGmbHHamburgAl"
+
+
+@pytest.mark.parametrize("text,ascii,epc", [
+    ("Membership fee 2026-10", "Membership fee 2026-10", "Membership fee 2026-10"),
+    ("Müller & Söhne", "Muller & Sohne", "Muller + Sohne"),
+    ("Zoë_Straße; #1 <a@b.de>", "Zoe_Strasse; #1 <a@b.de>", "Zoe-Strasse,  1 (a b.de)"),
+    ("中文 “quoted” – €5", 'Zhong Wen  "quoted" - EUR5', "Zhong Wen  'quoted' - EUR5"),
+])
+def test_charsets(text, ascii, epc):
+    assert to_ascii(text) == ascii
+    assert to_epc(text) == epc
+
+
+def test_epc_cleaner():
+    sdd = SepaDD(debit_config(name="Müller & Söhne"), schema="pain.008.003.02", cleaner=TextCleaner(charset="epc"))
+    sdd.add_payment(dict(payment(0), name="Ævar_Þór <中文>", description="Beitrag 10€ & Spende"))
+    xmlout = sdd.export()
+    assert b"<Nm>Muller + Sohne</Nm>" in xmlout
+    assert b"<Nm>AEvar-Thor (Zhong Wen )</Nm>" in xmlout
+    assert b"<Ustrd>Beitrag 10EUR + Spende</Ustrd>" in xmlout
+
+    with pytest.raises(Exception):
+        TextCleaner(charset="latin1")
+
+
+def test_import_without_unidecode():
+    # setup.py imports the package before its dependencies are installed.
+    code = (
+        "import sys\n"
+        "sys.modules['text_unidecode'] = None\n"
+        "import sepaxml\n"
+        "assert sepaxml.TextCleaner().clean('Test', 70) == 'Test'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
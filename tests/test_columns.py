@@ -0,0 +1,93 @@
+import datetime
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer, columns
+from tests.utils import clean_ids, debit_config, transfer_config
+
+
+def debit():
+    return SepaDD(debit_config(), schema="pain.008.003.02")
+
+
+def debit_columns():
+    return {
+        "name": ["Tëst von Testenstein", "Test du Test"] * 3,
+        "IBAN": ["NL50BANK1234567890"] * 6,
+        "BIC": ["BANKNL2A", None] * 3,
+        "amount": [1, 100, 2005, 7, 8, 9],
+        "type": ["FRST", "RCUR", "FRST", "RCUR", "RCUR", "FRST"],
+        "collection_date": [datetime.date(2017, 1, 20)] * 5 + [datetime.date(2017, 1, 21)],
+        "mandate_id": ["1234"] * 6,
+        "mandate_date": [datetime.date(2017, 1, 2)] * 6,
+        "description": ["Test transaction"] * 6,
+        "endtoend_id": ["E2E-%d" % i for i in range(6)],
+    }
+
+
+def reference(cols):
+    sdd = debit()
+    for row in zip(*cols.values()):
+        payment = {k: v for k, v in zip(cols.keys(), row) if v is not None}
+        sdd.add_payment(payment)
+    return sdd
+
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(columns, "np", None)
+    return request.param
+
+
+def test_from_columns_matches_add_payment(backend):
+    sdd = SepaDD.from_columns(debit()._config, debit_columns(), schema="pain.008.003.02")
+    ref = reference(debit_columns())
+    assert sdd.summary() == ref.summary()
+    assert list(sdd.summary()['batches']) == ["FRST::2017-01-20", "RCUR::2017-01-20", "FRST::2017-01-21"]
+    assert clean_ids(sdd.export()) == clean_ids(ref.export())
+
+
+def test_numpy_columns():
+    np = pytest.importorskip("numpy")
+    cols = debit_columns()
+    cols["amount"] = np.array(cols["amount"], dtype=np.int32)
+    cols["collection_date"] = np.array(cols["collection_date"], dtype="datetime64[D]")
+    del cols["endtoend_id"]
+    sdd = debit()
+    assert sdd.add_columns(cols) == 6
+    assert sdd.summary()['ctrl_sum'] == 2130
+    assert b"<ReqdColltnDt>2017-01-21</ReqdColltnDt>" in sdd.export()
+
+
+def test_negative_amounts(backend):
+    cents, amounts = columns.amount_column([-150, -100, -1234, 0, 5, 150])
+    assert list(cents) == [-150, -100, -1234, 0, 5, 150]
+    assert amounts == ["-1.50", "-1.00", "-12.34", "0.00", "0.05", "1.50"]
+
+
+def test_invalid_column_adds_nothing(backend):
+    cols = debit_columns()
+    cols["amount"][3] = "7.00"
+    sdd = debit()
+    with pytest.raises(Exception):
+        sdd.add_columns(cols)
+    assert sdd.summary()['nb_of_txs'] == 0
+
+    cols = debit_columns()
+    del cols["mandate_id"]
+    with pytest.raises(Exception):
+        sdd.add_columns(cols)
+
+
+def test_transfer_columns(backend):
+    strf = SepaTransfer.from_columns(transfer_config(execution_date=datetime.date(2017, 1, 20)), {
+        "name": ["Test du Test"] * 3,
+        "IBAN": ["NL50BANK1234567890"] * 3,
+        "amount": [500, 501, 502],
+        "description": ["Test transaction"] * 3,
+    })
+    assert strf.summary()['batches'] == {"2017-01-20": {'nb_of_txs': 3, 'ctrl_sum': 1503}}
+    assert b"<InstdAmt Ccy=\"EUR\">5.01</InstdAmt>" in strf.export()
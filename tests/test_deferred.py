@@ -0,0 +1,45 @@
+import tracemalloc
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from tests.test_templates import debit, transfer
+from tests.utils import (clean_ids, debit_config, debit_payment,
+                         transfer_config, transfer_payment)
+
+
+@pytest.mark.parametrize("builder,args", [
+    (debit, ("pain.008.001.02", True)),
+    (debit, ("pain.008.003.02", True)),
+    (debit, ("pain.008.003.02", False)),
+    (transfer, ("pain.001.001.03", True)),
+    (transfer, ("pain.001.001.03", False)),
+    (transfer, ("CBIPaymentRequest.00.04.00", True)),
+])
+def test_deferred_output_identical(builder, args):
+    etree_out = builder(*args, serializer="etree").export(validate=False)
+    deferred = builder(*args, serializer="deferred")
+    if args[1]:
+        for batch_nodes in deferred._batches.values():
+            assert all(isinstance(node, tuple) for node in batch_nodes)
+    assert clean_ids(deferred.export(validate=False)) == clean_ids(etree_out)
+
+
+def test_deferred_lxml():
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", serializer="deferred", backend="lxml")
+    sdd.add_payment(debit_payment(BIC=None, amount=100, type="FRST"))
+    assert b"<NbOfTxs>1</NbOfTxs>" in sdd.export()
+
+
+def held_memory(serializer):
+    tracemalloc.start()
+    try:
+        strf = SepaTransfer(transfer_config(), serializer=serializer)
+        strf.add_payments(transfer_payment(amount=100 + i) for i in range(2000))
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def test_deferred_holds_less_memory():
+    assert held_memory("deferred") * 3 < held_memory("etree")
@@ -0,0 +1,106 @@
+import datetime
+import re
+
+import pytest
+
+from sepaxml import DirectDebitPayment, DuplicateIndex, SepaDD, SepaTransfer
+from sepaxml.validation import try_valid_xml
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+CREATED = datetime.datetime(2024, 5, 1, 12, 30)
+
+
+def fixed_config(batch=True):
+    return debit_config(batch=batch, creation_datetime=CREATED)
+
+
+def fixed_payment(i):
+    return debit_payment(i, amount=100 + i, collection_date=datetime.date(2024, 5, 10), mandate_date=datetime.date(2024, 1, 1))
+
+
+def debit_export(batch=True, count=4, **kwargs):
+    sepa = SepaDD(fixed_config(batch), schema="pain.008.001.02", deterministic=True, **kwargs)
+    sepa.add_payment(fixed_payment(0))
+    sepa.add_payments([fixed_payment(i) for i in range(1, count)])
+    sepa.add_payment(DirectDebitPayment("Test", "NL50BANK1234567890", 100, "FRST", datetime.date(2024, 5, 10),
+                                        "1234", datetime.date(2024, 1, 1), "Test transaction"))
+    return sepa.export()
+
+
+@pytest.mark.parametrize("batch", [True, False])
+@pytest.mark.parametrize("serializer", ["etree", "template", "deferred"])
+def test_debit_identical(batch, serializer):
+    if serializer == "deferred" and not batch:
+        pytest.skip("The deferred serializer only defers batch transactions.")
+    xmlout = debit_export(batch, serializer=serializer)
+    assert xmlout == debit_export(batch, serializer=serializer)
+    try_valid_xml(xmlout, "pain.008.001.02")
+    assert b"<CreDtTm>2024-05-01T12:30:00</CreDtTm>" in xmlout
+
+    ids = re.findall(rb"<(MsgId|PmtInfId|EndToEndId)>([^<]*)<", xmlout)
+    assert len(set(value for tag, value in ids)) == len(ids)
+    assert all(len(value) <= 35 for tag, value in ids)
+
+
+def test_debit_content_changes_ids():
+    xmlout = debit_export()
+    other = debit_export(count=5)
+    for tag in (rb"MsgId", rb"PmtInfId"):
+        pattern = rb"<" + tag + rb">([^<]*)<"
+        assert not set(re.findall(pattern, xmlout)) & set(re.findall(pattern, other))
+    # The EndToEndIds of the first payments do not depend on the later ones.
+    assert re.findall(rb"<EndToEndId>([^<]*)<", xmlout)[0] == re.findall(rb"<EndToEndId>([^<]*)<", other)[0]
+
+
+def test_debit_columns_identical():
+    def export():
+        payments = [fixed_payment(i) for i in range(6)]
+        columns = {key: [payment[key] for payment in payments] for key in payments[0]}
+        return SepaDD.from_columns(fixed_config(), columns, deterministic=True).export()
+
+    assert export() == export()
+
+
+def test_transfer_identical():
+    def export():
+        config = transfer_config(execution_date=datetime.date(2024, 5, 10), creation_datetime=CREATED)
+        sepa = SepaTransfer(config, schema="pain.001.001.03", deterministic=True)
+        for i in range(3):
+            sepa.add_payment(transfer_payment(name="Test von Testenstein", BIC="BANKNL2A", amount=100 + i,
+                                              execution_date=datetime.date(2024, 5, 10 + i % 2)))
+        return sepa.export()
+
+    xmlout = export()
+    assert xmlout == export()
+    try_valid_xml(xmlout, "pain.001.001.03")
+    assert len(set(re.findall(rb"<PmtInfId>([^<]*)<", xmlout))) == 2
+
+
+def test_creation_datetime_required():
+    config = fixed_config()
+    del config["creation_datetime"]
+    with pytest.raises(Exception, match="CREATION_DATETIME_MISSING"):
+        SepaDD(dict(config), deterministic=True)
+    SepaDD(config)
+
+    config["creation_datetime"] = datetime.date(2024, 5, 1)
+    with pytest.raises(Exception, match="CREATION_DATETIME_INVALID"):
+        SepaDD(config)
+
+
+def test_rejected_payments_change_nothing():
+    def build(reject):
+        sepa = SepaDD(fixed_config(), schema="pain.008.001.02", deterministic=True, check_fields=True,
+                      duplicates=DuplicateIndex(keys=("mandate",)))
+        sepa.add_payment(fixed_payment(0))
+        if reject:
+            with pytest.raises(Exception, match="DUPLICATE_MANDATE"):
+                sepa.add_payment(fixed_payment(0))
+            invalid = fixed_payment(1)
+            invalid["endtoend_id"] = "x" * 36
+            with pytest.raises(Exception, match="ENDTOEND_ID_TOO_LONG"):
+                sepa.add_payments([fixed_payment(2), invalid])
+        sepa.add_payments([fixed_payment(i) for i in range(1, 4)])
+        return sepa.export()
+    assert build(True) == build(False)
@@ -0,0 +1,114 @@
+import datetime
+import re
+
+import pytest
+
+from sepaxml import (DirectDebitPayment, DuplicateIndex, RolloverWriter,
+                     SepaDD, SepaTransfer)
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+
+def indexed_payment(i, endtoend_id=None):
+    return debit_payment(i, amount=100 + i, type="FRST", mandate_id="M%d" % i, endtoend_id=endtoend_id or "E2E-%d" % i)
+
+
+def test_reject_endtoend_id():
+    sepa = SepaDD(debit_config(), duplicates=DuplicateIndex())
+    sepa.add_payment(indexed_payment(1))
+    with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+        sepa.add_payment(indexed_payment(2, "E2E-1"))
+    with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+        sepa.add_payment(DirectDebitPayment("Test", "NL50BANK1234567890", 100, "FRST", datetime.date.today(), "M3",
+                                            datetime.date.today(), "Test transaction", endtoend_id="E2E-1"))
+    sepa.add_payment(indexed_payment(2))
+    assert sepa.summary()["nb_of_txs"] == 2
+    assert len(sepa.duplicates) == 2
+
+
+def test_reject_chunk():
+    sepa = SepaDD(debit_config(), duplicates=DuplicateIndex())
+    sepa.add_payment(indexed_payment(0))
+    # The duplicate within the chunk rejects the whole chunk.
+    with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+        sepa.add_payments([indexed_payment(1), indexed_payment(2), indexed_payment(3, "E2E-1")])
+    assert sepa.summary()["nb_of_txs"] == 1
+    assert len(sepa.duplicates) == 1
+    with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+        sepa.add_payments([indexed_payment(1), DirectDebitPayment(
+            "Test", "NL50BANK1234567890", 100, "FRST", datetime.date.today(), "M3", datetime.date.today(),
+            "Test transaction", endtoend_id="E2E-0")])
+    assert sepa.summary()["nb_of_txs"] == 1
+    sepa.add_payments([indexed_payment(1), indexed_payment(2)])
+    assert sepa.summary()["nb_of_txs"] == 3
+    assert len(sepa.duplicates) == 3
+
+
+def test_reject_mandate():
+    sepa = SepaDD(debit_config(), duplicates=DuplicateIndex(keys=("endtoend_id", "mandate")))
+    sepa.add_payment(indexed_payment(1))
+    # Same mandate, amount and collection date with a new EndToEndId.
+    with pytest.raises(Exception, match="DUPLICATE_MANDATE"):
+        sepa.add_payment(indexed_payment(1, "E2E-retry"))
+    other = indexed_payment(1, "E2E-later")
+    other["collection_date"] = datetime.date.today() + datetime.timedelta(days=30)
+    sepa.add_payment(other)
+
+
+def test_report():
+    index = DuplicateIndex(keys=("endtoend_id", "mandate"), report=True)
+    sepa = SepaDD(debit_config(), duplicates=index)
+    sepa.add_payments([indexed_payment(1), indexed_payment(2), indexed_payment(1, "E2E-retry"), indexed_payment(3, "E2E-2")])
+    assert sepa.summary()["nb_of_txs"] == 4
+    assert index.duplicates == [(2, "mandate", ("M1", "1.01", str(datetime.date.today()))), (3, "endtoend_id", "E2E-2")]
+    index.clear()
+    assert len(index) == 0 and not index.duplicates
+
+
+def test_columns():
+    payments = [indexed_payment(i) for i in range(3)] + [indexed_payment(3, "E2E-0")]
+    columns = {key: [payment[key] for payment in payments] for key in payments[0]}
+    sepa = SepaDD(debit_config(), duplicates=DuplicateIndex())
+    with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+        sepa.add_columns(columns)
+    # None of the rows have been added.
+    assert sepa.summary()["nb_of_txs"] == 0
+    assert len(sepa.duplicates) == 0
+
+    columns = {key: column[:3] for key, column in columns.items()}
+    sepa.add_columns(columns)
+    with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+        sepa.add_payment(indexed_payment(4, "E2E-2"))
+
+
+def test_transfer():
+    config = transfer_config()
+    sepa = SepaTransfer(config, duplicates=DuplicateIndex(keys=("endtoend_id", "account")))
+    for i in range(2):
+        # Transfers without an EndToEndId are NOTPROVIDED, which is no duplicate.
+        sepa.add_payment(transfer_payment(name="Test von Testenstein", amount=100 + i))
+    with pytest.raises(Exception, match="DUPLICATE_ACCOUNT"):
+        sepa.add_payment(transfer_payment(name="Test von Testenstein", amount=100, endtoend_id="E2E-1"))
+
+
+def test_unknown_key():
+    with pytest.raises(Exception, match="Unknown duplicate key: account"):
+        SepaDD(debit_config(), duplicates=DuplicateIndex(keys=("account",)))
+
+
+def test_rollover(tmp_path):
+    # The index spans all files, a payment that starts a new file is no
+    # duplicate of itself.
+    index = DuplicateIndex()
+    with RolloverWriter(SepaDD, debit_config(), str(tmp_path / "out-{index}.xml"), max_transactions=2,
+                        duplicates=index) as writer:
+        writer.add_payments(indexed_payment(i) for i in range(5))
+        with pytest.raises(Exception, match="DUPLICATE_ENDTOEND_ID"):
+            writer.add_payment(indexed_payment(5, "E2E-0"))
+    assert len(writer.files) == 3
+    assert len(index) == 5
+    endtoend_ids = []
+    for path in writer.files:
+        with open(path, "rb") as f:
+            endtoend_ids += re.findall(rb"<EndToEndId>([^<]*)<", f.read())
+    assert len(endtoend_ids) == len(set(endtoend_ids)) == 5
@@ -0,0 +1,80 @@
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from sepaxml.facets import element_type, field_checks, type_facets
+from sepaxml.validation import try_valid_xml
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+
+def test_facets():
+    path = "Document/CstmrDrctDbtInitn/PmtInf/DrctDbtTxInf/InstdAmt"
+    assert type_facets("pain.008.003.02", element_type("pain.008.003.02", path)) == {
+        "minInclusive": "0.01",
+        "maxInclusive": "999999999.99",
+        "fractionDigits": "2",
+        "totalDigits": "11",
+    }
+    assert element_type("pain.008.003.02", "Document/CstmrDrctDbtInitn/PmtInf/Unknown") is None
+
+    checks = {field: check for position, field, check in field_checks(
+        "pain.008.001.02", "Document/CstmrDrctDbtInitn", SepaDD.TX_fields + SepaDD.batch_fields)}
+    assert checks["endtoend_id"]("x" * 35) is None
+    assert checks["endtoend_id"]("x" * 36) == "TOO_LONG"
+    assert checks["type"]("RCUR") is None
+    assert checks["type"]("XXXX") == "INVALID_VALUE"
+    assert checks["IBAN"]("nl50bank1234567890") == "INVALID_FORMAT"
+    assert checks["amount"]("0.00001") is None
+    assert checks["amount"]("0.000001") == "INVALID_AMOUNT"
+
+
+@pytest.mark.parametrize("payment,error", [
+    (debit_payment(endtoend_id="x" * 36), "ENDTOEND_ID_INVALID_FORMAT"),
+    (debit_payment(type="XXXX"), "TYPE_INVALID_VALUE"),
+    (debit_payment(mandate_id="Mandat #1"), "MANDATE_ID_INVALID_FORMAT"),
+    (debit_payment(amount=0), "AMOUNT_INVALID_AMOUNT"),
+    (debit_payment(description="x" * 141), "DESCRIPTION_TOO_LONG"),
+])
+def test_debit_rejects(payment, error):
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", clean=False, check_fields=True)
+    with pytest.raises(Exception, match="Payment did not validate: " + error):
+        sdd.add_payment(payment)
+    assert sdd.summary()["nb_of_txs"] == 0
+
+
+def test_debit_accepts():
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", check_fields=True)
+    # The description is truncated by the clean option before it is checked.
+    sdd.add_payment(debit_payment(description="x" * 141))
+    payments = [debit_payment(amount=100 + i) for i in range(3)]
+    sdd.add_columns({key: [payment[key] for payment in payments] for key in payments[0]})
+    try_valid_xml(sdd.export(validate=False), "pain.008.003.02")
+
+
+def test_debit_chunk_rejects():
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", check_fields=True)
+    with pytest.raises(Exception, match="Payment did not validate: ENDTOEND_ID_INVALID_FORMAT"):
+        sdd.add_payments([debit_payment(), debit_payment(endtoend_id="x" * 36)])
+    # None of the payments of the chunk have been added.
+    assert sdd.summary()["nb_of_txs"] == 0
+
+
+def test_debit_columns_rejects():
+    payments = [debit_payment(), debit_payment(type="XXXX")]
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", check_fields=True)
+    with pytest.raises(Exception, match="Payment did not validate: TYPE_INVALID_VALUE"):
+        sdd.add_columns({key: [payment[key] for payment in payments] for key in payments[0]})
+    assert sdd.summary()["nb_of_txs"] == 0
+
+
+def test_config_rejects():
+    with pytest.raises(Exception, match="Config file did not validate. CREDITOR_ID_INVALID_FORMAT"):
+        SepaDD(debit_config(creditor_id="000000"), schema="pain.008.003.02", check_fields=True)
+    SepaDD(debit_config(creditor_id="000000"), schema="pain.008.003.02")
+
+
+def test_transfer_rejects():
+    sepa = SepaTransfer(transfer_config(), check_fields=True)
+    sepa.add_payment(transfer_payment(name="Test von Testenstein", amount=100))
+    with pytest.raises(Exception, match="Payment did not validate: BIC_INVALID_FORMAT"):
+        sepa.add_payment(transfer_payment(name="Test von Testenstein", BIC="BANK", amount=100))
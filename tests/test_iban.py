@@ -0,0 +1,67 @@
+import datetime
+
+import pytest
+
+from sepaxml import DirectDebitPayment, SepaDD, SepaTransfer
+from sepaxml.iban import IBAN_LENGTHS, check_account, check_accounts
+from tests.utils import debit_config, debit_payment, transfer_config
+
+
+@pytest.mark.parametrize("iban,bic,normalized,error", [
+    ("DE89370400440532013000", "COBADEFFXXX", "DE89370400440532013000", None),
+    ("gb82 west 1234 5698 7654 32", None, "GB82WEST12345698765432", None),
+    ("FR1420041010050500013M02606", "BDFEGPGP", "FR1420041010050500013M02606", None),
+    ("DE89370400440532013001", None, "DE89370400440532013001", "IBAN_INVALID_CHECKSUM"),
+    ("DE8937040044053201300", None, "DE8937040044053201300", "IBAN_INVALID_LENGTH"),
+    ("XX89370400440532013000", None, "XX89370400440532013000", "IBAN_UNKNOWN_COUNTRY"),
+    ("DE89-3704-0044", None, "DE89-3704-0044", "IBAN_INVALID_FORMAT"),
+    ("DE89370400440532013000", "BANKNL2A", "DE89370400440532013000", "BIC_COUNTRY_MISMATCH"),
+    ("DE89370400440532013000", "COBA DE", "DE89370400440532013000", "BIC_INVALID_FORMAT"),
+])
+def test_check_account(iban, bic, normalized, error):
+    assert check_account(iban, bic) == (normalized, error)
+
+
+def test_check_accounts():
+    ibans, errors = check_accounts(
+        ["NL91ABNA0417164300", "NL91ABNA0417164301", "CH93 0076 2011 6238 5295 7", "NL91ABNA0417164300"],
+        ["ABNANL2A", "ABNANL2A", None, "COBADEFF"],
+    )
+    assert ibans[2] == "CH9300762011623852957"
+    assert errors == [(1, "IBAN_INVALID_CHECKSUM"), (3, "BIC_COUNTRY_MISMATCH")]
+    assert all(length <= 34 for length in IBAN_LENGTHS.values())
+
+
+def sdd(**kwargs):
+    return SepaDD(debit_config(IBAN="NL91 ABNA 0417 1643 00", BIC="ABNANL2A"), schema="pain.008.003.02", check_iban=True, **kwargs)
+
+
+def account_payment(IBAN, BIC=None):
+    return debit_payment(IBAN=IBAN, BIC=BIC, amount=1000, type="FRST")
+
+
+def test_debit_check_iban():
+    sepa = sdd()
+    sepa.add_payment(account_payment("de89 3704 0044 0532 0130 00", "COBADEFFXXX"))
+    sepa.add_payments([account_payment("GB82 WEST 1234 5698 7654 32")])
+    sepa.add_payment(DirectDebitPayment("Test", "AT61 1904 3002 3457 3201", 100, "FRST", datetime.date.today(),
+                                        "1234", datetime.date.today(), "Test transaction"))
+    xmlout = sepa.export()
+    assert b"<IBAN>NL91ABNA0417164300</IBAN>" in xmlout
+    assert b"<IBAN>DE89370400440532013000</IBAN>" in xmlout
+    assert b"<IBAN>GB82WEST12345698765432</IBAN>" in xmlout
+    assert b"<IBAN>AT611904300234573201</IBAN>" in xmlout
+
+    with pytest.raises(Exception, match="IBAN_INVALID_CHECKSUM"):
+        sepa.add_payment(account_payment("DE89370400440532013001"))
+    with pytest.raises(Exception, match="BIC_COUNTRY_MISMATCH"):
+        sepa.add_payments([account_payment("DE89370400440532013000"), account_payment("DE89370400440532013000", "ABNANL2A")])
+    with pytest.raises(Exception, match="IBAN_INVALID_LENGTH"):
+        sdd().add_columns({key: [value] for key, value in account_payment("DE8937040044053201300").items()})
+
+
+def test_transfer_check_iban():
+    config = transfer_config()
+    with pytest.raises(Exception, match="Config file did not validate. IBAN_INVALID_CHECKSUM"):
+        SepaTransfer(dict(config), check_iban=True)
+    SepaTransfer(config)
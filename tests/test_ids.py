@@ -0,0 +1,57 @@
+import multiprocessing
+import re
+
+import pytest
+
+from sepaxml import ids
+from sepaxml.ids import BulkRandomGenerator, SnowflakeGenerator, set_generator
+from sepaxml.utils import make_id, make_ids, make_msg_id
+
+
+def test_bulk_random():
+    generator = BulkRandomGenerator(block_size=64)
+    tokens = generator.tokens(1000) + [generator.token() for i in range(100)]
+    assert len(set(tokens)) == 1100
+    assert all(re.fullmatch("[0-9a-f]{12}", token) for token in tokens)
+
+
+def fork_tokens(queue):
+    queue.put(ids.get_generator().tokens(10))
+
+
+def test_bulk_random_fork():
+    generator = ids.get_generator()
+    generator.token()
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=fork_tokens, args=(queue,))
+    process.start()
+    child = queue.get(timeout=10)
+    process.join()
+    assert not set(child) & set(generator.tokens(10))
+
+
+def test_snowflake(monkeypatch):
+    generator = SnowflakeGenerator(worker=37)
+    tokens = [generator.token() for i in range(5000)]
+    assert tokens == sorted(tokens)
+    assert len(set(tokens)) == 5000
+    assert all(re.fullmatch("11[0-9a-z]{10}", token) for token in tokens)
+
+    # The tokens keep increasing if the clock goes back.
+    monkeypatch.setattr(ids.time, "time", lambda: 1704067200.0)
+    assert generator.token() > tokens[-1]
+
+    with pytest.raises(Exception):
+        SnowflakeGenerator(worker=1296)
+
+
+def test_set_generator():
+    previous = set_generator(SnowflakeGenerator(worker=0))
+    try:
+        assert re.fullmatch(r"TestCreditor-00[0-9a-z]{10}", make_id("Test Creditor"))
+        assert re.fullmatch(r"\d{14}-00[0-9a-z]{10}", make_msg_id())
+        first, second = make_ids("Test", 2)
+        assert first < second
+    finally:
+        set_generator(previous)
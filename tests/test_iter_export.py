@@ -0,0 +1,56 @@
+import copy
+import datetime
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from tests.utils import (clean_ids, debit_config, debit_payment,
+                         transfer_config, transfer_payment)
+
+
+def debit(schema, batch):
+    sdd = SepaDD(debit_config(batch=batch), schema=schema)
+    for i, seq in enumerate(["FRST", "RCUR", "FRST", "RCUR", "RCUR"]):
+        sdd.add_payment(debit_payment(i, type=seq, description="Test transaction & more"))
+    return sdd
+
+
+def transfer(schema, batch):
+    strf = SepaTransfer(transfer_config(batch=batch), schema=schema)
+    for i in range(4):
+        payment = transfer_payment(i)
+        if i % 2:
+            payment["BIC"] = "BANKNL2A"
+            payment["execution_date"] = datetime.date.today() + datetime.timedelta(days=1)
+        strf.add_payment(payment)
+    return strf
+
+
+@pytest.mark.parametrize("builder", [
+    lambda: debit("pain.008.001.02", True),
+    lambda: debit("pain.008.003.02", True),
+    lambda: debit("pain.008.003.02", False),
+    lambda: transfer("pain.001.001.03", True),
+    lambda: transfer("pain.001.001.03", False),
+    lambda: transfer("CBIPaymentRequest.00.04.00", True),
+    lambda: transfer("CBIPaymentRequest.00.04.00", False),
+])
+def test_iter_export_matches_export(builder):
+    sepa = builder()
+    twin = copy.deepcopy(sepa)
+    chunks = list(sepa.iter_export())
+    assert len(chunks) > 5
+    assert all(isinstance(c, bytes) for c in chunks)
+    assert clean_ids(b"".join(chunks)) == clean_ids(twin.export(validate=False))
+
+
+def test_iter_export_releases_batches():
+    sdd = debit("pain.008.003.02", True)
+    chunks = sdd.iter_export()
+    for chunk in chunks:
+        if b"<DrctDbtTxInf>" in chunk:
+            break
+    assert len(sdd._batches) == 1
+    list(chunks)
+    assert not sdd._batches
+    assert len(sdd._xml) == 0
@@ -0,0 +1,91 @@
+import datetime
+import pickle
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from sepaxml.validation import (ValidationError, set_validator,
+                                try_valid_xml_parallel)
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+pytest.importorskip("lxml")
+
+
+def indexed_payment(i, invalid=False):
+    return debit_payment(i, mandate_id="M%d" % i, description="x" * 141 if invalid else "Test transaction", endtoend_id="E2E-%d" % i)
+
+
+def debit(batch=True, invalid=3, count=6):
+    sdd = SepaDD(debit_config(batch=batch), schema="pain.008.003.02", clean=False)
+    for i in range(count):
+        sdd.add_payment(indexed_payment(i, i == invalid))
+    return sdd
+
+
+@pytest.fixture(params=["xmlschema", "lxml"])
+def validator(request):
+    previous = set_validator(request.param)
+    yield request.param
+    set_validator(previous)
+
+
+def test_batch(validator):
+    # The RCUR and FRST payments alternate, the fourth payment is the second
+    # transaction of the second batch.
+    with pytest.raises(ValidationError, match=r"PmtInf\[2\]/DrctDbtTxInf\[2\]/RmtInf/Ustrd \(EndToEndId E2E-3, MndtId M3\)") as e:
+        debit().export()
+    assert (e.value.PmtInf_index, e.value.TX_index, e.value.payment_index) == (1, 1, 3)
+    assert (e.value.endtoend_id, e.value.mandate_id) == ("E2E-3", "M3")
+
+
+def test_non_batch(validator):
+    with pytest.raises(ValidationError) as e:
+        debit(batch=False, invalid=4).export()
+    assert e.value.path == "/Document/CstmrDrctDbtInitn/PmtInf[5]/DrctDbtTxInf/RmtInf/Ustrd"
+    assert (e.value.PmtInf_index, e.value.TX_index, e.value.payment_index) == (4, 0, 4)
+
+
+def test_columns():
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", clean=False)
+    sdd.add_payment(indexed_payment(0))
+    payments = [indexed_payment(i, i == 4) for i in range(1, 6)]
+    sdd.add_columns({key: [payment[key] for payment in payments] for key in payments[0]})
+    with pytest.raises(ValidationError) as e:
+        sdd.export()
+    assert (e.value.PmtInf_index, e.value.TX_index, e.value.payment_index) == (0, 2, 4)
+
+
+def test_transfer_cbi():
+    strf = SepaTransfer(transfer_config(execution_date=None), schema="CBIPaymentRequest.00.04.00")
+    for i in range(4):
+        strf.add_payment(transfer_payment(i, BIC="BANK" if i == 2 else "BANKNL2A", endtoend_id="E2E-%d" % i,
+                                          execution_date=datetime.date.today() + datetime.timedelta(days=i % 2)))
+    # CBI has a single PmtInf block, with the batches one after the other.
+    with pytest.raises(ValidationError) as e:
+        strf.export()
+    assert (e.value.PmtInf_index, e.value.TX_index, e.value.payment_index) == (0, 1, 2)
+    assert e.value.endtoend_id == "E2E-2"
+
+
+def test_parallel(validator):
+    xmlout = debit(count=40, invalid=25).export(validate=False)
+    with pytest.raises(ValidationError) as e:
+        try_valid_xml_parallel(xmlout, "pain.008.003.02", workers=2, chunk_size=3)
+    assert e.value.path == "/Document/CstmrDrctDbtInitn/PmtInf[2]/DrctDbtTxInf[13]/RmtInf/Ustrd"
+    assert (e.value.PmtInf_index, e.value.TX_index, e.value.endtoend_id) == (1, 12, "E2E-25")
+
+
+def test_async():
+    xmlout, future = debit().export(validate="async")
+    with pytest.raises(ValidationError) as e:
+        future.result()
+    assert e.value.payment_index == 3
+
+
+def test_pickle():
+    with pytest.raises(ValidationError) as e:
+        debit().export()
+    error = pickle.loads(pickle.dumps(e.value))
+    assert str(error) == str(e.value)
+    assert (error.path, error.payment_index, error.mandate_id) == (e.value.path, 3, "M3")
@@ -0,0 +1,71 @@
+import copy
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer, debit, shared, utils
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+
+@pytest.fixture(autouse=True)
+def fixed_ids(monkeypatch):
+    monkeypatch.setattr(debit, "make_id", lambda name: name + "-000000000000")
+
+
+def debit_doc(batch):
+    sdd = SepaDD(debit_config(batch=batch), schema="pain.008.003.02")
+    for i in range(60):
+        sdd.add_payment(debit_payment(i, type="FRST" if i % 3 else "RCUR", description="Test transaction & more",
+                                      collection_date=datetime.date.today() + datetime.timedelta(days=i % 4)))
+    return sdd
+
+
+def transfer_doc(schema):
+    strf = SepaTransfer(transfer_config(), schema=schema)
+    for i in range(40):
+        strf.add_payment(transfer_payment(i, execution_date=datetime.date.today() + datetime.timedelta(days=i % 2)))
+    return strf
+
+
+@pytest.mark.parametrize("builder", [
+    lambda: debit_doc(True),
+    lambda: debit_doc(False),
+    lambda: transfer_doc("pain.001.001.03"),
+    lambda: transfer_doc("CBIPaymentRequest.00.04.00"),
+])
+def test_parallel_export_identical(builder):
+    sepa = builder()
+    twin = copy.deepcopy(sepa)
+    assert sepa.export(validate=False, workers=3) == twin.export(validate=False)
+
+
+def test_parallel_export_splits_batches():
+    sepa = debit_doc(True)
+    twin = copy.deepcopy(sepa)
+    assert sepa._export_parallel(3, chunk_size=7) == twin.export(validate=False)
+
+
+def test_parallel_export_validates():
+    assert b"<NbOfTxs>60</NbOfTxs>" in debit_doc(True).export(workers=2)
+
+
+def test_parallel_export_threads():
+    # Every export hands its own builder to its workers.
+    builders = [debit_doc(True), transfer_doc("pain.001.001.03"), debit_doc(False), transfer_doc("pain.001.001.03")]
+    expected = [copy.deepcopy(sepa).export(validate=False) for sepa in builders]
+    with ThreadPoolExecutor(4) as pool:
+        outputs = list(pool.map(lambda sepa: sepa._export_parallel(2, chunk_size=5), builders))
+    assert outputs == expected
+
+
+def test_parallel_export_without_fork(monkeypatch):
+    # Before Python 3.7, the ProcessPoolExecutor takes no context and no
+    # initializer, so the document is serialized in this process.
+    monkeypatch.setattr(utils.sys, "version_info", (3, 6, 9))
+    assert utils.fork_context() is None
+    sepa = debit_doc(True)
+    twin = copy.deepcopy(sepa)
+    monkeypatch.setattr(shared, "ProcessPoolExecutor", None)
+    assert sepa.export(validate=False, workers=3) == twin.export(validate=False)
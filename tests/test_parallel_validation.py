@@ -0,0 +1,94 @@
+import datetime
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer, utils, validation
+from sepaxml.validation import (ValidationError, try_valid_xml,
+                                try_valid_xml_parallel)
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+
+def debit_xml(batch=True, count=60):
+    sdd = SepaDD(debit_config(batch=batch), schema="pain.008.003.02")
+    for i in range(count):
+        sdd.add_payment(debit_payment(i, type="FRST" if i % 3 else "RCUR",
+                                      collection_date=datetime.date.today() + datetime.timedelta(days=i % 2)))
+    return sdd.export(validate=False)
+
+
+def transfer_xml(schema):
+    strf = SepaTransfer(transfer_config(), schema=schema)
+    for i in range(25):
+        strf.add_payment(transfer_payment(i))
+    return strf.export(validate=False)
+
+
+@pytest.mark.parametrize("xmlout,schema", [
+    (debit_xml(True), "pain.008.003.02"),
+    (debit_xml(False, 12), "pain.008.003.02"),
+    (transfer_xml("pain.001.001.03"), "pain.001.001.03"),
+    (transfer_xml("CBIPaymentRequest.00.04.00"), "CBIPaymentRequest.00.04.00"),
+])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_valid(xmlout, schema, workers):
+    try_valid_xml(xmlout, schema)
+    # Small chunks split the PmtInf blocks at the transactions as well.
+    try_valid_xml_parallel(xmlout, schema, workers=workers, chunk_size=7)
+    try_valid_xml_parallel(xmlout, schema, workers=workers)
+
+
+def test_invalid_transaction():
+    xmlout = debit_xml()
+    # An invalid mandate id in the last transaction.
+    position = xmlout.rfind(b"<MndtId>1234</MndtId>")
+    xmlout = xmlout[:position] + b"<MndtId>#</MndtId>" + xmlout[position + len(b"<MndtId>1234</MndtId>"):]
+    with pytest.raises(ValidationError):
+        try_valid_xml_parallel(xmlout, "pain.008.003.02", workers=2, chunk_size=7)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_threads(workers):
+    # Every validation hands its own document to its chunks.
+    valid = debit_xml()
+    position = valid.rfind(b"<MndtId>1234</MndtId>")
+    invalid = valid[:position] + b"<MndtId>#</MndtId>" + valid[position + len(b"<MndtId>1234</MndtId>"):]
+
+    def validate(xmlout):
+        try:
+            try_valid_xml_parallel(xmlout, "pain.008.003.02", workers=workers, chunk_size=7)
+        except ValidationError:
+            return False
+        return True
+    with ThreadPoolExecutor(4) as pool:
+        assert list(pool.map(validate, [valid, invalid] * 4)) == [True, False] * 4
+
+
+def test_checksums():
+    xmlout = debit_xml()
+    # The second PmtInf block claims a wrong number of transactions.
+    PmtInf = [match.start() for match in re.finditer(rb"<PmtInf>", xmlout)][1]
+    tampered = xmlout[:PmtInf] + re.sub(rb"<NbOfTxs>\d+</NbOfTxs>", b"<NbOfTxs>99</NbOfTxs>", xmlout[PmtInf:], count=1)
+    with pytest.raises(ValidationError, match="The NbOfTxs of the PmtInf 1 is 99, but there are"):
+        try_valid_xml_parallel(tampered, "pain.008.003.02", chunk_size=7)
+
+    tampered = re.sub(rb"<CtrlSum>[^<]*</CtrlSum>", b"<CtrlSum>1.00</CtrlSum>", xmlout, count=1)
+    with pytest.raises(ValidationError, match="The CtrlSum of the GrpHdr is 1.00, but the transactions add up to"):
+        try_valid_xml_parallel(tampered, "pain.008.003.02", chunk_size=7)
+
+
+def test_export():
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", clean=False)
+    sdd.add_payment(debit_payment(amount=1000, type="FRST", description="x" * 141))
+    with pytest.raises(ValidationError):
+        sdd.export(validate="parallel", workers=2)
+
+
+def test_without_fork(monkeypatch):
+    # Before Python 3.7, the ProcessPoolExecutor takes no context and no
+    # initializer, so the chunks are validated in this process.
+    monkeypatch.setattr(utils.sys, "version_info", (3, 6, 9))
+    monkeypatch.setattr(validation, "ProcessPoolExecutor", None)
+    try_valid_xml_parallel(debit_xml(), "pain.008.003.02", workers=2, chunk_size=7)
@@ -0,0 +1,73 @@
+import datetime
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from sepaxml.payments import CreditTransferPayment, DirectDebitPayment
+from tests.utils import clean_ids, debit_config, debit_payment, transfer_config
+
+
+def debit(batch=True):
+    return SepaDD(debit_config(batch=batch), schema="pain.008.003.02")
+
+
+def fixed_payment(i):
+    return debit_payment(i, name="Tëst von Testenstein", collection_date=datetime.date(2017, 1, 20),
+                         mandate_date=datetime.date(2017, 1, 2), endtoend_id="E2E-%d" % i)
+
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_debit_record_matches_dict(batch):
+    sdd = debit(batch)
+    ref = debit(batch)
+    records = [DirectDebitPayment(**fixed_payment(i)) for i in range(4)]
+    for i, record in enumerate(records):
+        sdd.add_payment(record)
+        ref.add_payment(fixed_payment(i))
+
+    assert sdd.summary() == ref.summary()
+    assert clean_ids(sdd.export()) == clean_ids(ref.export())
+    assert records[0].name == "Tëst von Testenstein"
+    assert records[0].collection_date == datetime.date(2017, 1, 20)
+
+
+def test_records_in_add_payments():
+    sdd = debit()
+    payment = fixed_payment(1)
+    del payment["endtoend_id"]
+    assert sdd.add_payments([DirectDebitPayment(**payment), fixed_payment(2)]) == 2
+    assert sdd.summary()['ctrl_sum'] == 2003
+
+
+def test_record_is_compact():
+    record = DirectDebitPayment(**fixed_payment(0))
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(AttributeError):
+        record.foo = "bar"
+
+
+def test_record_validates():
+    payment = fixed_payment(0)
+    payment["amount"] = "10.00"
+    with pytest.raises(Exception):
+        DirectDebitPayment(**payment)
+    with pytest.raises(Exception):
+        CreditTransferPayment(name="Test", IBAN="NL50BANK1234567890", amount=100)
+    with pytest.raises(Exception):
+        CreditTransferPayment(name="Test", IBAN="NL50BANK1234567890", amount=100, description="Test",
+                              execution_date="2017-01-20")
+
+
+def test_transfer_record():
+    strf = SepaTransfer(transfer_config(execution_date=datetime.date(2017, 1, 20)))
+    document = [{"type": "CINV", "number": "1", "date": datetime.date(2017, 1, 2), "amount": "5.03", "description": "hi"}]
+    strf.add_payment(CreditTransferPayment(name="Test du Test", IBAN="NL50BANK1234567890", amount=500,
+                                           description="Test transaction"))
+    strf.add_payment(CreditTransferPayment(name="Test du Test", IBAN="NL50BANK1234567890", amount=503,
+                                           document=document, execution_date=datetime.date(2017, 1, 21)))
+    assert document[0]["date"] == datetime.date(2017, 1, 2)
+    assert list(strf.summary()['batches']) == ["2017-01-20", "2017-01-21"]
+
+    xmlout = strf.export()
+    assert b"<Ustrd>Test transaction</Ustrd>" in xmlout
+    assert b"<RltdDt>2017-01-02</RltdDt>" in xmlout
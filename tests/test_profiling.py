@@ -0,0 +1,94 @@
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from sepaxml import DirectDebitPayment, SepaDD
+from tests.utils import clean_ids, debit_config, debit_payment
+
+
+def sdd(backend="etree"):
+    return SepaDD(debit_config(), schema="pain.008.003.02", backend=backend)
+
+
+def payment(i):
+    return debit_payment(i, type="FRST", endtoend_id="E2E-%d" % i)
+
+
+def test_profile_report():
+    calls = []
+    sepa = sdd()
+    sepa.enable_profiling(lambda phase, seconds: calls.append(phase))
+    for i in range(3):
+        sepa.add_payment(payment(i))
+    sepa.add_payments([payment(3), payment(4)])
+    sepa.add_payment(DirectDebitPayment("Test", "NL50BANK1234567890", 100, "FRST", datetime.date.today(), "1234",
+                                        datetime.date.today(), "Test transaction", endtoend_id="E2E-5"))
+    sepa.export()
+
+    report = sepa.profile()
+    assert list(report) == ["add_payment", "clean", "check", "create_TX", "finalize", "export", "serialize", "validate"]
+    assert {phase: stats['calls'] for phase, stats in report.items()} == {
+        "add_payment": 5,
+        "clean": 6,
+        "check": 5,
+        "create_TX": 6,
+        "finalize": 1,
+        "export": 1,
+        "serialize": 1,
+        "validate": 1,
+    }
+    assert report["export"]["time"] >= report["validate"]["time"] > 0
+    assert len(calls) == 26 and calls[-1] == "export"
+
+
+def test_profiling_output_identical():
+    plain = sdd()
+    profiled = sdd()
+    profiled.enable_profiling()
+    for i in range(3):
+        plain.add_payment(payment(i))
+        profiled.add_payment(payment(i))
+    assert clean_ids(profiled.export()) == clean_ids(plain.export())
+
+
+def test_profiling_disabled():
+    sepa = sdd()
+    assert "add_payment" not in vars(sepa)
+    assert "tostring" not in vars(sepa.backend)
+    with pytest.raises(Exception):
+        sepa.profile()
+    sepa.enable_profiling()
+    with pytest.raises(Exception):
+        sepa.enable_profiling()
+
+
+@pytest.mark.parametrize("backend", ["etree", "lxml"])
+def test_profiling_async_process_pool(backend):
+    if backend == "lxml":
+        pytest.importorskip("lxml")
+    sepa = sdd(backend)
+    sepa.enable_profiling()
+    sepa.add_payment(payment(0))
+    with ProcessPoolExecutor(1) as executor:
+        xmlout, future = sepa.export(validate="async", executor=executor)
+        assert future.result() is None
+    assert sepa.profile()["validate"]["calls"] == 1
+
+
+def test_profile_ingestion_paths():
+    sepa = sdd()
+    sepa.enable_profiling()
+    sepa.add_payment(payment(0))
+    sepa.add_payments([payment(1), payment(2)])
+    payments = [payment(i) for i in range(3, 6)]
+    sepa.add_columns({key: [p[key] for p in payments] for key in payments[0]})
+    xmlout = sepa.export(validate="parallel", workers=1)
+    assert b"<NbOfTxs>6</NbOfTxs>" in xmlout
+
+    calls = {phase: stats['calls'] for phase, stats in sepa.profile().items()}
+    # One call each of add_payment, add_payments and add_columns.
+    assert calls["add_payment"] == 3
+    # Three payments are cleaned one by one, the columns at once.
+    assert calls["clean"] == 4
+    assert calls["validate"] == 1
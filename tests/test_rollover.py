@@ -0,0 +1,109 @@
+import datetime
+import os
+import re
+
+import pytest
+
+from sepaxml import DirectDebitPayment, RolloverWriter, SepaDD, SepaTransfer
+from sepaxml.shared import SizeLimitExceeded
+from sepaxml.validation import try_valid_xml
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+
+def numbered_payment(i):
+    return debit_payment(i, amount=100 + i, description="Test transaction %d" % i)
+
+
+def totals(path):
+    with open(path, "rb") as f:
+        xmlout = f.read()
+    try_valid_xml(xmlout, "pain.008.001.02")
+    GrpHdr = re.search(rb"<GrpHdr>.*</GrpHdr>", xmlout).group(0)
+    return (
+        re.search(rb"<MsgId>([^<]*)</MsgId>", GrpHdr).group(1),
+        int(re.search(rb"<NbOfTxs>(\d+)</NbOfTxs>", GrpHdr).group(1)),
+        re.search(rb"<CtrlSum>([^<]*)</CtrlSum>", GrpHdr).group(1),
+    )
+
+
+def test_rollover_by_count(tmp_path):
+    pattern = str(tmp_path / "debit-{index:02d}.xml")
+    with RolloverWriter(SepaDD, debit_config(), pattern, max_transactions=4) as writer:
+        assert writer.add_payments(numbered_payment(i) for i in range(10)) == 10
+
+    assert writer.files == [str(tmp_path / ("debit-%02d.xml" % i)) for i in (1, 2, 3)]
+    headers = [totals(path) for path in writer.files]
+    assert [nb_of_txs for _, nb_of_txs, _ in headers] == [4, 4, 2]
+    assert [ctrl_sum for _, _, ctrl_sum in headers] == [b"4.06", b"4.22", b"2.17"]
+    assert len(set(msg_id for msg_id, _, _ in headers)) == 3
+
+
+@pytest.mark.parametrize("serializer", ["etree", "template", "deferred"])
+@pytest.mark.parametrize("batch", [True, False])
+def test_rollover_by_size(tmp_path, serializer, batch):
+    config = debit_config(batch=batch)
+    pattern = str(tmp_path / "debit-{index}.xml")
+    writer = RolloverWriter(SepaDD, config, pattern, max_bytes=20000, validate=False, serializer=serializer)
+    writer.add_payments(numbered_payment(i) for i in range(60))
+    files = writer.close()
+
+    assert len(files) > 1
+    assert all(os.path.getsize(path) <= 20000 for path in files)
+    assert sum(totals(path)[1] for path in files) == 60
+
+
+def test_rollover_transfer_documents(tmp_path):
+    config = transfer_config()
+    writer = RolloverWriter(SepaTransfer, config, str(tmp_path / "transfer-{index}.xml"), max_transactions=3,
+                            max_bytes=10000, schema="pain.001.001.03")
+    for i in range(7):
+        document = [{"type": "CINV", "number": str(i), "date": datetime.date.today(), "amount": "1.00", "description": "hi"}]
+        writer.add_payment(transfer_payment(amount=100 + i, description=None, document=document))
+    assert len(writer.close()) == 3
+    assert isinstance(config["execution_date"], datetime.date)
+
+
+def test_rollover_payment_too_large(tmp_path):
+    writer = RolloverWriter(SepaDD, debit_config(), str(tmp_path / "debit-{index}.xml"), max_bytes=1500)
+    record = DirectDebitPayment("Test", "NL50BANK1234567890", 100, "FRST", datetime.date.today(), "1234",
+                                datetime.date.today(), "Test transaction")
+    with pytest.raises(SizeLimitExceeded):
+        writer.add_payment(record)
+    assert writer.close() == []
+
+
+@pytest.mark.parametrize("serializer", ["etree", "template", "deferred"])
+@pytest.mark.parametrize("batch", [True, False])
+def test_rollover_fills_files(tmp_path, serializer, batch):
+    # Many small batches, every one with its own PmtInf block.
+    config = debit_config(batch=batch)
+    pattern = str(tmp_path / "debit-{index}.xml")
+    writer = RolloverWriter(SepaDD, config, pattern, max_bytes=6000, validate=False, serializer=serializer)
+    for i in range(60):
+        payment = numbered_payment(i)
+        payment["collection_date"] = datetime.date.today() + datetime.timedelta(days=i % 7)
+        writer.add_payment(payment)
+    files = writer.close()
+
+    sizes = [os.path.getsize(path) for path in files]
+    assert all(size <= 6000 for size in sizes)
+    # Every file but the last one is too full for another payment.
+    assert min(sizes[:-1]) > 6000 - 1200
+    assert sum(totals(path)[1] for path in files) == 60
+
+
+@pytest.mark.parametrize("schema,batch", [
+    ("pain.001.001.03", True),
+    ("pain.001.001.03", False),
+    ("CBIPaymentRequest.00.04.00", True),
+])
+def test_rollover_transfer_size(tmp_path, schema, batch):
+    config = transfer_config(batch=batch)
+    writer = RolloverWriter(SepaTransfer, config, str(tmp_path / "transfer-{index}.xml"), max_bytes=5000,
+                            schema=schema)
+    for i in range(40):
+        writer.add_payment(transfer_payment(amount=100 + i, description="Test transaction %d" % i))
+    files = writer.close()
+    assert len(files) > 1
+    assert all(os.path.getsize(path) <= 5000 for path in files)
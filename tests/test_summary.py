@@ -0,0 +1,49 @@
+import datetime
+import re
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from tests.utils import (debit_config, debit_payment, transfer_config,
+                         transfer_payment)
+
+
+@pytest.fixture
+def sdd():
+    return SepaDD(debit_config(), schema="pain.008.003.02")
+
+
+def payment(amount, seq):
+    return debit_payment(amount=amount, type=seq, collection_date=datetime.date(2017, 1, 20), mandate_date=datetime.date(2017, 1, 20))
+
+
+def test_summary(sdd):
+    assert sdd.summary() == {'nb_of_txs': 0, 'ctrl_sum': 0, 'batches': {}}
+
+    sdd.add_payment(payment(1012, "FRST"))
+    sdd.add_payment(payment(5000, "RCUR"))
+    sdd.add_payment(payment(7, "RCUR"))
+    summary = sdd.summary()
+    assert summary['nb_of_txs'] == 3
+    assert summary['ctrl_sum'] == 6019
+    assert list(summary['batches'].items()) == [
+        ("FRST::2017-01-20", {'nb_of_txs': 1, 'ctrl_sum': 1012}),
+        ("RCUR::2017-01-20", {'nb_of_txs': 2, 'ctrl_sum': 5007}),
+    ]
+
+    xmlout = sdd.export()
+    assert b"<NbOfTxs>3</NbOfTxs><CtrlSum>60.19</CtrlSum>" in xmlout
+
+
+def test_cbi_instruction_ids():
+    strf = SepaTransfer(transfer_config(), schema="CBIPaymentRequest.00.04.00")
+    for i in range(5):
+        strf.add_payment(transfer_payment(amount=100 + i, description="Test transaction %d" % i,
+                                          execution_date=datetime.date.today() + datetime.timedelta(days=i % 2)))
+    assert strf.summary()['ctrl_sum'] == 510
+
+    # CBI only allows a single PmtInf block, so the output is not valid
+    xmlout = strf.export(validate=False)
+    assert re.findall(rb"<InstrId>(\d+)</InstrId>", xmlout) == [b"1", b"2", b"3", b"4", b"5"]
+    assert re.findall(rb"<Ustrd>[^<]*(\d)</Ustrd>", xmlout) == [b"0", b"2", b"4", b"1", b"3"]
+    assert b"<NbOfTxs>5</NbOfTxs><CtrlSum>5.10</CtrlSum>" in xmlout
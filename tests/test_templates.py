@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+
+from sepaxml import SepaDD, SepaTransfer
+from tests.utils import (clean_ids, debit_config, debit_payment,
+                         transfer_config, transfer_payment)
+
+
+def debit(schema, batch, serializer):
+    sdd = SepaDD(debit_config(batch=batch), schema=schema, clean=False, serializer=serializer)
+    for i, seq in enumerate(["FRST", "RCUR", "FRST", "RCUR"]):
+        sdd.add_payment(debit_payment(i, name="Müller & <Söhne> 100%", BIC="BANKNL2A" if i % 2 else None, type=seq,
+                                      description="Test transaction %s", endtoend_id="E2E-%d" % i))
+    return sdd
+
+
+def transfer(schema, batch, serializer):
+    strf = SepaTransfer(transfer_config(batch=batch), schema=schema, serializer=serializer)
+    for i in range(4):
+        payment = transfer_payment(i, name="Müller & <Söhne>", BIC="BANKNL2A" if i % 2 else None, endtoend_id="E2E-%d" % i)
+        if i == 3 and batch:
+            del payment["description"]
+            payment["document"] = [
+                {"type": "CINV", "number": "1", "date": datetime.date.today(), "amount": "5.03", "description": "hi"}
+            ]
+        strf.add_payment(payment)
+    return strf
+
+
+@pytest.mark.parametrize("builder,args", [
+    (debit, ("pain.008.001.02", True)),
+    (debit, ("pain.008.002.02", True)),
+    (debit, ("pain.008.003.02", True)),
+    (debit, ("pain.008.003.02", False)),
+    (transfer, ("pain.001.001.03", True)),
+    (transfer, ("pain.001.001.03", False)),
+    (transfer, ("CBIPaymentRequest.00.04.00", True)),
+    (transfer, ("CBIPaymentRequest.00.04.00", False)),
+])
+def test_template_output_identical(builder, args):
+    etree_out = builder(*args, serializer="etree").export(validate=False)
+    template = builder(*args, serializer="template")
+    assert template._TX_templates
+    assert clean_ids(template.export(validate=False)) == clean_ids(etree_out)
+
+
+def test_template_stores_bytes():
+    sdd = debit("pain.008.003.02", True, "template")
+    for batch_nodes in sdd._batches.values():
+        assert all(isinstance(node, bytes) for node in batch_nodes)
+
+
+def test_template_falls_back_for_missing_values():
+    sdd = debit("pain.008.003.02", True, "template")
+    payment = debit_payment(name="Test", BIC=None, amount=100, type="FRST")
+    payment["description"] = None
+    sdd.add_payment(payment)
+    assert b"<Ustrd />" in sdd.export(validate=False)
+
+
+def test_unknown_serializer():
+    with pytest.raises(Exception):
+        debit("pain.008.003.02", True, "pickle")
+
+
+def test_template_empty_fields():
+    # Empty elements are written in the short form by ElementTree.
+    def build(serializer):
+        sdd = SepaDD(debit_config(), schema="pain.008.003.02", clean=False, serializer=serializer)
+        sdd.add_payment(debit_payment(amount=1000, type="FRST", mandate_id="", description="", endtoend_id="E2E-1"))
+        return sdd.export(validate=False)
+    etree_out = build("etree")
+    assert b"<Ustrd />" in etree_out and b"<MndtId />" in etree_out
+    assert clean_ids(build("template")) == clean_ids(etree_out)
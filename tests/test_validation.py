@@ -0,0 +1,115 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from sepaxml import SepaDD
+from sepaxml.validation import (LxmlValidator, ValidationError,
+                                lxml_schema_cache, schema_cache, set_validator,
+                                try_valid_file, try_valid_xml)
+from tests.utils import debit_config, debit_payment
+
+
+def make_sdd(description="Test transaction1", **kwargs):
+    sdd = SepaDD(debit_config(), schema="pain.008.003.02", **kwargs)
+    sdd.add_payment(debit_payment(amount=1012, type="FRST", description=description))
+    return sdd
+
+
+def test_schema_compiled_once():
+    schema_cache.clear()
+    xmlout = make_sdd().export(validate=False)
+
+    misses = schema_cache.misses
+    hits = schema_cache.hits
+    try_valid_xml(xmlout, "pain.008.003.02")
+    try_valid_xml(xmlout, "pain.008.003.02")
+    assert schema_cache.misses == misses + 1
+    assert schema_cache.hits == hits + 1
+    assert schema_cache.stats()['schemas'] == ["pain.008.003.02"]
+
+
+def test_clear_evicts():
+    xmlout = make_sdd().export(validate=False)
+    try_valid_xml(xmlout, "pain.008.003.02")
+
+    schema_cache.clear("pain.008.003.02")
+    assert "pain.008.003.02" not in schema_cache.stats()['schemas']
+
+    misses = schema_cache.misses
+    try_valid_xml(xmlout, "pain.008.003.02")
+    assert schema_cache.misses == misses + 1
+
+
+def test_cached_schema_still_rejects():
+    xmlout = make_sdd().export(validate=False)
+    try_valid_xml(xmlout, "pain.008.003.02")
+    with pytest.raises(ValidationError):
+        try_valid_xml(xmlout.replace(b"<SeqTp>FRST</SeqTp>", b"<SeqTp>XXXX</SeqTp>"), "pain.008.003.02")
+
+
+@pytest.mark.parametrize("backend", ["etree", "lxml"])
+def test_async_validation(backend):
+    xmlout, future = make_sdd(backend=backend).export(validate="async")
+    assert xmlout.startswith(b"<?xml")
+    assert future.result(timeout=30) is None
+
+    xmlout, future = make_sdd("x" * 141, clean=False, backend=backend).export(validate="async")
+    assert b"x" * 141 in xmlout
+    assert isinstance(future.exception(timeout=30), ValidationError)
+
+
+def test_async_validation_process():
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork")) as executor:
+        xmlout, future = make_sdd().export(validate="async", executor=executor)
+        assert future.result(timeout=30) is None
+
+        xmlout, future = make_sdd("x" * 141, clean=False, backend="lxml").export(validate="async", executor=executor)
+        assert isinstance(future.exception(timeout=30), ValidationError)
+
+
+@pytest.fixture
+def lxml_validator():
+    previous = set_validator("lxml")
+    yield
+    set_validator(previous)
+
+
+def test_lxml_validator(lxml_validator, tmp_path):
+    from lxml import etree
+
+    xmlout = make_sdd().export()
+    misses = lxml_schema_cache.misses
+    try_valid_xml(xmlout, "pain.008.003.02")
+    try_valid_xml(xmlout, "pain.008.003.02")
+    assert lxml_schema_cache.misses <= misses + 1
+
+    with pytest.raises(ValidationError) as info:
+        try_valid_xml(xmlout.replace(b"<SeqTp>FRST</SeqTp>", b"<SeqTp>XXXX</SeqTp>"), "pain.008.003.02")
+    assert isinstance(info.value.__cause__, etree.DocumentInvalid)
+    with pytest.raises(ValidationError) as info:
+        try_valid_xml(xmlout[:-20], "pain.008.003.02")
+    assert isinstance(info.value.__cause__, etree.XMLSyntaxError)
+
+    path = tmp_path / "out.xml"
+    path.write_bytes(xmlout)
+    try_valid_file(str(path), "pain.008.003.02")
+    path.write_bytes(xmlout.replace(b"<SeqTp>FRST</SeqTp>", b"<SeqTp>XXXX</SeqTp>"))
+    with pytest.raises(ValidationError):
+        try_valid_file(str(path), "pain.008.003.02")
+
+
+def test_lxml_validator_export(lxml_validator):
+    # The etree backend validates its output with the current validator.
+    with pytest.raises(ValidationError):
+        make_sdd("x" * 141, clean=False).export()
+
+
+def test_set_validator():
+    previous = set_validator(LxmlValidator())
+    try:
+        assert set_validator(previous).name == "lxml"
+    finally:
+        set_validator(previous)
+    with pytest.raises(Exception, match="Unknown validator: other"):
+        set_validator("other")
@@ -1,3 +1,4 @@
+import datetime
 import os
 import re
 
@@ -22,3 +23,57 @@ def clean_ids(xmlout):
     pat3 = re.compile(b'\\d\\d\\d\\d-\\d\\d-\\d\\dT\\d\\d:\\d\\d:\\d\\d')
     pat4 = re.compile(b'\\d\\d\\d\\d-\\d\\d-\\d\\d')
     return pat4.sub(b'0000-00-00', pat3.sub(b'0000-00-00T00:00:00', pat2.sub(b'<MsgId></MsgId>', pat1.sub(b'-000000000000', xmlout))))
+
+
+# Builder configs and payments shared by the tests. Keyword arguments
+# override single fields, a value of None drops the field.
+def _fields(fields, overrides):
+    fields.update(overrides)
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+def debit_config(**kwargs):
+    return _fields({
+        "name": "TestCreditor",
+        "IBAN": "NL50BANK1234567890",
+        "BIC": "BANKNL2A",
+        "batch": True,
+        "creditor_id": "DE26ZZZ00000000000",
+        "currency": "EUR"
+    }, kwargs)
+
+
+def transfer_config(**kwargs):
+    return _fields({
+        "name": "TestCreditor",
+        "IBAN": "NL50BANK1234567890",
+        "BIC": "BANKNL2A",
+        "batch": True,
+        "currency": "EUR",
+        "execution_date": datetime.date.today(),
+        "bank_code": "12345",
+        "issuer_id": "ABC1234"
+    }, kwargs)
+
+
+def debit_payment(i=0, **kwargs):
+    return _fields({
+        "name": "Test von Testenstein",
+        "IBAN": "NL50BANK1234567890",
+        "BIC": "BANKNL2A",
+        "amount": 1000 + i,
+        "type": "FRST" if i % 2 else "RCUR",
+        "collection_date": datetime.date.today(),
+        "mandate_id": "1234",
+        "mandate_date": datetime.date.today(),
+        "description": "Test transaction"
+    }, kwargs)
+
+
+def transfer_payment(i=0, **kwargs):
+    return _fields({
+        "name": "Test du Test",
+        "IBAN": "NL50BANK1234567890",
+        "amount": 500 + i,
+        "description": "Test transaction"
+    }, kwargs)